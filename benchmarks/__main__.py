@@ -0,0 +1,274 @@
+"""
+Usage:
+    benchmarks run [-d] [--projects N] [--depth D] [--fanout F] [--lines L]
+                   [--markers MIX] [--symlinks S] [--omitted O] [--nododo K]
+                   [--seed SEED] [--repeat R] [--jobs N] [--tree-dir DIR]
+                   [--output FILE]
+    benchmarks compare [-d] [--threshold PCT] BASE NEW
+    benchmarks tree [-d] [--projects N] [--depth D] [--fanout F] [--lines L]
+                    [--markers MIX] [--symlinks S] [--omitted O] [--nododo K]
+                    [--seed SEED] DIR
+
+Options:
+    -d               run the debugger
+    --projects N     number of projects in the tree [default: 1000]
+    --depth D        levels of group directories above the projects
+                     [default: 2]
+    --fanout F       subdirectories of each group directory [default: 10]
+    --lines L        lines in each DODO file [default: 60]
+    --markers MIX    weights of the task markers in the DODO files
+                     [default: -:6,.:3,>:3,^:2,+:3,<:1,x:1]
+    --symlinks S     symlinks to projects in the tree [default: 20]
+    --omitted O      projects holding a directory gh does not search (venv,
+                     .git, ...) [default: 50]
+    --nododo K       projects without a DODO file [default: 0]
+    --seed SEED      seed for the random choices [default: 0]
+    --repeat R       times each benchmark is run [default: 5]
+    --jobs N         threads gh uses to read the tree [default: 1]
+    --tree-dir DIR   run against the tree built in DIR by 'benchmarks tree'
+    --output FILE    write the results to FILE as JSON
+    --threshold PCT  percent slowdown counted as a regression [default: 10]
+
+Run these from the top of the repository with 'python -m benchmarks'.
+
+benchmarks run
+    Build a tree (in a temporary directory, unless --tree-dir names one
+    built earlier) and time projects() (walking the tree, and with the project
+    index), sort_projects() in each sort mode, get_tasks() over every
+    project, and gh_projects_t(), gh_tasks_t() (with and without the task
+    cache, and with --marker '>' and no cache) and gh_query_t() (listing
+    projects by age, and counting the tasks in progress) end to end. Each
+    benchmark is run once to warm up, then R times. The best and median
+    times are reported, and written with the tree's description to FILE
+    with --output.
+
+benchmarks compare
+    Compare two results files written by 'benchmarks run', benchmark by
+    benchmark, on their best times. A benchmark more than PCT percent slower
+    in NEW than in BASE is a regression, and makes the exit status 1.
+
+benchmarks tree
+    Build a tree in DIR (which must not exist) and describe it in
+    DIR/tree.json, for 'benchmarks run --tree-dir DIR' to use repeatedly.
+
+This is free and unencumbered software released into the public domain.
+For more details, please visit <http://unlicense.org/>.
+"""
+from benchmarks import treegen
+import os
+import os.path as osp
+import sys
+import time
+
+# Keys of the option dict that are passed on to treegen.make_tree()
+TREE_OPTS = ['projects', 'depth', 'fanout', 'lines', 'symlinks', 'omitted',
+             'nododo', 'seed']
+
+
+# -----------------------------------------------------------------------------
+def main():
+    """
+    Main entry point
+    """
+    from docopt_dispatch import dispatch
+    dispatch.on('run')(bench_run_d)
+    dispatch.on('compare')(bench_compare_d)
+    dispatch.on('tree')(bench_tree_d)
+    dispatch(__doc__)
+
+
+# -----------------------------------------------------------------------------
+def bench_run_d(**kw):
+    """
+    entrypoint for 'benchmarks run'
+    """
+    import json
+    import tempfile
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    with tempfile.TemporaryDirectory() as tmp:
+        if kw['tree_dir']:
+            root = kw['tree_dir']
+            with open(osp.join(root, "tree.json")) as rbl:
+                tree = json.load(rbl)
+        else:
+            root = osp.join(tmp, "tree")
+            tree = treegen.make_tree(root, **tree_opts(kw))
+        report = run_benchmarks(root, tree, int(kw['repeat']),
+                                int(kw['jobs']), osp.join(tmp, "cache"))
+    print("".join(report_g(report)), end="")
+    if kw['output']:
+        with open(kw['output'], 'w') as wbl:
+            json.dump(report, wbl, indent=2)
+            wbl.write("\n")
+
+
+# -----------------------------------------------------------------------------
+def bench_compare_d(**kw):
+    """
+    entrypoint for 'benchmarks compare'
+    """
+    import json
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    with open(kw['BASE']) as rbl:
+        base = json.load(rbl)
+    with open(kw['NEW']) as rbl:
+        new = json.load(rbl)
+    if base['tree'] != new['tree']:
+        print("warning: the runs used different trees")
+    rows = compare(base, new, float(kw['threshold']))
+    for (name, before, after, ratio, regressed) in rows:
+        print("{:28s} {:>10.6f}s {:>10.6f}s {:>7.2f}x{}".format(
+            name, before, after, ratio, "  REGRESSION" if regressed else ""))
+    if any(_[-1] for _ in rows):
+        sys.exit(1)
+
+
+# -----------------------------------------------------------------------------
+def bench_tree_d(**kw):
+    """
+    entrypoint for 'benchmarks tree'
+    """
+    import json
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    tree = treegen.make_tree(kw['DIR'], **tree_opts(kw))
+    with open(osp.join(kw['DIR'], "tree.json"), 'w') as wbl:
+        json.dump(tree, wbl, indent=2)
+        wbl.write("\n")
+    print("{projects} projects, {dirs} directories, {dodo_bytes} bytes of"
+          " DODO text in {root}".format(root=kw['DIR'], **tree))
+
+
+# -----------------------------------------------------------------------------
+def tree_opts(kw):
+    """
+    Return the treegen.make_tree() arguments from the option dict *kw*
+    """
+    rval = {_: int(kw[_]) for _ in TREE_OPTS}
+    rval['markers'] = kw['markers']
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def run_benchmarks(root, tree, repeat, jobs, cache):
+    """
+    Time each benchmark against the tree at *root* (described by *tree*)
+    *repeat* times, with gh's cache in directory *cache*, and return a
+    report: a dict of the tree, the versions involved and, for each
+    benchmark, the time of each run with the best and the median.
+    """
+    import gh.__main__ as ghm
+    import gh.version
+    import platform
+    import statistics
+    saved = {_: os.environ.get(_) for _ in ['GH_ROOT', 'GH_CACHE']}
+    os.environ.update(GH_ROOT=root, GH_CACHE=cache)
+    try:
+        results = {}
+        for (name, func) in benchmarks(ghm, root, jobs):
+            func()
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                runs.append(time.perf_counter() - start)
+            results[name] = {'min': min(runs),
+                             'median': statistics.median(runs),
+                             'runs': runs}
+    finally:
+        for (name, value) in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return {'gh': gh.version._v,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'repeat': repeat,
+            'jobs': jobs,
+            'tree': tree,
+            'results': results}
+
+
+# -----------------------------------------------------------------------------
+def benchmarks(ghm, root, jobs):
+    """
+    Return a list of (name, function) pairs, one for each benchmark to run
+    with gh.__main__ module *ghm* on the tree at *root*
+    """
+    projs = ghm.discover(root, jobs=jobs)
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'new',
+          'projects': False, 'tasks': True, 'version': False,
+          'rescan': False, 'jobs': str(jobs), 'no_cache': False}
+    nocache = dict(kw, no_cache=True)
+    listing = dict(kw, projects=True, tasks=False)
+    query = dict(kw, query=True, tasks=False)
+    marker = dict(query, count=True, marker='>')
+    rval = [
+        ('projects (walk)', lambda: ghm.projects(root, jobs=jobs)),
+        ('projects (index)',
+         lambda: ghm.projects(root, index=True, jobs=jobs)),
+    ]
+    for sort in ['alpha', 'new', 'old']:
+        rval.append(('sort ' + sort,
+                     lambda sort=sort: ghm.sort_projects(projs, sort)))
+    rval.extend([
+        ('get_tasks', lambda: [ghm.get_tasks(_.path) for _ in projs]),
+        ('gh_projects_t', lambda: ghm.gh_projects_t(**listing)),
+        ('gh_tasks_t', lambda: ghm.gh_tasks_t(**kw)),
+        ('gh_tasks_t (no cache)', lambda: ghm.gh_tasks_t(**nocache)),
+        ('gh_tasks_t (no cache, >)',
+         lambda: ghm.gh_tasks_t(**dict(nocache, marker='>'))),
+        ('gh_query_t -s new', lambda: ghm.gh_query_t(**query)),
+        ('gh_query_t --marker', lambda: ghm.gh_query_t(**marker)),
+    ])
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def report_g(report):
+    """
+    Generate the lines of a table of the results in *report*
+    """
+    tree = report['tree']
+    yield ("{projects} projects, depth {depth}, fanout {fanout}, {lines}"
+           " lines per DODO, {repeat} runs\n".format(repeat=report['repeat'],
+                                                     **tree))
+    yield "{:28s} {:>11s} {:>11s}\n".format("benchmark", "best", "median")
+    for (name, result) in report['results'].items():
+        yield "{:28s} {:>10.6f}s {:>10.6f}s\n".format(name, result['min'],
+                                                      result['median'])
+
+
+# -----------------------------------------------------------------------------
+def compare(base, new, threshold):
+    """
+    Compare the best times of the benchmarks found in both reports *base* and
+    *new*. Return a list of (name, base time, new time, ratio, regressed)
+    tuples, where regressed is True when the new time is more than
+    *threshold* percent above the base time.
+    """
+    rval = []
+    for (name, result) in base['results'].items():
+        if name not in new['results']:
+            continue
+        before = result['min']
+        after = new['results'][name]['min']
+        if before:
+            ratio = after / before
+        else:
+            ratio = float('inf') if after else 1.0
+        rval.append((name, before, after, ratio,
+                     1 + threshold / 100 < ratio))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    main()                                                   # pragma: no cover
@@ -0,0 +1,146 @@
+"""
+Build synthetic project trees for the benchmarks
+
+This is free and unencumbered software released into the public domain.
+For more details, please visit <http://unlicense.org/>.
+"""
+import os
+import os.path as osp
+import random
+import time
+
+# The default marker mix: the relative weights of the task markers that open
+# each task written to a DODO file. '-', '.', '>' and '^' tasks are open; '+',
+# '<' and 'x' tasks are closed and get thrown away by the parser.
+MARKERS = "-:6,.:3,>:3,^:2,+:3,<:1,x:1"
+
+# Lines that follow a task: continuation lines, and lines the parser throws
+# away (blanks, comments, separators, DONE headings)
+CONTINUATION = "   continuation of the task above, running on for a bit\n"
+FILLER = ["\n", "\n", "# a comment\n", "-------- separator\n",
+          "-- DONE ------\n", "=== DONE ===\n"]
+
+# Names of directories that gh does not search (see gh's OMITS), planted in
+# projects with decoy projects inside them
+OMITTED = ['venv', '.git', '__pycache__', 'attic', 'mod.egg-info', '.cache']
+
+
+# -----------------------------------------------------------------------------
+def make_tree(root, projects=100, depth=2, fanout=10, lines=50,
+              markers=MARKERS, symlinks=0, omitted=0, nododo=0, seed=0):
+    """
+    Build a tree of *projects* project directories under *root* and return a
+    dict describing it (the parameters, plus the number of directories and
+    the bytes of DODO text written).
+
+    The projects are spread round robin over the fanout**depth leaves of a
+    tree of group directories *depth* levels deep, *fanout* wide at each
+    level. Each project has a '.project' marker file and a DODO file of
+    *lines* lines, its tasks opened with markers drawn from the mix
+    *markers* ("marker:weight,..."), except the first *nododo* projects,
+    which have none.
+
+    *symlinks* symlinks to projects picked at random are put in a 'links'
+    directory at the top of the tree, along with one leading back to *root*.
+    The first *omitted* projects each get a directory gh does not search
+    (venv, .git, ...) holding a decoy project.
+
+    The mtimes of the DODO files are spread over the last year, and are all
+    at least a minute old, so gh trusts and caches them.
+    """
+    rng = random.Random(seed)
+    root = os.fspath(root)
+    weights = parse_markers(markers)
+    now = time.time()
+    dirs = 1
+    size = 0
+    groups = set()
+    paths = []
+    for idx in range(projects):
+        names = leaf(idx, depth, fanout)
+        groups.update(tuple(names[:_]) for _ in range(1, depth + 1))
+        path = osp.join(root, *names, "proj{:06d}".format(idx))
+        os.makedirs(path)
+        paths.append(path)
+        touch(osp.join(path, ".project"))
+        if nododo <= idx:
+            dodo = osp.join(path, "DODO")
+            size += write_dodo(dodo, lines, weights, rng)
+            mtime = now - 60 - rng.random() * 365 * 86400
+            os.utime(dodo, (mtime, mtime))
+        if idx < omitted:
+            decoy = osp.join(path, OMITTED[idx % len(OMITTED)], "decoy")
+            os.makedirs(decoy)
+            touch(osp.join(decoy, ".project"))
+            dirs += 2
+    dirs += len(groups) + projects
+    if symlinks:
+        links = osp.join(root, "links")
+        os.makedirs(links)
+        dirs += 1
+        os.symlink(root, osp.join(links, "top"))
+        for idx in range(symlinks):
+            link = osp.join(links, "link{}".format(idx))
+            os.symlink(rng.choice(paths), link)
+    return {'projects': projects, 'depth': depth, 'fanout': fanout,
+            'lines': lines, 'markers': markers, 'symlinks': symlinks,
+            'omitted': omitted, 'nododo': nododo, 'seed': seed,
+            'dirs': dirs, 'dodo_bytes': size}
+
+
+# -----------------------------------------------------------------------------
+def leaf(idx, depth, fanout):
+    """
+    Return the names of the group directories leading to the leaf that
+    project *idx* goes in
+    """
+    names = []
+    for level in range(depth):
+        names.append("g{}_{}".format(level, idx % fanout))
+        idx //= fanout
+    return names
+
+
+# -----------------------------------------------------------------------------
+def parse_markers(markers):
+    """
+    Turn a marker mix like "-:6,+:1" into a dict of weights by marker
+    """
+    rval = {}
+    for item in markers.split(","):
+        (mark, _, weight) = item.strip().rpartition(":")
+        if len(mark) != 1 or mark not in "-.>^+<x":
+            raise ValueError("bad marker mix item: {!r}".format(item))
+        rval[mark] = int(weight)
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def write_dodo(dodo, nlines, weights, rng):
+    """
+    Write a DODO file of *nlines* lines: tasks opened by markers drawn with
+    *weights*, each followed by up to three continuation lines and the odd
+    line to throw away. Return the number of bytes written.
+    """
+    marks = list(weights)
+    counts = list(weights.values())
+    out = []
+    while len(out) < nlines:
+        mark = rng.choices(marks, counts)[0]
+        out.append(" {} task {} for the benchmark\n".format(mark, len(out)))
+        out.extend([CONTINUATION] * rng.randint(0, 3))
+        if rng.random() < 0.25:
+            out.append(rng.choice(FILLER))
+    data = "".join(out[:nlines])
+    with open(dodo, 'w') as wbl:
+        wbl.write(data)
+    return len(data.encode())
+
+
+# -----------------------------------------------------------------------------
+def touch(path):
+    """
+    Create an empty file at *path*
+    """
+    with open(path, 'w'):
+        pass
@@ -1,14 +1,166 @@
 """
 Usage:
-    gh projects [-d] [-s SORT] [--count]
-    gh tasks [-d] [-s SORT] [--count] [PROJECT]
+    gh projects [-d] [-s SORT] [--count] [--rescan] [--jobs N] [--aliases]
+                [--format FMT] [--limit N] [--timings] [--profile FILE]
+                [--root DIR]...
+    gh tasks [-d] [-s SORT] [--count] [--marker MARKS] [--rescan] [--jobs N]
+             [--procs] [--no-cache] [--exact] [--format FMT] [--limit N]
+             [--timings] [--profile FILE] [--root DIR]... [PROJECT]
+    gh tasks --watch [-d] [-s SORT] [--count] [--jobs N] [--poll]
+             [--interval SECS]
+    gh grep [-d] [--rescan] [--jobs N] [--format FMT] [--root DIR]... TERM...
+    gh status [-d] [--rescan] [--jobs N] [--git-jobs N] [--format FMT]
+              [--root DIR]...
+    gh snapshot [-d] [--jobs N] [--root DIR]...
+    gh history [-d] [--exact] [--format FMT] [PROJECT]
+    gh query [-d] [-s SORT] [--marker MARKS] [--no-dodo] [--count] [--rescan]
+             [--jobs N] [--exact] [--format FMT] [--limit N] [--timings]
+             [--root DIR]... [PROJECT]
+    gh serve [-d] [--jobs N] [--poll] [--interval SECS]
     gh version [-d]
 
 Options:
     -s SORT       determine project order ('alpha', 'old', or 'new')
+    --rescan      ignore the project index and walk all of $GH_ROOT again
+    --jobs N      number of threads reading directories and DODO files
+                  [default: 1]
+    --procs       read DODO files in a pool of processes rather than threads
+    --aliases     also list paths that lead to directories already listed
+    --no-cache    read every DODO file rather than using the task cache
+    --exact       PROJECT must be a project's name or path, not just part of
+                  its path
+    --watch       keep the output up to date as DODO files and project
+                  directories change
+    --poll        watch by walking $GH_ROOT every SECS seconds rather than
+                  through inotify
+    --interval SECS  seconds between walks when polling [default: 2]
+    --format FMT  'text', or 'json' or 'ndjson' for records a program can
+                  read [default: text]
+    --limit N     only report the first N projects (in SORT order)
+    --timings     report time spent and work done in each phase on stderr
+    --profile FILE  write cProfile statistics for the run to FILE
+    --root DIR    look for projects under DIR rather than $GH_ROOT (repeatable)
+    --git-jobs N  number of git commands gh status runs at once [default: 8]
+    --marker MARKS  only tasks opened by one of the markers in MARKS ('>^',
+                  say, for tasks in progress or blocked)
+    --no-dodo     only projects with no DODO file
 
 gh tasks
-    Show tasks for projects located in $GH_ROOT
+    Show tasks for projects located in $GH_ROOT. The tasks parsed from each
+    DODO file are cached, and the file is only read again when its mtime or
+    size changes (or with --no-cache).
+
+    With PROJECT, only projects whose path contains PROJECT (or whose name is
+    PROJECT, with --exact) are shown. The search uses the project index to
+    skip reading the directories that have not changed and, given the full
+    path of a project with --exact, only descends into the directories leading
+    to it.
+
+    With --marker MARKS, only the tasks opened by one of the markers in MARKS
+    are shown (or counted): 'gh tasks --marker ">^"' shows the tasks in
+    progress or blocked. A DODO file that has to be read is parsed with the
+    filter, so the lines of the other tasks are skipped rather than
+    collected (and the partial list is not cached); unchanged files are
+    filtered from the cache.
+
+    With --limit N, only the first N projects in SORT order are reported, and
+    only their DODO files are read. (So 'gh tasks -s new --limit 5' shows
+    the tasks of the five most recently updated projects.)
+
+    With --format json or ndjson, each task is a record holding the path of
+    its project, the path and mtime of the DODO file, the task's marker
+    ('-', '.', '>' or '^') and its text (without the marker). With --count,
+    each project is a record holding its number of tasks instead. json is
+    one array of records and ndjson is one record per line; both are
+    written as the DODO files are read.
+
+    With --watch, gh tasks walks $GH_ROOT and reads the DODO files once, then
+    waits for changes and shows the output again whenever it changes. Only
+    the DODO files and project directories that changed are read again. On
+    Linux, changes are reported by inotify; elsewhere (or with --poll), the
+    tree is walked every SECS seconds, reading only directories whose mtime
+    changed.
+
+gh grep
+    Show the tasks that contain every TERM (ignoring case). A TERM matches
+    whole words, except that one ending in '*' matches any word that starts
+    with the rest ('gh grep cache inval*'). The search uses an index of the
+    words in the tasks, kept in the cache directory; the DODO files that
+    changed since the last search are read again and their tasks reindexed
+    first. --rescan rebuilds the index (and walks the whole tree). --format
+    works as for gh tasks.
+
+gh status
+    Show the state of the git repository of each project: its branch, the
+    number of changed and untracked files, how far it is ahead of and
+    behind its upstream branch (as of the last fetch; nothing is fetched)
+    and the number of stashes. 'git status' runs in up to N repositories at
+    once (--git-jobs), and each row is written as soon as it is known.
+
+    A repository found clean last time is not asked again if its HEAD,
+    branch, upstream, index, stash, config and info/exclude are unchanged,
+    the files in its index have not changed and no directory in its work
+    tree has changed since: those are checked by reading .git and stat'ing
+    the files and directories, without running git.
+
+gh snapshot
+    Record the number of open tasks in each project, with the time, in the
+    history database ($GH_DATA/history.sqlite3; $GH_DATA defaults to
+    $XDG_DATA_HOME/gh or ~/.local/share/gh). The tasks are read through
+    the task cache, so only the DODO files that changed since they were
+    last read are read, and only the counts that changed are stored. That
+    makes it cheap to run from cron every few minutes.
+
+gh history
+    Show how the number of open tasks has changed from snapshot to
+    snapshot: the total, or with PROJECT, the count of each project whose
+    path contains PROJECT (or, with --exact, whose name or path is PROJECT).
+    Only the snapshots where a number changed are shown.
+
+gh query
+    Answer questions about the projects and tasks from a catalog of them in
+    the cache directory (an SQLite database, catalog.sqlite3), brought up to
+    date first: the tree is walked with the project index, and only the
+    DODO files that changed since the last query are read again.
+
+    Without --marker, the projects are listed (as by gh projects): those
+    whose path contains PROJECT (or whose name is PROJECT, with --exact),
+    or with --no-dodo, only those with no DODO file. With --marker, the
+    tasks opened by one of the markers in MARKS in those projects are shown
+    instead (as by gh tasks), or with --count, how many there are. So
+    'gh query --no-dodo -s old' lists the projects without a DODO file and
+    'gh query --marker ">" gh' shows the tasks in progress in projects
+    whose path contains gh. -s, --limit and --format work as for gh tasks,
+    except that without -s the projects come in path order. The filters
+    and sorts are done by the database, with indexes on the DODO mtime, the
+    project name and the task marker.
+
+gh serve
+    Walk $GH_ROOT and read the DODO files once, then keep the projects and
+    their tasks up to date in memory (as gh tasks --watch does) and answer
+    queries about them on a Unix socket in the cache directory. While it
+    runs, gh projects and gh tasks ask it rather than reading the tree
+    themselves (unless --rescan, --no-cache or --aliases is given). The DODO
+    files are stat'ed again on every query, so answers are never staler than
+    the last change to a directory.
+
+Roots
+    $GH_ROOT may hold several directories, separated by colons, or they can
+    be given with repeated --root options. gh projects and gh tasks walk
+    the roots at the same time, one thread each, and sort the projects found
+    under all of them together. Without -s, each root's projects are
+    reported as soon as its walk is done, so a slow mount does not hold up
+    the others. gh tasks --watch and gh serve use the first root.
+
+Timings and profiles
+    With --timings, gh projects, gh tasks and gh query report on stderr how
+    long each phase took (walking $GH_ROOT, stat'ing and finding DODO files,
+    loading caches, sorting, parsing) and how much each did: directories
+    visited and read, files stat'ed, DODO bytes read, lines classified and
+    tasks emitted. Phases run in threads (--jobs) report the sum over the
+    threads; with --procs, the parsing done in other processes is not
+    counted. Given --profile FILE, the whole run is profiled and the
+    statistics written to FILE (read them with pstats).
 
 gh projects [-d] [-v] [-s SORT]
     Produce a list of projects in $GH_ROOT. SORT can be 'alpha' to sort
@@ -17,135 +169,2621 @@ gh projects [-d] [-v] [-s SORT]
     the project's DODO file (or 0 if the project has no DODO file). Thus, the
     'old' sort will put projects with no DODO file at the top of the list.
 
-This is free and unencumbered software released into the public domain.
-For more details, please visit <http://unlicense.org/>.
-"""
-from docopt_dispatch import dispatch
-from gh import version
-import glob
-import os
-import os.path as osp
-import pdb
-import re
+    The directories found under $GH_ROOT are remembered in an index in the
+    cache directory ($GH_CACHE, or $XDG_CACHE_HOME/gh, or ~/.cache/gh). On
+    later runs, only directories whose mtime has changed are read again. A
+    full walk (which also rebuilds the index) can be forced with --rescan.
+
+    Directories whose names contain venv, __pycache__, test, attic,
+    egg-info, .git or .cache are not searched, nor are the directories of
+    the projects in omit_list(). More can be listed in a .ghignore file at
+    the top of $GH_ROOT, in the style of .gitignore: 'build/' leaves out
+    every directory named build, '/old' only the one at the top, 'a/**/gen'
+    any gen below a, and '!keep' brings back a directory left out before.
+
+    Each directory is visited once, no matter how many symlinks lead to it.
+    With --aliases, the extra paths are listed after the projects.
+
+    With --format json or ndjson, each project is a record holding its path
+    and the path and mtime of its DODO file (null if it has none); an alias
+    is a record holding its path and the path it leads to. With --count,
+    there is a single record holding the number of projects.
+
+This is free and unencumbered software released into the public domain.
+For more details, please visit <http://unlicense.org/>.
+"""
+from gh import version
+import collections
+import os
+import os.path as osp
+import sys
+import time
+
+INDEX_VERSION = 4
+RACY_NS = 2 * 10**9
+TASK_CACHE_VERSION = 4
+GREP_INDEX_VERSION = 2
+STATUS_CACHE_VERSION = 1
+STATUS_UNTRACKED_DIRS = 256
+CATALOG_VERSION = 1
+TASK_CACHE_MAX = 32 * 2**20
+LRU_NS = 3600 * 10**9
+
+# Directories whose names contain any of these are not searched for projects
+OMITS = ['venv',
+         '__pycache__',
+         'test',
+         'attic',
+         'egg-info',
+         '.git',
+         '.cache',
+         ]
+
+# A file at the top of a root holding more (gitignore style) patterns for
+# directories not to search; see Ignore
+GHIGNORE = ".ghignore"
+
+# DODO lines are classified by matching them against one regex (LINE): a task
+# marker (' - ' starts an open task, ' + ' closes one, etc.), a line to throw
+# away (separators, blanks, comments, DONE headings) or, if neither matches,
+# a continuation line
+ACTIVE_MARKS = frozenset([" - ", " . ", " > ", " ^ "])
+CLOSED_MARKS = frozenset([" + ", " < ", " x "])
+THROW_AWAY = r"-{8}|\s*$|#| *-+\s+DONE|-\s+=+\s+DONE|=+\s+DONE"
+LINE = r"(?P<mark>\s[-.>^+<x]\s)|(?P<skip>{})".format(THROW_AWAY)
+
+# Lines that open (ACTIVE_BYTES) or close a task, for searching DODO file
+# bytes. Group 1 is the marker at the start of a line, following the '\n' or
+# lone '\r' that ends the line before. A marker on the first line of the
+# file has no line ending in front of it and is checked for separately.
+MARKER_BYTES = rb"[\n\r]( [-.>^+<x] )"
+ACTIVE_BYTES = frozenset([b" - ", b" . ", b" > ", b" ^ "])
+
+# DODO files at least this big are scanned for TaskSpans rather than parsed
+MMAP_MIN = 2**20
+MMAP_WINDOW = 16 * 2**20
+
+# What we remember about a directory: its mtime (ns) and when we read it,
+# whether it holds a '.project' marker, the name of its DODO file (or None),
+# the names of the subdirectories we descend into and which of those are
+# symlinks
+DirInfo = collections.namedtuple('DirInfo', ['mtime', 'scanned', 'project',
+                                             'dodo', 'subdirs', 'links'])
+
+# A project found under $GH_ROOT: its path, the path of its DODO file and the
+# stat result for that (both None if the project has no DODO file)
+Project = collections.namedtuple('Project', ['path', 'dodo', 'stat'])
+
+
+# inotify(7) event bits. WATCH_MASK is what gh tasks --watch asks for on each
+# directory; WATCH_SETTLE is how long it waits after an event for the rest of
+# a burst (an editor saving a file, say) before acting on them.
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+WATCH_MASK |= IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+WATCH_MASK |= IN_ONLYDIR
+WATCH_SETTLE = 0.05
+
+# The async API (async_projects() etc.) runs blocking calls in a pool of
+# ASYNC_JOBS threads, started on first use
+ASYNC_JOBS = 8
+ASYNC_POOL = None
+
+# How long gh projects and gh tasks wait for an answer from gh serve before
+# doing the work themselves
+SERVE_TIMEOUT = 10
+
+# The ORDER BY clause gh query uses for each -s SORT. A project with no DODO
+# file has a null mtime, which sorts first, so it counts as oldest, as it
+# does in old_sort(). Without -s, projects come in path order.
+CATALOG_ORDER = {'alpha': "p.path",
+                 'old': "p.mtime, p.path",
+                 'new': "p.mtime desc, p.path desc"}
+
+# Subcommand handlers, registered with @command(); main() hands them to
+# docopt_dispatch
+COMMANDS = {}
+
+# A Timings while --timings is in effect. Each hook checks this once per
+# phase (or per file), so there is nothing more to pay when it is None.
+TIMINGS = None
+
+
+# -----------------------------------------------------------------------------
+def main():
+    """
+    Main entry point. A plain 'gh version' is answered without parsing the
+    command line (or importing the parser).
+    """
+    if sys.argv[1:] == ['version']:
+        gh_version_d(d=False)
+        return
+    from docopt_dispatch import dispatch
+    for name, func in COMMANDS.items():
+        dispatch.on(name)(func)
+    dispatch(__doc__)
+
+
+# -----------------------------------------------------------------------------
+def command(name):
+    """
+    Decorator registering the handler for subcommand *name*
+    """
+    def decorator(func):
+        COMMANDS[name] = instrumented(func)
+        return func
+    return decorator
+
+
+# -----------------------------------------------------------------------------
+def instrumented(func):
+    """
+    Wrap subcommand handler *func* so --timings and --profile FILE apply to it
+    """
+    def wrapper(**kw):
+        global TIMINGS
+        if not (kw.get('timings') or kw.get('profile')):
+            return func(**kw)
+        profile = None
+        if kw.get('timings'):
+            TIMINGS = Timings()
+        if kw.get('profile'):
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            return func(**kw)
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(kw['profile'])
+            if TIMINGS is not None:
+                sys.stderr.write("".join(TIMINGS.report_g()))
+                TIMINGS = None
+    return wrapper
+
+
+# -----------------------------------------------------------------------------
+class Timings(object):
+    """
+    The time spent in each phase of a run and the counts of what was done,
+    collected by the hooks while TIMINGS is set
+    """
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Start the clock for the whole run
+        """
+        import threading
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+
+    # -------------------------------------------------------------------------
+    def add(self, phase, seconds, **counts):
+        """
+        Record a call of *phase* taking *seconds*, and add *counts* (names
+        with underscores for spaces) to the counts
+        """
+        with self.lock:
+            entry = self.phases.setdefault(phase, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            for name, num in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + num
+
+    # -------------------------------------------------------------------------
+    def count(self, **counts):
+        """
+        Add *counts* to the counts, outside any phase
+        """
+        with self.lock:
+            for name, num in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + num
+
+    # -------------------------------------------------------------------------
+    def report_g(self):
+        """
+        Generate the lines of the report
+        """
+        yield "gh timings:\n"
+        for name, (calls, seconds) in self.phases.items():
+            yield "   {:24s} {:>8d} calls {:>10.4f}s\n".format(
+                name, calls, seconds)
+        yield "   {:24s} {:>25.4f}s\n".format("total (wall)",
+                                              time.perf_counter() - self.start)
+        for name, num in self.counts.items():
+            yield "   {:24s} {:>8d}\n".format(name.replace("_", " "), num)
+
+
+# -----------------------------------------------------------------------------
+@command('projects')
+def gh_projects_d(**kw):                                     # pragma: no cover
+    """
+    List projects in $GH_ROOT
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    emit(gh_projects_g(**kw), kw.get('format') or 'text')
+
+
+# -----------------------------------------------------------------------------
+def gh_projects_t(**kw):
+    """
+    Heavy lifting
+    """
+    return "".join(gh_projects_g(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_projects_g(**kw):
+    """
+    Generate the output of gh projects one line at a time
+    """
+    aliases = []
+    rows = project_rows_g(kw, aliases)
+    fmt = kw.get('format') or 'text'
+    if fmt != 'text':
+        if kw['count']:
+            records = [{'count': len(list(rows))}]
+        else:
+            records = alias_records_g(rows, aliases)
+        yield from json_lines_g(records, fmt)
+        return
+    if kw['count']:
+        yield "{} projects found\n".format(len(list(rows)))
+    else:
+        for (path, dodo, _) in rows:
+            do_stat = '' if dodo else '(no DODO)'
+            yield "    {} {}\n".format(path, do_stat)
+    for alias, path in aliases:
+        yield "    {} -> {} (alias)\n".format(alias, path)
+
+
+# -----------------------------------------------------------------------------
+def alias_records_g(rows, aliases):
+    """
+    Generate the --format json/ndjson records for the project_rows_g() tuples
+    in *rows*, then for the (alias, path) tuples in *aliases*
+    """
+    for (path, dodo, mtime) in rows:
+        yield {'path': path, 'dodo': dodo, 'mtime': mtime}
+    for (alias, path) in aliases:
+        yield {'path': alias, 'alias': path}
+
+
+# -----------------------------------------------------------------------------
+def project_rows_g(kw, aliases):
+    """
+    Generate a (path, DODO path, DODO mtime) tuple for each project gh
+    projects reports on with options *kw*, in order, asking gh serve if it is
+    running. With --aliases, (alias, path) tuples are appended to the list
+    *aliases* (once the rows are all generated).
+    """
+    roots = root_list(kw)
+    if use_daemon(kw) and len(roots) == 1:
+        reply = daemon_query(roots[0],
+                             {'query': 'projects', 'sort': kw['s'],
+                              'limit': limit_opt(kw)})
+        if reply is not None:
+            yield from (tuple(_) for _ in reply['projects'])
+            return
+    found = {}
+
+    def scan(root):
+        return discover(root, index=True, rescan=kw.get('rescan', False),
+                        jobs=jobs_opt(kw), aliases=found.setdefault(root, []))
+
+    for projs in root_projects_g(roots, scan, kw['s'], limit_opt(kw)):
+        for prj in projs:
+            yield (prj.path, prj.dodo, dodo_time(prj))
+    if kw.get('aliases'):
+        for root in roots:
+            aliases.extend(found.get(root, []))
+
+
+# -----------------------------------------------------------------------------
+@command('tasks')
+def gh_tasks_d(**kw):                                        # pragma: no cover
+    """
+    Show tasks for projects located in $GH_ROOT
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    if kw.get('watch'):
+        redraw(gh_tasks_watch_g(**kw))
+        return
+    emit(gh_tasks_g(**kw), kw.get('format') or 'text')
+
+
+# -----------------------------------------------------------------------------
+def gh_tasks_t(**kw):
+    """
+    Return the output of gh tasks as a string
+    """
+    return "".join(gh_tasks_g(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_tasks_g(**kw):
+    """
+    Generate the output of gh tasks, yielding each project's lines (or
+    records) as soon as its DODO file has been read
+    """
+    fmt = kw.get('format') or 'text'
+    rows = task_rows_g(kw)
+    if fmt != 'text':
+        yield from json_lines_g(task_records_g(rows, kw['count']), fmt)
+    else:
+        yield from tasks_report_g(rows, kw['count'])
+
+
+# -----------------------------------------------------------------------------
+def task_rows_g(kw):
+    """
+    Generate a (path, DODO path, DODO mtime, tasks) tuple for each project gh
+    tasks reports on with options *kw*, in order, asking gh serve if it is
+    running. tasks is the project's task list or, with --count, a dict of the
+    number of tasks each marker opens (see marker_counts()). With --marker,
+    only the tasks opened by those markers are kept.
+    """
+    roots = root_list(kw)
+    marks = marker_opt(kw)
+    if use_daemon(kw) and len(roots) == 1:
+        reply = daemon_query(roots[0],
+                             {'query': 'count' if kw['count'] else 'tasks',
+                              'sort': kw['s'], 'project': kw['PROJECT'],
+                              'exact': kw.get('exact', False),
+                              'limit': limit_opt(kw), 'marker': marks})
+        if reply is not None:
+            for (path, tasks, dodo, mtime) in reply.get('counts',
+                                                        reply.get('tasks')):
+                if TIMINGS is not None:
+                    TIMINGS.count(tasks_emitted=sum(tasks.values())
+                                  if kw['count'] else len(tasks))
+                yield (path, dodo, mtime, tasks)
+            return
+    jobs = jobs_opt(kw)
+    procs = kw.get('procs', False)
+    read = project_tasks
+    if marks is not None:
+        import functools
+        read = functools.partial(project_tasks, marks=marks)
+
+    def scan(root):
+        if kw['PROJECT']:
+            return find_projects(root, kw['PROJECT'],
+                                 exact=kw.get('exact', False),
+                                 index=not kw.get('rescan'), jobs=jobs)
+        return discover(root, index=True, rescan=kw.get('rescan', False),
+                        jobs=jobs)
+
+    cache = None if kw.get('no_cache') else TaskCache()
+    for projs in root_projects_g(roots, scan, kw['s'], limit_opt(kw)):
+        if cache is None:
+            task_ll = pmap(read, projs, jobs=jobs, procs=procs)
+        else:
+            task_ll = cache.read(projs, jobs=jobs, procs=procs, marks=marks)
+        yield from task_rows(projs, task_ll, kw['count'])
+    if cache is not None:
+        cache.save()
+
+
+# -----------------------------------------------------------------------------
+def root_list(kw):
+    """
+    Return the directories to look for projects under: those given with
+    --root in *kw* or, failing that, those in $GH_ROOT (separated by colons),
+    normalized so '/x/' and '/x' name the same root
+    """
+    roots = kw.get('root') or os.getenv("GH_ROOT", "").split(os.pathsep)
+    return [osp.normpath(_) for _ in roots if _]
+
+
+# -----------------------------------------------------------------------------
+def root_projects_g(roots, scan, sort=None, limit=None):
+    """
+    Generate lists of the Project records scan(root) returns for the
+    directories in *roots*, which are scanned at the same time, a thread
+    each. If *sort* is given, the projects of all the roots are merged and
+    sorted (see sort_projects()) into a single list. Otherwise, each root's
+    list is generated as soon as its scan is done. Either way, no more than
+    *limit* projects (if it is not None) are generated in all.
+    """
+    if sort:
+        found = dict(scan_roots_g(roots, scan))
+        yield sort_projects([prj for root in roots for prj in found[root]],
+                            sort, limit)
+        return
+    for (_, projs) in scan_roots_g(roots, scan):
+        projs = sort_projects(projs, limit=limit)
+        yield projs
+        if limit is not None:
+            limit -= len(projs)
+            if limit <= 0:
+                break
+
+
+# -----------------------------------------------------------------------------
+def scan_roots_g(roots, scan):
+    """
+    Call scan(root) for each directory in *roots*, in threads, and generate
+    (root, result) tuples in the order the calls finish
+    """
+    if len(roots) <= 1:
+        yield from ((root, scan(root)) for root in roots)
+        return
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers=len(roots)) as pool:
+        futures = {pool.submit(scan, root): root for root in roots}
+        for future in as_completed(futures):
+            yield (futures[future], future.result())
+
+
+# -----------------------------------------------------------------------------
+def task_rows(projs, task_ll, count=False):
+    """
+    Generate the task_rows_g() tuples for the Project records in *projs* and
+    their task lists, drawn from *task_ll*
+    """
+    for prj, tl in zip(projs, task_ll):
+        if TIMINGS is not None:
+            TIMINGS.count(tasks_emitted=len(tl))
+        yield (prj.path, prj.dodo, dodo_time(prj),
+               marker_counts(tl) if count else tl)
+
+
+# -----------------------------------------------------------------------------
+def tasks_report_g(rows, count=False):
+    """
+    Generate the lines of the gh tasks report for the task_rows_g() tuples in
+    *rows*: a line per project and a total if *count* is True, otherwise the
+    tasks themselves
+    """
+    if count:
+        yield from count_lines_g((row[0], sum(row[3].values()))
+                                 for row in rows)
+    else:
+        for row in rows:
+            yield from show_tasks_g(row[0], row[3])
+
+
+# -----------------------------------------------------------------------------
+def count_lines_g(counts):
+    """
+    Generate the lines of gh tasks --count for the (project path, number of
+    tasks) pairs in *counts*, followed by the total
+    """
+    total = 0
+    for path, num in counts:
+        yield "   {:45s}   {:>5d}\n".format(path, num)
+        total += num
+    yield "   {:45s}   {:>5d}\n".format("Total", total)
+
+
+# -----------------------------------------------------------------------------
+def task_records_g(rows, count=False):
+    """
+    Generate the --format json/ndjson records for the task_rows_g() tuples in
+    *rows*: one per task or, if *count* is True, one per project
+    """
+    for (path, dodo, mtime, tasks) in rows:
+        if count:
+            yield {'path': path, 'dodo': dodo, 'mtime': mtime,
+                   'count': sum(tasks.values()), 'markers': tasks}
+            continue
+        for task in tasks:
+            yield {'path': path, 'dodo': dodo, 'mtime': mtime,
+                   'marker': task_marker(task), 'text': task_body(task)}
+
+
+# -----------------------------------------------------------------------------
+def json_lines_g(records, fmt):
+    """
+    Generate the text of the dicts from *records* as they come: one JSON
+    object per line if *fmt* is 'ndjson', otherwise a JSON array
+    """
+    import json
+    if fmt == 'ndjson':
+        for rec in records:
+            yield json.dumps(rec) + "\n"
+        return
+    sep = "[\n"
+    for rec in records:
+        yield sep + "  " + json.dumps(rec)
+        sep = ",\n"
+    yield "[]\n" if sep == "[\n" else "\n]\n"
+
+
+# -----------------------------------------------------------------------------
+def gh_tasks_watch_g(**kw):
+    """
+    Generate the output of gh tasks --watch: the whole report once, then
+    again each time it changes, forever
+    """
+    watch = TaskWatch(root_list(kw)[0], jobs=jobs_opt(kw),
+                      poll=kw.get('poll', False))
+    interval = float(kw.get('interval') or 2)
+    last = None
+    try:
+        while True:
+            projs = sort_projects(watch.projs.values(), kw['s'])
+            rows = task_rows(projs, watch.task_lists(projs), kw['count'])
+            text = "".join(tasks_report_g(rows, kw['count']))
+            if text != last:
+                yield text
+                last = text
+            watch.wait(interval)
+    finally:
+        watch.close()
+
+
+# -----------------------------------------------------------------------------
+class TaskWatch(object):
+    """
+    The projects under a root directory and the tasks in their DODO files,
+    kept up to date by wait(). After the first walk, only the project
+    directories and DODO files that change are read again.
+
+    Changes are reported by inotify where it is available. Otherwise (or if
+    *poll* is True) the tree is walked again every so often, which only
+    reads directories whose mtime changed.
+    """
+    # -------------------------------------------------------------------------
+    def __init__(self, root, jobs=1, poll=False):
+        """
+        Walk *root* and read the DODO files of the projects in it (through
+        the task cache), using *jobs* threads
+        """
+        self.root = os.fspath(root)
+        self.jobs = jobs
+        self.ignore = ignore_for(self.root)
+        self.dirs = load_index(self.root, self.ignore)
+        self.projs = {}
+        self.tasks = {}
+        self.notifier = None if poll else Inotify.open()
+        self.walk()
+        cache = TaskCache()
+        projs = list(self.projs.values())
+        for prj, task_l in zip(projs, cache.read(projs, jobs=jobs)):
+            self.tasks[prj.path] = (dodo_key(prj), task_l)
+        cache.save()
+
+    # -------------------------------------------------------------------------
+    def walk(self):
+        """
+        Walk the tree, reading only the directories that changed, and watch
+        every directory in it. A directory that turns up between the walk and
+        the watch on it would go unnoticed, so walk again until no new
+        directories appear. If the ignore patterns have changed, every
+        directory is read again.
+        """
+        ignore = ignore_for(self.root)
+        if ignore.patterns != self.ignore.patterns:
+            self.dirs = {}
+        self.ignore = ignore
+        while True:
+            visited = {}
+            found = [(path, info.dodo)
+                     for (path, info) in walk(self.root, ignore, self.dirs,
+                                              visited, jobs=self.jobs)
+                     if info.project]
+            if visited != self.dirs:
+                save_index(self.root, ignore, visited)
+            self.dirs = visited
+            self.projs = {prj.path: prj
+                          for prj in make_projects(found, jobs=self.jobs)}
+            if self.notifier is None or not self.notifier.watch(visited):
+                break
+
+    # -------------------------------------------------------------------------
+    def wait(self, timeout):
+        """
+        Wait for something to change (for *timeout* seconds, when polling),
+        then bring the projects and their task lists up to date
+        """
+        self.update(self.changes(timeout))
+
+    # -------------------------------------------------------------------------
+    def changes(self, timeout):
+        """
+        Wait for something to change and return the inotify events for it
+        (none if nothing happened within *timeout* seconds). When polling,
+        sleep for *timeout* seconds and return None: anything may have
+        changed.
+        """
+        if self.notifier is None:
+            time.sleep(timeout)
+            return None
+        events = self.notifier.read(timeout)
+        if events:
+            events.extend(self.notifier.read(WATCH_SETTLE))
+        return events
+
+    # -------------------------------------------------------------------------
+    def update(self, events):
+        """
+        Bring the projects and their task lists up to date with the changes
+        described by *events*, from changes()
+        """
+        if events is None:
+            return self.rescan()
+        dodos = set()
+        for (path, mask, name) in events:
+            if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                return self.rescan()
+            elif mask & IN_ISDIR and not mask & IN_ATTRIB:
+                return self.rescan()
+            elif name in ('.project', GHIGNORE):
+                return self.rescan()
+            elif name.startswith("DODO") and path in self.projs:
+                dodos.add(path)
+        found = []
+        for path in sorted(dodos):
+            info = dir_info(path, self.ignore)
+            if info is None or not info.project:
+                return self.rescan()
+            found.append((path, info.dodo))
+        for prj in make_projects(found, jobs=self.jobs):
+            self.projs[prj.path] = prj
+        self.parse(self.projs[path] for (path, _) in found)
+
+    # -------------------------------------------------------------------------
+    def rescan(self):
+        """
+        Walk the tree again and read the DODO files that changed
+        """
+        self.walk()
+        self.parse(self.projs.values())
+
+    # -------------------------------------------------------------------------
+    def restat(self):
+        """
+        Stat every project's DODO file again and read the ones that changed,
+        whether or not the change has been reported yet. (A DODO file that
+        appears in a project without one is left to the watch.)
+        """
+        changed = []
+        for prj in list(self.projs.values()):
+            if prj.stat is None:
+                continue
+            st = dodo_stat(prj.dodo)
+            if st is not None and st.st_mtime_ns == prj.stat.st_mtime_ns and \
+               st.st_size == prj.stat.st_size:
+                continue
+            prj = prj._replace(dodo=prj.dodo if st else None, stat=st)
+            self.projs[prj.path] = prj
+            changed.append(prj)
+        self.parse(changed)
+
+    # -------------------------------------------------------------------------
+    def parse(self, projs):
+        """
+        Read the DODO files of the Project records in *projs* that changed
+        since they were last read, and forget projects that have gone
+        """
+        stale = []
+        for prj in projs:
+            key = dodo_key(prj)
+            if key is None:
+                self.tasks[prj.path] = (None, [])
+            elif self.tasks.get(prj.path, (None,))[0] != key:
+                stale.append((prj, key))
+        parsed = pmap(project_tasks, [_[0] for _ in stale], jobs=self.jobs)
+        for (prj, key), task_l in zip(stale, parsed):
+            self.tasks[prj.path] = (key, task_l)
+        for path in set(self.tasks) - set(self.projs):
+            del self.tasks[path]
+
+    # -------------------------------------------------------------------------
+    def task_lists(self, projs):
+        """
+        Return the task lists of the Project records in *projs*
+        """
+        return [self.tasks[prj.path][1] for prj in projs]
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """
+        Stop watching
+        """
+        if self.notifier is not None:
+            self.notifier.close()
+            self.notifier = None
+
+
+# -----------------------------------------------------------------------------
+@command('grep')
+def gh_grep_d(**kw):                                         # pragma: no cover
+    """
+    Show the tasks containing the words given
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    emit(gh_grep_g(**kw), kw.get('format') or 'text')
+
+
+# -----------------------------------------------------------------------------
+def gh_grep_t(**kw):
+    """
+    Return the output of gh grep as a string
+    """
+    return "".join(gh_grep_g(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_grep_g(**kw):
+    """
+    Generate the output of gh grep: the tasks that match, grouped by project
+    as gh tasks shows them
+    """
+    fmt = kw.get('format') or 'text'
+    rows = grep_rows_g(kw)
+    if fmt != 'text':
+        yield from json_lines_g(task_records_g(rows), fmt)
+    else:
+        yield from tasks_report_g(rows)
+
+
+# -----------------------------------------------------------------------------
+def grep_rows_g(kw):
+    """
+    Generate a (path, DODO path, DODO mtime, tasks) tuple, like
+    task_rows_g(), for each project with tasks matching the TERMs in *kw*,
+    holding just those tasks. Projects come in order of path within each
+    root.
+    """
+    import itertools
+    jobs = jobs_opt(kw)
+    cache = TaskCache()
+    for root in root_list(kw):
+        projs = discover(root, index=True, rescan=kw.get('rescan', False),
+                         jobs=jobs)
+        index = GrepIndex(root, fresh=kw.get('rescan', False))
+        index.update(projs, cache, jobs=jobs)
+        index.save()
+        found = {prj.path: prj for prj in projs}
+        hits = [(found[path], [_[1] for _ in group]) for (path, group) in
+                itertools.groupby(index.search(kw['TERM']),
+                                  key=lambda _: _[0])]
+        task_ll = cache.read([_[0] for _ in hits], jobs=jobs)
+        for ((prj, idxs), task_l) in zip(hits, task_ll):
+            yield (prj.path, prj.dodo, dodo_time(prj),
+                   [task_l[_] for _ in idxs])
+    cache.save()
+
+
+# -----------------------------------------------------------------------------
+@command('status')
+def gh_status_d(**kw):                                       # pragma: no cover
+    """
+    Show the git status of each project
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    emit(gh_status_g(**kw), kw.get('format') or 'text')
+
+
+# -----------------------------------------------------------------------------
+def gh_status_t(**kw):
+    """
+    Return the output of gh status as a string
+    """
+    return "".join(gh_status_g(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_status_g(**kw):
+    """
+    Generate the output of gh status, a line (or record) per repository as
+    soon as its status is known
+    """
+    fmt = kw.get('format') or 'text'
+    rows = status_rows_g(kw)
+    if fmt != 'text':
+        yield from json_lines_g(rows, fmt)
+        return
+    for row in rows:
+        yield "   {:45s}   {}\n".format(row['path'], status_text(row))
+
+
+# -----------------------------------------------------------------------------
+def status_text(row):
+    """
+    Return the gh status description of the repository status dict *row*
+    """
+    if row.get('error'):
+        return "error: {}".format(row['error'])
+    parts = []
+    for (name, fmt) in [('changed', "{} changed"), ('ahead', "ahead {}"),
+                        ('behind', "behind {}"), ('stash', "{} stashed")]:
+        if row[name]:
+            parts.append(fmt.format(row[name]))
+    return "[{}] {}".format(row['branch'] or "detached",
+                            ", ".join(parts) or "clean")
+
+
+# -----------------------------------------------------------------------------
+def status_rows_g(kw):
+    """
+    Generate a dict describing the git status of each project with a
+    repository under the roots in *kw*: those that can be shown to be clean
+    without running git first, then the others as git reports on them
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    jobs = jobs_opt(kw)
+
+    def scan(root):
+        return discover(root, index=True, rescan=kw.get('rescan', False),
+                        jobs=jobs)
+
+    repos = []
+    for projs in root_projects_g(root_list(kw), scan):
+        for prj in projs:
+            gitdir = git_dir(prj.path)
+            if gitdir is not None:
+                repos.append((prj.path, gitdir))
+    cache = cache_load("status")
+    if not isinstance(cache, dict) or \
+       cache.get('version') != STATUS_CACHE_VERSION:
+        cache = {'version': STATUS_CACHE_VERSION, 'repos': {}}
+    known = cache['repos']
+    slow = []
+    for (path, gitdir) in repos:
+        entry = known.get(path)
+        if entry is not None and entry[0] == repo_key(gitdir) and \
+           index_unchanged(path, gitdir, entry[1]):
+            yield dict(entry[2])
+        else:
+            slow.append((path, gitdir))
+    with ThreadPoolExecutor(max_workers=int(kw.get('git_jobs') or 8)) as pool:
+        futures = {pool.submit(git_status, path, gitdir): path
+                   for (path, gitdir) in slow}
+        for future in as_completed(futures):
+            (row, entry) = future.result()
+            known.pop(row['path'], None)
+            if entry is not None:
+                known[row['path']] = entry
+            yield row
+    if slow:
+        cache_save("status", cache)
+
+
+# -----------------------------------------------------------------------------
+def git_status(path, gitdir):
+    """
+    Run 'git status' in the repository at *path* (with git directory
+    *gitdir*) and return a status dict for it, and the cache entry that
+    lets the next run skip git if the repository is clean (or None)
+    """
+    import subprocess
+    checked = time.time_ns()
+    key = repo_key(gitdir)
+    row = {'path': path, 'branch': None, 'changed': 0, 'ahead': 0,
+           'behind': 0, 'stash': stash_count(gitdir)}
+    try:
+        result = subprocess.run(["git", "status", "--porcelain=v2",
+                                 "--branch"], cwd=path, capture_output=True,
+                                text=True, errors='replace')
+    except OSError as err:
+        row['error'] = str(err)
+        return (row, None)
+    if result.returncode != 0:
+        row['error'] = result.stderr.strip() or "git status failed"
+        return (row, None)
+    for line in result.stdout.splitlines():
+        if line.startswith("# branch.head "):
+            head = line.split(" ", 2)[2]
+            row['branch'] = None if head == "(detached)" else head
+        elif line.startswith("# branch.ab "):
+            (ahead, behind) = line.split()[2:4]
+            row['ahead'] = int(ahead)
+            row['behind'] = -int(behind)
+        elif not line.startswith("#"):
+            row['changed'] += 1
+    # Only a clean result is kept, and only if nothing changed while git ran
+    entry = None
+    if not row['changed'] and repo_key(gitdir) == key:
+        entry = (key, checked, row)
+    return (row, entry)
+
+
+# -----------------------------------------------------------------------------
+def git_dir(path):
+    """
+    Return the git directory of the repository at *path* (.git, or where a
+    .git file points), or None if *path* has none
+    """
+    dotgit = osp.join(path, ".git")
+    if osp.isdir(dotgit):
+        return dotgit
+    try:
+        with open(dotgit) as rbl:
+            line = rbl.readline().strip()
+    except OSError:
+        return None
+    if line.startswith("gitdir: "):
+        return osp.normpath(osp.join(path, line[8:]))
+    return None
+
+
+# -----------------------------------------------------------------------------
+def repo_key(gitdir):
+    """
+    Return a tuple that changes whenever the commit checked out, the branch,
+    its upstream, the index, the stash, the config or the exclude file of
+    the repository with git directory *gitdir* do: HEAD, the commit it
+    names, the upstream branch and its commit, and the mtime and size of
+    the index, the stash log, the config and info/exclude
+    """
+    common = git_common_dir(gitdir)
+    head = read_text(osp.join(gitdir, "HEAD"))
+    commit = upstream = upcommit = None
+    if head and head.startswith("ref: "):
+        ref = head[5:]
+        commit = read_ref(gitdir, common, ref)
+        upstream = upstream_ref(common, ref)
+        if upstream is not None:
+            upcommit = read_ref(gitdir, common, upstream)
+    rval = [head, commit, upstream, upcommit]
+    for name in [osp.join(gitdir, "index"),
+                 osp.join(common, "logs", "refs", "stash"),
+                 osp.join(common, "config"),
+                 osp.join(common, "info", "exclude")]:
+        try:
+            st = os.stat(name)
+            rval.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            rval.append(None)
+    return tuple(rval)
+
+
+# -----------------------------------------------------------------------------
+def git_common_dir(gitdir):
+    """
+    Return the directory holding the refs and config for git directory
+    *gitdir* (which differs for a linked worktree)
+    """
+    common = read_text(osp.join(gitdir, "commondir"))
+    if common is None:
+        return gitdir
+    return osp.normpath(osp.join(gitdir, common))
+
+
+# -----------------------------------------------------------------------------
+def read_ref(gitdir, common, ref):
+    """
+    Return the commit that *ref* (like refs/heads/main) points to, from the
+    loose ref file or packed-refs, or None
+    """
+    for base in [gitdir, common]:
+        sha = read_text(osp.join(base, ref))
+        if sha is not None:
+            return sha
+    packed = read_text(osp.join(common, "packed-refs")) or ""
+    for line in packed.splitlines():
+        if line.endswith(" " + ref):
+            return line.split()[0]
+    return None
+
+
+# -----------------------------------------------------------------------------
+def upstream_ref(common, ref):
+    """
+    Return the ref of the upstream branch configured for branch *ref* in the
+    git config in *common*, or None
+    """
+    import re
+    branch = ref[len("refs/heads/"):]
+    config = read_text(osp.join(common, "config")) or ""
+    section = None
+    found = {}
+    for line in config.splitlines():
+        line = line.strip()
+        match = re.match(r'\[\s*(\S+)(?:\s+"(.*)")?\s*\]', line)
+        if match:
+            section = (match.group(1).lower(), match.group(2))
+        elif section == ('branch', branch) and "=" in line:
+            (name, value) = line.split("=", 1)
+            found[name.strip().lower()] = value.strip()
+    if 'merge' not in found or 'remote' not in found:
+        return None
+    if found['remote'] == ".":
+        return found['merge']
+    return "refs/remotes/{}/{}".format(
+        found['remote'], found['merge'].replace("refs/heads/", "", 1))
+
+
+# -----------------------------------------------------------------------------
+def stash_count(gitdir):
+    """
+    Return the number of stash entries in the repository with git directory
+    *gitdir*: the lines in its stash reflog
+    """
+    path = osp.join(git_common_dir(gitdir), "logs", "refs", "stash")
+    try:
+        with open(path, 'rb') as rbl:
+            return sum(1 for _ in rbl)
+    except OSError:
+        return 0
+
+
+# -----------------------------------------------------------------------------
+def index_unchanged(path, gitdir, checked):
+    """
+    Return True if none of the files recorded in the index of the repository
+    at *path* has changed since it was written, and no directory in the
+    work tree (outside .git) has changed since *checked* (ns since the
+    epoch), so no files have been added or removed. That takes in the
+    directories with no tracked files, where an untracked file can appear
+    too. Anything that cannot be checked this way (an index format this
+    does not read, a file changed too close to the index write to tell)
+    makes the answer False, leaving it to git.
+
+    Every directory is stat'ed and read, ignored ones included, since this
+    does not read .gitignore. Where git would skip a big ignored tree
+    (node_modules, a venv, build output) that costs more than the git
+    status it saves, so once more than STATUS_UNTRACKED_DIRS directories
+    with no tracked files have been read, the answer is False too.
+    """
+    import struct
+    try:
+        index = os.stat(osp.join(gitdir, "index"))
+        with open(osp.join(gitdir, "index"), 'rb') as rbl:
+            data = rbl.read()
+    except OSError:
+        return False
+    (sig, version, count) = struct.unpack_from(">4sII", data)
+    if sig != b"DIRC" or version not in (2, 3):
+        return False
+    dirs = {""}
+    pos = 12
+    for _ in range(count):
+        (mtime, mtime_ns, mode, size, flags) = \
+            struct.unpack_from(">8xII8xI8xI20xH", data, pos)
+        start = pos + 62 + (2 if flags & 0x4000 else 0)
+        end = data.index(b"\0", start)
+        name = os.fsdecode(data[start:end])
+        pos += (end - pos + 8) & ~7
+        if mode >> 12 == 0o16:
+            continue
+        try:
+            st = os.lstat(osp.join(path, name))
+        except OSError:
+            return False
+        if (st.st_mtime_ns // 10**9) & 0xffffffff != mtime or \
+           st.st_mtime_ns % 10**9 != mtime_ns or \
+           st.st_size & 0xffffffff != size or \
+           index.st_mtime_ns <= st.st_mtime_ns + RACY_NS:
+            return False
+        while name:
+            name = osp.dirname(name)
+            if name in dirs:
+                break
+            dirs.add(name)
+    while pos + 8 < len(data) - 20:
+        (ext, size) = struct.unpack_from(">4sI", data, pos)
+        if ext in (b"link", b"sdir"):
+            return False
+        pos += 8 + size
+    stack = list(dirs)
+    untracked = 0
+    while stack:
+        name = stack.pop()
+        try:
+            with os.scandir(osp.join(path, name)) as entries:
+                subs = [_.name for _ in entries
+                        if _.is_dir(follow_symlinks=False)]
+            if checked <= os.stat(osp.join(path, name)).st_mtime_ns + RACY_NS:
+                return False
+        except OSError:
+            return False
+        for sub in subs:
+            sub = osp.join(name, sub)
+            if osp.basename(sub) != ".git" and sub not in dirs:
+                untracked += 1
+                if STATUS_UNTRACKED_DIRS < untracked:
+                    return False
+                dirs.add(sub)
+                stack.append(sub)
+    return True
+
+
+# -----------------------------------------------------------------------------
+def read_text(path):
+    """
+    Return the contents of the file at *path*, stripped, or None if it
+    cannot be read
+    """
+    try:
+        with open(path, errors='replace') as rbl:
+            return rbl.read().strip()
+    except OSError:
+        return None
+
+
+# -----------------------------------------------------------------------------
+@command('snapshot')
+def gh_snapshot_d(**kw):                                     # pragma: no cover
+    """
+    Record the task count of each project in the history
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    print(gh_snapshot_t(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_snapshot_t(**kw):
+    """
+    Take a snapshot of the task counts and describe it
+    """
+    jobs = jobs_opt(kw)
+    projs = [prj for root in root_list(kw)
+             for prj in discover(root, index=True, jobs=jobs)]
+    cache = TaskCache()
+    counts = {prj.path: len(task_l)
+              for (prj, task_l) in zip(projs, cache.read(projs, jobs=jobs))}
+    cache.save()
+    with history_db() as db:
+        known = {row[0]: row[1:] for row in
+                 db.execute("select path, id, count from projects"
+                            " where count is not null")}
+        snap = db.execute("insert into snapshots (time) values (?)",
+                          (time.time(),)).lastrowid
+        changed = 0
+        for (path, count) in counts.items():
+            entry = known.get(path)
+            if entry is not None and entry[1] == count:
+                continue
+            if entry is None:
+                db.execute("insert or ignore into projects (path)"
+                           " values (?)", (path,))
+            db.execute("update projects set count = ? where path = ?",
+                       (count, path))
+            db.execute("insert into counts (snapshot, project, count)"
+                       " select ?, id, ? from projects where path = ?",
+                       (snap, count, path))
+            changed += 1
+        for path in set(known) - set(counts):
+            db.execute("insert into counts (snapshot, project, count)"
+                       " values (?, ?, null)", (snap, known[path][0]))
+            db.execute("update projects set count = null where path = ?",
+                       (path,))
+            changed += 1
+    return "snapshot {}: {} projects, {} tasks, {} counts changed".format(
+        snap, len(counts), sum(counts.values()), changed)
+
+
+# -----------------------------------------------------------------------------
+@command('history')
+def gh_history_d(**kw):                                      # pragma: no cover
+    """
+    Show how the task counts have changed
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    emit(gh_history_g(**kw), kw.get('format') or 'text')
+
+
+# -----------------------------------------------------------------------------
+def gh_history_t(**kw):
+    """
+    Return the output of gh history as a string
+    """
+    return "".join(gh_history_g(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_history_g(**kw):
+    """
+    Generate the lines (or records) of gh history: for each snapshot where
+    the total changed, the time and total, or with PROJECT, for each
+    matching project, the times and counts where its count changed
+    """
+    fmt = kw.get('format') or 'text'
+    if kw['PROJECT']:
+        records = project_history_g(kw['PROJECT'], kw.get('exact', False))
+    else:
+        records = total_history_g()
+    if fmt != 'text':
+        yield from json_lines_g(records, fmt)
+        return
+    path = None
+    for rec in records:
+        if 'path' in rec and rec['path'] != path:
+            path = rec['path']
+            yield "----------- {} ------------\n".format(path)
+        when = time.strftime("%Y-%m-%d %H:%M:%S",
+                             time.localtime(rec['time']))
+        num = rec.get('total', rec.get('count'))
+        yield "   {}   {:>5}\n".format(when, "-" if num is None else num)
+
+
+# -----------------------------------------------------------------------------
+def total_history_g():
+    """
+    Generate a {'time', 'total'} record for each snapshot where the total
+    number of tasks changed
+    """
+    with history_db() as db:
+        rows = db.execute("select s.id, s.time, c.project, c.count"
+                          " from snapshots s join counts c"
+                          " on c.snapshot = s.id order by s.id")
+        current = {}
+        total = 0
+        last = when = None
+        for (snap, stamp, project, count) in rows:
+            if when is not None and snap != when[0] and total != last:
+                yield {'time': when[1], 'total': total}
+                last = total
+            total += (count or 0) - current.get(project, 0)
+            current[project] = count or 0
+            when = (snap, stamp)
+        if when is not None and total != last:
+            yield {'time': when[1], 'total': total}
+
+
+# -----------------------------------------------------------------------------
+def project_history_g(name, exact=False):
+    """
+    Generate a {'path', 'time', 'count'} record for each change in the task
+    count of the projects matching *name* (see project_matches()), project
+    by project. A count of None means the project was gone.
+    """
+    with history_db() as db:
+        paths = [path for (path,) in
+                 db.execute("select path from projects order by path")
+                 if project_matches(path, name, exact)]
+        for path in paths:
+            for (stamp, count) in db.execute(
+                    "select s.time, c.count from counts c"
+                    " join snapshots s on s.id = c.snapshot"
+                    " join projects p on p.id = c.project"
+                    " where p.path = ? order by s.id", (path,)):
+                yield {'path': path, 'time': stamp, 'count': count}
+
+
+# -----------------------------------------------------------------------------
+def history_db():
+    """
+    Open (creating it if need be) the history database and return the
+    connection, for use in a 'with' block that commits the changes made in
+    it. There is a row in snapshots for each snapshot, and a row in counts
+    only for each project whose count changed in it (None when the project
+    went away); projects holds each project's last count. The counts come
+    from the task cache, which keeps track of the DODO files that changed.
+    """
+    import sqlite3
+    os.makedirs(data_dir(), exist_ok=True)
+    db = sqlite3.connect(osp.join(data_dir(), "history.sqlite3"))
+    db.executescript("""
+        create table if not exists snapshots (
+            id integer primary key, time real not null);
+        create table if not exists projects (
+            id integer primary key, path text unique not null,
+            count integer);
+        create table if not exists counts (
+            snapshot integer not null, project integer not null,
+            count integer, primary key (project, snapshot)) without rowid;
+        """)
+    return db_session(db)
+
+
+# -----------------------------------------------------------------------------
+def db_session(db):
+    """
+    Return a context manager for sqlite3 connection *db* that commits the
+    changes made in its 'with' block (or rolls them back if it raises) and
+    closes the connection after
+    """
+    import contextlib
+
+    @contextlib.contextmanager
+    def session():
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    return session()
+
+
+# -----------------------------------------------------------------------------
+def data_dir():
+    """
+    Return the path of the directory where gh keeps its data (the history):
+    $GH_DATA if set, otherwise gh under $XDG_DATA_HOME or ~/.local/share
+    """
+    rval = os.getenv("GH_DATA")
+    if not rval:
+        base = os.getenv("XDG_DATA_HOME") or osp.expanduser("~/.local/share")
+        rval = osp.join(base, "gh")
+    return rval
+
+
+# -----------------------------------------------------------------------------
+@command('query')
+def gh_query_d(**kw):                                        # pragma: no cover
+    """
+    Answer a question about the projects and tasks from the catalog
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    emit(gh_query_g(**kw), kw.get('format') or 'text')
+
+
+# -----------------------------------------------------------------------------
+def gh_query_t(**kw):
+    """
+    Return the output of gh query as a string
+    """
+    return "".join(gh_query_g(**kw))
+
+
+# -----------------------------------------------------------------------------
+def gh_query_g(**kw):
+    """
+    Generate the lines (or records) of gh query: the projects that match the
+    options in *kw* or, with --marker, their tasks with those markers (or,
+    with --count, how many there are)
+    """
+    fmt = kw.get('format') or 'text'
+    marks = marker_opt(kw)
+    roots = root_list(kw)
+    with catalog_db() as db:
+        catalog_refresh(db, roots, jobs=jobs_opt(kw),
+                        rescan=kw.get('rescan', False))
+        db.commit()
+        if marks is not None:
+            rows = catalog_task_rows_g(db, roots, kw, marks)
+            if fmt != 'text':
+                yield from json_lines_g(task_records_g(rows, kw['count']),
+                                        fmt)
+            else:
+                yield from tasks_report_g(rows, kw['count'])
+            return
+        rows = catalog_project_rows_g(db, roots, kw)
+        if fmt != 'text':
+            if kw['count']:
+                records = [{'count': len(list(rows))}]
+            else:
+                records = alias_records_g(rows, [])
+            yield from json_lines_g(records, fmt)
+        elif kw['count']:
+            yield "{} projects found\n".format(len(list(rows)))
+        else:
+            for (path, dodo, _) in rows:
+                yield "    {} {}\n".format(path, '' if dodo else '(no DODO)')
+
+
+# -----------------------------------------------------------------------------
+def marker_opt(kw):
+    """
+    Return the task markers given with --marker in the option dict *kw* as a
+    list, or None if there are none. Any character that is not an open task
+    marker ('-', '.', '>' or '^') is an error.
+    """
+    marks = kw.get('marker')
+    if not marks:
+        return None
+    bad = [_ for _ in marks if _ not in "-.>^"]
+    if bad:
+        sys.exit("--marker takes the markers of open tasks ('-', '.', '>' and"
+                 " '^'), not {!r}".format("".join(bad)))
+    return sorted(set(marks))
+
+
+# -----------------------------------------------------------------------------
+def catalog_project_rows_g(db, roots, kw):
+    """
+    Generate a (path, DODO path, DODO mtime) tuple for each project in the
+    catalog *db* under *roots* that gh query reports on with options *kw*,
+    in order
+    """
+    (where, params) = catalog_where(roots, kw)
+    yield from db.execute("select p.path, p.dodo, p.mtime from projects p"
+                          " where {} order by {} limit ?".format(
+                              where, CATALOG_ORDER.get(kw['s'], "p.path")),
+                          params + [catalog_limit(kw)])
+
+
+# -----------------------------------------------------------------------------
+def catalog_task_rows_g(db, roots, kw, marks):
+    """
+    Generate a (path, DODO path, DODO mtime, tasks) tuple, as task_rows_g()
+    does, for each project in the catalog *db* under *roots* that gh query
+    reports on with options *kw* and that has tasks marked with one of
+    *marks*. tasks is the list of those tasks, in file order, or with
+    --count, a dict of the number of them each marker opens, as
+    marker_counts() gives.
+    """
+    (where, params) = catalog_where(roots, kw)
+    inmarks = "t.marker in ({})".format(", ".join("?" * len(marks)))
+    permark = ", ".join("sum(t.marker = ?)" for _ in marks)
+    projs = db.execute("select p.id, p.path, p.dodo, p.mtime, count(*), {}"
+                       " from projects p join tasks t on t.project = p.id"
+                       " where {} and {} group by p.id order by {}"
+                       " limit ?".format(permark, where, inmarks,
+                                         CATALOG_ORDER.get(kw['s'], "p.path")),
+                       marks + params + marks + [catalog_limit(kw)]
+                       ).fetchall()
+    for (pid, path, dodo, mtime, count, *nums) in projs:
+        if kw['count']:
+            tasks = {mark: num for (mark, num) in zip(marks, nums) if num}
+        else:
+            tasks = [" {} {}\n".format(mark, text) for (mark, text) in
+                     db.execute("select t.marker, t.text from tasks t"
+                                " where t.project = ? and {}"
+                                " order by t.line".format(inmarks),
+                                [pid] + marks)]
+        if TIMINGS is not None:
+            TIMINGS.count(tasks_emitted=count)
+        yield (path, dodo, mtime, tasks)
+
+
+# -----------------------------------------------------------------------------
+def catalog_where(roots, kw):
+    """
+    Return the SQL condition selecting the projects (p) under *roots* that
+    match the options in *kw*, and a list of its parameters
+    """
+    clauses = ["p.root in ({})".format(", ".join("?" * len(roots)))]
+    params = list(roots)
+    if kw.get('no_dodo'):
+        clauses.append("not p.has_dodo")
+    name = kw.get('PROJECT')
+    if name and kw.get('exact'):
+        clauses.append("(p.name = ? or p.path = ?)")
+        params.extend([name, name])
+    elif name:
+        clauses.append("instr(p.path, ?)")
+        params.append(name)
+    return (" and ".join(clauses), params)
+
+
+# -----------------------------------------------------------------------------
+def catalog_limit(kw):
+    """
+    Return the value of --limit from the option dict *kw* for a SQL LIMIT
+    clause, where -1 means no limit
+    """
+    limit = limit_opt(kw)
+    return -1 if limit is None else max(limit, 0)
+
+
+# -----------------------------------------------------------------------------
+def catalog_refresh(db, roots, jobs=1, rescan=False):
+    """
+    Bring the catalog *db* up to date with the projects under *roots*.
+    Each root is walked (with the project index, unless *rescan* is True),
+    and only the DODO files whose key (see dodo_key()) has changed since
+    they were cataloged are read, in *jobs* threads. With *rescan*, every
+    DODO file is read again.
+    """
+    now = time.time_ns()
+
+    def scan(root):
+        return discover(root, index=True, rescan=rescan, jobs=jobs)
+
+    for (root, projs) in scan_roots_g(roots, scan):
+        known = {row[0]: row[1:] for row in
+                 db.execute("select path, id, dodo, mtime_ns, size"
+                            " from projects where root = ?", (root,))}
+        stale = []
+        for prj in projs:
+            entry = known.pop(prj.path, None)
+            key = dodo_key(prj) or (None, None, None)
+            if rescan or entry is None or entry[1:] != key:
+                stale.append((prj, entry and entry[0]))
+        for (pid, *_) in known.values():
+            db.execute("delete from tasks where project = ?", (pid,))
+            db.execute("delete from projects where id = ?", (pid,))
+        task_ll = pmap(catalog_tasks, [_[0] for _ in stale], jobs=jobs)
+        for ((prj, pid), task_l) in zip(stale, task_ll):
+            if pid is None:
+                pid = db.execute("insert into projects (root, path, name)"
+                                 " values (?, ?, ?)",
+                                 (root, prj.path,
+                                  osp.basename(prj.path))).lastrowid
+            else:
+                db.execute("delete from tasks where project = ?", (pid,))
+            key = dodo_key(prj)
+            (dodo, mtime_ns, size) = key or (None, None, None)
+            # Leaving out the size of a file that fresh_key() does not trust
+            # makes its key differ next time, so it is read again
+            if key is not None and fresh_key(key, now) is None:
+                size = None
+            db.execute("update projects set dodo = ?, has_dodo = ?,"
+                       " mtime = ?, mtime_ns = ?, size = ? where id = ?",
+                       (dodo, dodo is not None, dodo_time(prj), mtime_ns,
+                        size, pid))
+            db.executemany("insert into tasks (project, line, marker, text)"
+                           " values (?, ?, ?, ?)",
+                           ((pid, line, task_marker(task), task_body(task))
+                            for (line, task) in task_l))
+
+
+# -----------------------------------------------------------------------------
+def catalog_tasks(prj):
+    """
+    Return the (line number, task) tuples for the open tasks in the DODO file
+    of Project *prj*
+    """
+    if prj.dodo is None:
+        return []
+    return parse_dodo(prj.dodo, numbered=True)
+
+
+# -----------------------------------------------------------------------------
+def catalog_db():
+    """
+    Open (creating it if need be) the catalog in the cache directory and
+    return the connection, for use in a 'with' block that commits the
+    changes made in it. projects holds each project's root, path, directory
+    name and DODO key (see dodo_key()), with the DODO mtime in seconds for
+    sorting; tasks holds the line number, marker and text (without the
+    marker) of each open task. A catalog written by another version of gh
+    is thrown away and rebuilt.
+    """
+    import sqlite3
+    os.makedirs(cache_dir(), exist_ok=True)
+    db = sqlite3.connect(osp.join(cache_dir(), "catalog.sqlite3"))
+    (version,) = db.execute("pragma user_version").fetchone()
+    if version != CATALOG_VERSION:
+        db.executescript("""
+            drop table if exists projects;
+            drop table if exists tasks;
+            pragma user_version = {};
+            """.format(CATALOG_VERSION))
+    db.executescript("""
+        create table if not exists projects (
+            id integer primary key, root text not null, path text not null,
+            name text not null, dodo text, has_dodo integer not null
+            default 0, mtime real, mtime_ns integer, size integer,
+            unique (root, path));
+        create index if not exists projects_mtime on projects (mtime);
+        create index if not exists projects_has_dodo
+            on projects (has_dodo, mtime);
+        create index if not exists projects_name on projects (name);
+        create table if not exists tasks (
+            project integer not null, line integer not null,
+            marker text not null, text text not null,
+            primary key (project, line)) without rowid;
+        create index if not exists tasks_marker on tasks (marker, project);
+        """)
+    return db_session(db)
+
+
+# -----------------------------------------------------------------------------
+@command('serve')
+def gh_serve_d(**kw):                                        # pragma: no cover
+    """
+    Answer queries about the projects and tasks under $GH_ROOT
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    root = root_list(kw)[0]
+    if daemon_alive(socket_path(root)):
+        sys.exit("gh serve is already running for {}".format(root))
+    server = TaskServer(root, jobs=jobs_opt(kw), poll=kw.get('poll', False),
+                        interval=float(kw.get('interval') or 2))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+# -----------------------------------------------------------------------------
+class TaskServer(object):
+    """
+    The gh serve daemon: a TaskWatch over a root directory, kept up to date
+    by a thread following changes, and a Unix socket on which it answers
+    queries. A query is one line of JSON and so is the answer; see query().
+    """
+    # -------------------------------------------------------------------------
+    def __init__(self, root, jobs=1, poll=False, interval=2):
+        """
+        Read the projects under *root* and listen on its socket (see
+        TaskWatch for *jobs* and *poll*). When polling, the tree is walked
+        every *interval* seconds.
+        """
+        import socket
+        import threading
+        self.root = os.fspath(root)
+        self.path = socket_path(self.root)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.closing = False
+        self.watch = TaskWatch(self.root, jobs=jobs, poll=poll)
+        if osp.exists(self.path):
+            os.unlink(self.path)
+        os.makedirs(osp.dirname(self.path), exist_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(16)
+
+    # -------------------------------------------------------------------------
+    def serve_forever(self):
+        """
+        Follow changes in one thread and answer each connection in another
+        until close() is called
+        """
+        import threading
+        threading.Thread(target=self.follow, daemon=True).start()
+        while True:
+            try:
+                (conn, _) = self.sock.accept()
+            except OSError:
+                if self.closing:
+                    return
+                raise
+            if self.closing:
+                conn.close()
+                return
+            threading.Thread(target=self.handle, args=(conn,),
+                             daemon=True).start()
+
+    # -------------------------------------------------------------------------
+    def follow(self):
+        """
+        Apply changes to the tree as they are reported
+        """
+        while not self.closing:
+            events = self.watch.changes(self.interval)
+            with self.lock:
+                if self.closing:
+                    return
+                self.watch.update(events)
+
+    # -------------------------------------------------------------------------
+    def handle(self, conn):
+        """
+        Read a query from connection *conn* and write the answer to it. A
+        connection closed without a query (see daemon_alive()) gets no
+        answer, nor does one closed before the answer is ready.
+        """
+        import json
+        try:
+            with conn, conn.makefile('rwb') as stream:
+                line = stream.readline()
+                if not line:
+                    return
+                try:
+                    reply = self.query(json.loads(line))
+                except (KeyError, TypeError, ValueError) as err:
+                    reply = {'error': "bad query: {}".format(err)}
+                stream.write(json.dumps(reply).encode() + b"\n")
+        except OSError:
+            pass
+
+    # -------------------------------------------------------------------------
+    def query(self, request):
+        """
+        Answer *request*, a dict whose 'query' is
+
+          'projects', answered by {'projects': [[path, dodo, mtime], ...]}
+          'tasks', answered by {'tasks': [[path, [task, ...], dodo,
+                                           mtime], ...]}
+          'count', answered by {'counts': [[path, {marker: number of
+                                            tasks, ...}, dodo, mtime],
+                                           ...]}
+
+        listing the projects in the order given by 'sort' (see -s), only the
+        first 'limit' of them if that is given. For tasks and count,
+        'project' and 'exact' select projects as PROJECT and --exact do for
+        gh tasks, and 'marker' (a list of marker characters) selects tasks
+        as --marker does. The DODO files are stat'ed first, so the answer is
+        up to date even if the change has not been reported yet.
+        """
+        kind = request['query']
+        if kind not in ('projects', 'tasks', 'count'):
+            return {'error': "unknown query {!r}".format(kind)}
+        with self.lock:
+            self.watch.restat()
+            projs = list(self.watch.projs.values())
+            if kind != 'projects' and request.get('project'):
+                projs = match_projects(projs, request['project'],
+                                       request.get('exact', False))
+            projs = sort_projects(projs, request.get('sort'),
+                                  request.get('limit'))
+            task_ll = self.watch.task_lists(projs)
+        if request.get('marker'):
+            task_ll = [select_tasks(_, request['marker']) for _ in task_ll]
+        if kind == 'projects':
+            return {'projects': [[prj.path, prj.dodo, dodo_time(prj)]
+                                 for prj in projs]}
+        elif kind == 'count':
+            return {'counts': [[prj.path, marker_counts(tl), prj.dodo,
+                                dodo_time(prj)]
+                               for prj, tl in zip(projs, task_ll)]}
+        return {'tasks': [[prj.path, list(tl), prj.dodo, dodo_time(prj)]
+                          for prj, tl in zip(projs, task_ll)]}
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """
+        Stop answering queries and remove the socket
+        """
+        if self.closing:
+            return
+        self.closing = True
+        # accept() is not interrupted by closing the socket, so connect to it
+        daemon_alive(self.path)
+        self.sock.close()
+        if osp.exists(self.path):
+            os.unlink(self.path)
+        with self.lock:
+            self.watch.close()
+
+
+# -----------------------------------------------------------------------------
+def use_daemon(kw):
+    """
+    Return True if gh serve may answer for the options in *kw*
+    """
+    return not any(kw.get(_) for _ in ('rescan', 'no_cache', 'aliases'))
+
+
+# -----------------------------------------------------------------------------
+def daemon_query(root, request):
+    """
+    Send the dict *request* to the gh serve daemon for *root* and return its
+    answer, or None if no daemon answers (or it reports an error)
+    """
+    if root is None:
+        return None
+    path = socket_path(root)
+    if not osp.exists(path):
+        return None
+    import json
+    import socket
+    if TIMINGS is not None:
+        start = time.perf_counter()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(SERVE_TIMEOUT)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile('rb') as stream:
+                reply = json.loads(stream.readline())
+    except (OSError, ValueError):
+        return None
+    if TIMINGS is not None:
+        TIMINGS.add('gh serve query', time.perf_counter() - start)
+    if not isinstance(reply, dict) or 'error' in reply:
+        return None
+    return reply
+
+
+# -----------------------------------------------------------------------------
+def daemon_alive(path):
+    """
+    Return True if something is listening on Unix socket *path*
+    """
+    import socket
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+    except OSError:
+        return False
+    return True
+
+
+# -----------------------------------------------------------------------------
+def socket_path(root):
+    """
+    Return the path of the socket gh serve listens on for *root*
+    """
+    return osp.join(cache_dir(), "serve-{}".format(root_id(root)))
+
+
+# -----------------------------------------------------------------------------
+class Inotify(object):
+    """
+    Just enough of inotify(7), through ctypes, to watch directories for gh
+    tasks --watch
+    """
+    # -------------------------------------------------------------------------
+    def __init__(self, libc, fd):
+        """
+        Wrap inotify instance *fd*, created through the ctypes CDLL *libc*
+        """
+        self.libc = libc
+        self.fd = fd
+        self.wds = {}
+        self.paths = {}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def open(cls):
+        """
+        Return a new Inotify, or None if inotify is not available
+        """
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init = libc.inotify_init1
+        except (AttributeError, OSError):
+            return None
+        fd = init(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    # -------------------------------------------------------------------------
+    def watch(self, paths):
+        """
+        Watch the directories in *paths* and stop watching any others. Return
+        True if any were added.
+        """
+        import ctypes
+        import errno
+        added = False
+        for path in set(self.paths) - set(paths):
+            self.libc.inotify_rm_watch(self.fd, self.paths.pop(path))
+        for path in paths:
+            if path in self.paths:
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                             WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, os.strerror(err), path)
+            self.wds[wd] = path
+            self.paths[path] = wd
+            added = True
+        return added
+
+    # -------------------------------------------------------------------------
+    def read(self, timeout=None):
+        """
+        Wait up to *timeout* seconds (forever if None) for events and return
+        them as (directory path, mask, name) tuples
+        """
+        import select
+        import struct
+        rval = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return rval
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(buf):
+                (wd, mask, _, size) = struct.unpack_from("iIII", buf, pos)
+                name = buf[pos + 16:pos + 16 + size].rstrip(b"\0")
+                pos += 16 + size
+                path = self.wds.get(wd)
+                if mask & IN_IGNORED:
+                    self.paths.pop(self.wds.pop(wd, None), None)
+                if path is not None or mask & IN_Q_OVERFLOW:
+                    rval.append((path, mask, os.fsdecode(name)))
+        return rval
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """
+        Close the inotify instance
+        """
+        os.close(self.fd)
+
+
+# -----------------------------------------------------------------------------
+def redraw(screens):                                         # pragma: no cover
+    """
+    Write each text from *screens* to stdout in place of the one before
+    (clearing the screen first, if stdout is a terminal), until ^C
+    """
+    clear = "\x1b[H\x1b[2J" if sys.stdout.isatty() else ""
+    try:
+        for text in screens:
+            sys.stdout.write(clear + text + "\n")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+
+
+# -----------------------------------------------------------------------------
+def pmap(func, *iterables, jobs=1, procs=False):
+    """
+    Generate func(*args) for each tuple of arguments drawn from *iterables*,
+    in order, like map(). If *jobs* is more than 1, the calls run
+    concurrently in a pool of that many threads (or processes, if *procs* is
+    True) and each result is yielded as soon as it and those before it are
+    ready.
+    """
+    if jobs <= 1:
+        yield from map(func, *iterables)
+        return
+    import concurrent.futures as cf
+    pool_class = cf.ProcessPoolExecutor if procs else cf.ThreadPoolExecutor
+    with pool_class(max_workers=jobs) as pool:
+        yield from pool.map(func, *iterables)
+
+
+# -----------------------------------------------------------------------------
+def emit(lines, fmt='text'):                                 # pragma: no cover
+    """
+    Write *lines* to stdout as they are generated. Text output is followed by
+    the blank line that print() used to add at the end; ndjson lines are
+    flushed one at a time for whoever is reading them.
+    """
+    for line in lines:
+        sys.stdout.write(line)
+        if fmt == 'ndjson':
+            sys.stdout.flush()
+    if fmt == 'text':
+        sys.stdout.write("\n")
+
+
+# -----------------------------------------------------------------------------
+def jobs_opt(kw):
+    """
+    Return the value of --jobs from the option dict *kw* as an int
+    """
+    return int(kw.get('jobs') or 1)
+
+
+# -----------------------------------------------------------------------------
+def limit_opt(kw):
+    """
+    Return the value of --limit from the option dict *kw* as an int, or None
+    """
+    limit = kw.get('limit')
+    return None if limit is None else int(limit)
+
+
+# -----------------------------------------------------------------------------
+@command('version')
+def gh_version_d(**kw):                                      # pragma: no cover
+    """
+    Report the current version
+    """
+    if kw['d']:
+        import pdb
+        pdb.set_trace()
+    print(gh_version_t())
+
+
+# -----------------------------------------------------------------------------
+def gh_version_t():
+    """
+    Retrieve and return the string for gh version
+    """
+    return "gh {}".format(version._v)
+
+
+# -----------------------------------------------------------------------------
+def get_tasks(path):
+    """
+    Get a list of the tasks in dodo file *path*
+    """
+    dofile = dodo_filename(path)
+    if dofile is None:
+        return []
+    return parse_dodo(dofile)
+
+
+# -----------------------------------------------------------------------------
+def parse_dodo(dofile, numbered=False, marks=None):
+    """
+    Read DODO file *dofile* and return a list of the open tasks in it. If
+    *numbered* is True, each item is a (line number, task) tuple instead,
+    giving the line where the task starts. If *marks* is given, only the
+    tasks opened by one of those markers ('>', '^', ...) are kept; the
+    others are skipped, continuation lines and all, like closed tasks. Use
+    task_marker() and task_body() to take a task apart.
+    """
+    import re
+    if TIMINGS is not None:
+        start = time.perf_counter()
+    (keep, drop) = marker_sets(marks)
+    line_match = re.compile(LINE).match
+    task = []
+    task_l = []
+    starts = [0]
+    throw_away = True
+    nlines = 0
+    with open(dofile) as rbl:
+        for nlines, line in enumerate(rbl, 1):
+            match = line_match(line)
+            if match is None:
+                if not throw_away:
+                    task.append(line)
+            elif match.lastgroup == 'mark':
+                pfx = match.group('mark')
+                if pfx in keep:
+                    task_l.append("".join(task))
+                    starts.append(nlines)
+                    throw_away = False
+                    task = [line]
+                elif pfx in drop:
+                    throw_away = True
+        task_l.append("".join(task))
+        if TIMINGS is not None:
+            size = os.fstat(rbl.fileno()).st_size
+
+    if numbered:
+        task_l = [_ for _ in zip(starts, task_l) if _[1]]
+    else:
+        task_l = [_ for _ in task_l if _]
+    if TIMINGS is not None:
+        TIMINGS.add('parse DODO', time.perf_counter() - start,
+                    dodo_bytes_read=size, lines_classified=nlines)
+    return task_l
+
+
+# -----------------------------------------------------------------------------
+def marker_sets(marks=None):
+    """
+    Return the set of task markers (as matched in a line, ' > ' etc.) that
+    open a task to keep, given the marker characters *marks* (None for all
+    open tasks), and the set of those that end the task before and open one
+    to skip
+    """
+    if marks is None:
+        return (ACTIVE_MARKS, CLOSED_MARKS)
+    keep = ACTIVE_MARKS & frozenset(" {} ".format(_) for _ in marks)
+    return (keep, CLOSED_MARKS | (ACTIVE_MARKS - keep))
+
+
+# -----------------------------------------------------------------------------
+def select_tasks(task_l, marks):
+    """
+    Return the tasks in list (or TaskSpans) *task_l* opened by one of the
+    marker characters *marks*
+    """
+    if isinstance(task_l, TaskSpans):
+        return task_l.select(marks)
+    return [_ for _ in task_l if task_marker(_) in marks]
+
+
+# -----------------------------------------------------------------------------
+def task_marker(task):
+    """
+    Return the marker character ('>', '^', ...) that opens *task*, a task as
+    parse_dodo() returns it
+    """
+    return task[1]
+
+
+# -----------------------------------------------------------------------------
+def task_body(task):
+    """
+    Return the text of *task*, a task as parse_dodo() returns it, without its
+    marker or trailing newline
+    """
+    return task[3:].rstrip("\n")
+
+
+# -----------------------------------------------------------------------------
+def marker_counts(task_l):
+    """
+    Return a dict mapping each marker character in list (or TaskSpans)
+    *task_l* to the number of tasks it opens, counted in one pass. The
+    markers of a TaskSpans are counted without reading any task text.
+    """
+    import collections
+    if isinstance(task_l, TaskSpans):
+        counts = collections.Counter(task_l.marks.decode())
+    else:
+        counts = collections.Counter(task_marker(_) for _ in task_l)
+    return dict(sorted(counts.items()))
+
+
+# -----------------------------------------------------------------------------
+class TaskSpans(object):
+    """
+    The open tasks in a DODO file, recorded as (offset, length) byte spans
+    rather than as text. Use TaskSpans.scan() to find them. len() needs no
+    text at all; the text of a task is only read and decoded when it is
+    indexed or iterated over (to display it, say). Iterating gives the same
+    strings as parse_dodo(). The marker of each task is kept (a byte per
+    task), so the tasks can be picked by marker without reading them.
+
+    A task runs from its marker line up to the next line that opens or closes
+    a task. Both kinds of marker are ASCII, so they can be found with one
+    regex search over a memory map of the file.
+    """
+    # -------------------------------------------------------------------------
+    def __init__(self, dofile, offsets, lengths, marks):
+        """
+        Record the spans in arrays *offsets* and *lengths* for *dofile*, and
+        the marker characters of the tasks in bytearray *marks*
+        """
+        self.dofile = dofile
+        self.offsets = offsets
+        self.lengths = lengths
+        self.marks = marks
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def scan(cls, dofile, marks=None):
+        """
+        Memory-map *dofile* and return a TaskSpans for the tasks in it (only
+        those opened by one of the markers *marks*, if that is given). The
+        map is searched a window at a time, and the pages of each window are
+        dropped once it has been searched so a big file does not end up
+        resident.
+        """
+        import array
+        import mmap
+        import re
+        if TIMINGS is not None:
+            begin = time.perf_counter()
+        keep = ACTIVE_BYTES
+        if marks is not None:
+            keep = frozenset(_.encode() for _ in marker_sets(marks)[0])
+        finditer = re.compile(MARKER_BYTES).finditer
+        offsets = array.array('q')
+        lengths = array.array('q')
+        found = bytearray()
+        start = None
+        with open(dofile, 'rb') as rbl:
+            size = os.fstat(rbl.fileno()).st_size
+            if size == 0:
+                return cls(dofile, offsets, lengths, found)
+            buf = mmap.mmap(rbl.fileno(), 0, access=mmap.ACCESS_READ)
+            with buf:
+                pos = 0
+                while pos < size:
+                    end = window_end(buf, pos, size)
+                    if pos == 0 and buf[:3] in keep:
+                        start = 0
+                        found.append(buf[1])
+                    for match in finditer(buf, max(pos - 1, 0), end):
+                        if start is not None:
+                            offsets.append(start)
+                            lengths.append(match.start(1) - start)
+                        start = None
+                        if match.group(1) in keep:
+                            start = match.start(1)
+                            found.append(buf[start + 1])
+                    done = end - end % mmap.PAGESIZE
+                    if hasattr(mmap, 'MADV_DONTNEED') and pos < done:
+                        first = pos - pos % mmap.PAGESIZE
+                        buf.madvise(mmap.MADV_DONTNEED, first, done - first)
+                    pos = end
+        if start is not None:
+            offsets.append(start)
+            lengths.append(size - start)
+        if TIMINGS is not None:
+            TIMINGS.add('scan DODO spans', time.perf_counter() - begin,
+                        dodo_bytes_read=size)
+        return cls(dofile, offsets, lengths, found)
+
+    # -------------------------------------------------------------------------
+    def select(self, marks):
+        """
+        Return a TaskSpans for the tasks opened by one of the marker
+        characters *marks*
+        """
+        import array
+        want = frozenset(_.encode()[0] for _ in marks)
+        picked = [idx for (idx, mark) in enumerate(self.marks)
+                  if mark in want]
+        return TaskSpans(self.dofile,
+                         array.array('q', [self.offsets[_] for _ in picked]),
+                         array.array('q', [self.lengths[_] for _ in picked]),
+                         bytearray(self.marks[_] for _ in picked))
+
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        """
+        The number of tasks
+        """
+        return len(self.offsets)
+
+    # -------------------------------------------------------------------------
+    def __getitem__(self, idx):
+        """
+        Return the text of task *idx*
+        """
+        with open(self.dofile, 'rb') as rbl:
+            rbl.seek(self.offsets[idx])
+            return task_text(rbl.read(self.lengths[idx]))
+
+    # -------------------------------------------------------------------------
+    def __iter__(self):
+        """
+        Generate the text of each task
+        """
+        with open(self.dofile, 'rb') as rbl:
+            for offset, length in zip(self.offsets, self.lengths):
+                rbl.seek(offset)
+                yield task_text(rbl.read(length))
+
+    # -------------------------------------------------------------------------
+    @property
+    def nbytes(self):
+        """
+        The memory used by the spans
+        """
+        return 2 * len(self.offsets) * self.offsets.itemsize + len(self.marks)
+
+
+# -----------------------------------------------------------------------------
+def window_end(buf, pos, size):
+    """
+    Return where the window of *buf* that starts at *pos* ends: just after
+    the last line ending within MMAP_WINDOW bytes, so no task marker is split
+    between windows, or at *size*
+    """
+    end = pos + MMAP_WINDOW
+    if size <= end:
+        return size
+    last = max(buf.rfind(b"\n", pos, end), buf.rfind(b"\r", pos, end))
+    if last < pos:
+        last = min(_ for _ in (buf.find(b"\n", end), buf.find(b"\r", end),
+                               size - 1) if 0 <= _)
+    return last + 1
 
 
 # -----------------------------------------------------------------------------
-def main():
+def task_text(data):
     """
-    Main entry point
+    Decode the bytes *data* of a task span the way parse_dodo() reads the
+    file (universal newlines, locale encoding), dropping the lines after the
+    first that parse_dodo() would skip
     """
-    dispatch(__doc__)
+    import locale
+    import re
+    line_match = re.compile(LINE).match
+    text = data.decode(locale.getpreferredencoding(False))
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = [_ + "\n" for _ in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines[0] + "".join(_ for _ in lines[1:] if not line_match(_))
 
 
 # -----------------------------------------------------------------------------
-@dispatch.on('projects')
-def gh_projects_d(**kw):                                     # pragma: no cover
+def project_tasks(prj, marks=None):
     """
-    List projects in $GH_ROOT
+    Return the list of tasks in the DODO file of Project *prj* (only those
+    opened by one of the markers *marks*, if that is given). For a DODO file
+    of MMAP_MIN bytes or more, this is a TaskSpans, which only reads the
+    text of the tasks when they are shown.
     """
-    if kw['d']:
-        pdb.set_trace()
-    print(gh_projects_t(**kw))
+    if prj.dodo is None:
+        return []
+    if MMAP_MIN <= prj.stat.st_size:
+        return TaskSpans.scan(prj.dodo, marks)
+    return parse_dodo(prj.dodo, marks=marks)
 
 
 # -----------------------------------------------------------------------------
-def gh_projects_t(**kw):
+def dodo_key(prj):
     """
-    Heavy lifting
+    Return the key identifying the contents of the DODO file of Project
+    *prj*: its path, st_mtime_ns and st_size (None if it has no DODO file)
     """
-    rval = ""
-    files = projects(os.getenv("GH_ROOT"), kw['s'])
-    if kw['count']:
-        rval += "{} projects found\n".format(len(files))
-    else:
-        for path, do_stat in files:
-            rval += "    {} {}\n".format(path, do_stat)
-    return rval
+    if prj.stat is None:
+        return None
+    return (prj.dodo, prj.stat.st_mtime_ns, prj.stat.st_size)
 
 
 # -----------------------------------------------------------------------------
-@dispatch.on('tasks')
-def gh_tasks_d(**kw):                                        # pragma: no cover
+def fresh_key(key, now):
     """
-    Show tasks for projects located in $GH_ROOT
+    Return the DODO key *key* (see dodo_key()) to remember for a file read
+    at *now* (ns since the epoch), or None if the file changed too close to
+    then for its mtime to be trusted (a later change in the same tick would
+    not show), so that whatever was read from it is read again next time
     """
-    if kw['d']:
-        pdb.set_trace()
-    print(gh_tasks_t(**kw))
+    if key is None or now <= key[1] + RACY_NS:
+        return None
+    return key
 
 
 # -----------------------------------------------------------------------------
-def gh_tasks_t(**kw):
+class TaskCache(object):
     """
+    Task lists parsed from DODO files, kept in the cache between runs. Each
+    project's entry records the key of its DODO file (see dodo_key()), so
+    the file is only read again when its path, mtime or size changes. When
+    the task text held exceeds *limit* bytes, the least recently used entries
+    are dropped. (Use times are only updated once they are an hour old, so
+    runs that change nothing do not rewrite the cache.)
     """
-    rval = ""
-    sort = kw['s']
-    files = projects(os.getenv("GH_ROOT"), sort=sort)
-    if kw['PROJECT']:
-        files = [_[0] for _ in files if kw['PROJECT'] in _[0]]
-    else:
-        files = [_[0] for _ in files]
+    # -------------------------------------------------------------------------
+    def __init__(self, name="tasks", limit=None):
+        """
+        Load the cache file *name*
+        """
+        self.name = name
+        self.limit = TASK_CACHE_MAX if limit is None else limit
+        self.changed = False
+        data = cache_load(name)
+        self.entries = {}
+        if isinstance(data, dict):
+            if data.get('version') == TASK_CACHE_VERSION:
+                self.entries = data['entries']
 
-    total = 0
-    if kw['count']:
-        for path in files:
-            tl = get_tasks(path)
-            rval += "   {:45s}   {:>5d}\n".format(path, len(tl))
-            total += len(tl)
-        rval += "   {:45s}   {:>5d}\n".format("Total", total)
-    else:
-        for path in files:
-            rval += show_tasks(path)
-    return rval
+    # -------------------------------------------------------------------------
+    def read(self, projs, jobs=1, procs=False, marks=None):
+        """
+        Generate the task list of each Project record in *projs*, in order,
+        parsing only the DODO files that changed since they were cached.
+
+        If *marks* is given, only the tasks opened by one of those markers
+        are kept: cached lists are filtered, and the files that must be read
+        are parsed with the filter (see parse_dodo()), so the other tasks'
+        lines are skipped. Those partial lists are not cached.
+        """
+        now = time.time_ns()
+        keys = [dodo_key(_) for _ in projs]
+        stale = [prj for prj, key in zip(projs, keys)
+                 if key is not None and self.cached(prj.path) != key]
+        read = project_tasks
+        if marks is not None:
+            import functools
+            read = functools.partial(project_tasks, marks=marks)
+        parsed = pmap(read, stale, jobs=jobs, procs=procs)
+        for prj, key in zip(projs, keys):
+            if key is None:
+                task_l = []
+                if self.entries.pop(prj.path, None):
+                    self.changed = True
+            elif self.cached(prj.path) == key:
+                (key, used, task_l) = self.entries[prj.path]
+                if used + LRU_NS < now:
+                    self.entries[prj.path] = (key, now, task_l)
+                    self.changed = True
+                if marks is not None:
+                    task_l = select_tasks(task_l, marks)
+            else:
+                task_l = next(parsed)
+                if marks is None and fresh_key(key, now) is not None:
+                    self.entries[prj.path] = (key, now, task_l)
+                    self.changed = True
+            yield task_l
+
+    # -------------------------------------------------------------------------
+    def cached(self, path):
+        """
+        Return the DODO key cached for project *path*, or None
+        """
+        entry = self.entries.get(path)
+        return entry[0] if entry else None
+
+    # -------------------------------------------------------------------------
+    def save(self):
+        """
+        Drop the least recently used entries until the cache fits in its
+        limit, then write it out if anything changed
+        """
+        if not self.changed:
+            return
+        size = {path: cached_size(entry[2])
+                for path, entry in self.entries.items()}
+        total = sum(size.values())
+        for path in sorted(self.entries, key=lambda p: self.entries[p][1]):
+            if total <= self.limit:
+                break
+            total -= size[path]
+            del self.entries[path]
+        cache_save(self.name, {'version': TASK_CACHE_VERSION,
+                               'entries': self.entries})
 
 
 # -----------------------------------------------------------------------------
-@dispatch.on('version')
-def gh_version_d(**kw):                                      # pragma: no cover
+def cached_size(task_l):
     """
-    Report the current version
+    Return the number of bytes that caching task list *task_l* costs
     """
-    if kw['d']:
-        pdb.set_trace()
-    print(gh_version_t())
+    if isinstance(task_l, TaskSpans):
+        return task_l.nbytes
+    return sum(len(_) for _ in task_l)
 
 
 # -----------------------------------------------------------------------------
-def gh_version_t():
+class GrepIndex(object):
     """
-    Retrieve and return the string for gh version
+    An inverted index of the words in the tasks under a root, kept in the
+    cache between runs. Each task gets a number; each project's entry
+    records the key of its DODO file (see dodo_key()), the number of its
+    first task, how many tasks it has and the words in them, and each word
+    maps to the numbers of the tasks that hold it (as the bytes of an
+    array('I'), so only the lists for the words searched for are ever
+    unpacked). When a DODO file changes, its tasks are renumbered and the
+    lists for their words rebuilt. The task text itself is left to the
+    TaskCache the tasks are read through.
     """
-    return "gh {}".format(version._v)
+    # -------------------------------------------------------------------------
+    def __init__(self, root, fresh=False):
+        """
+        Load the index for *root* (unless *fresh* is True)
+        """
+        self.name = "grep-{}".format(root_id(root))
+        self.root = root
+        self.entries = {}
+        self.postings = {}
+        self.next_id = 0
+        self.words = None
+        self.starts = None
+        self.changed = False
+        data = None if fresh else cache_load(self.name)
+        if isinstance(data, dict) and \
+           data.get('version') == GREP_INDEX_VERSION and \
+           data.get('root') == root:
+            self.entries = data['entries']
+            self.postings = data['postings']
+            self.next_id = data['next_id']
+            self.words = data['words']
+
+    # -------------------------------------------------------------------------
+    def update(self, projs, cache, jobs=1):
+        """
+        Bring the index up to date with the Project records in *projs*:
+        reindex the tasks of the DODO files that changed, read through the
+        TaskCache *cache*, and drop projects that are gone
+        """
+        import array
+        now = time.time_ns()
+        keys = {prj.path: dodo_key(prj) for prj in projs}
+        gone = [path for path in self.entries if keys.get(path) is None]
+        stale = [prj for prj in projs
+                 if keys[prj.path] not in (None, self.cached(prj.path))]
+        if not gone and not stale:
+            return
+        dropped = set()
+        touched = set()
+        for path in gone + [prj.path for prj in stale]:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                dropped.update(range(entry[1], entry[1] + entry[2]))
+                touched.update(entry[3])
+        added = {}
+        for prj, task_l in zip(stale, cache.read(stale, jobs=jobs)):
+            first = self.next_id
+            words = set()
+            for task in task_l:
+                found = set(task_words(task))
+                for word in found:
+                    added.setdefault(word, []).append(self.next_id)
+                words |= found
+                self.next_id += 1
+            self.entries[prj.path] = (fresh_key(keys[prj.path], now), first,
+                                      self.next_id - first, tuple(words))
+        for word in touched.union(added):
+            ids = array.array('I', self.postings.get(word, b""))
+            if word in touched:
+                ids = array.array('I', (_ for _ in ids if _ not in dropped))
+            ids.extend(added.get(word, ()))
+            if ids:
+                self.postings[word] = ids.tobytes()
+            else:
+                self.postings.pop(word, None)
+        self.words = None
+        self.starts = None
+        self.changed = True
+
+    # -------------------------------------------------------------------------
+    def cached(self, path):
+        """
+        Return the DODO key indexed for project *path*, or None
+        """
+        entry = self.entries.get(path)
+        return entry[0] if entry else None
+
+    # -------------------------------------------------------------------------
+    def search(self, terms):
+        """
+        Return a sorted list of (project path, task index) pairs for the
+        tasks that contain all of *terms*. A term ending in '*' matches the
+        words that start with the rest; a term of several words (like
+        'e-mail') needs them all.
+        """
+        hits = None
+        for term in terms:
+            words = task_words(term)
+            for (idx, word) in enumerate(words, 1):
+                if term.endswith("*") and idx == len(words):
+                    found = self.prefixed(word)
+                else:
+                    found = self.ids(word)
+                hits = found if hits is None else hits & found
+                if not hits:
+                    return []
+        return sorted(self.locate(_) for _ in hits or ())
+
+    # -------------------------------------------------------------------------
+    def ids(self, word):
+        """
+        Return the set of the numbers of the tasks that hold *word*
+        """
+        import array
+        return set(array.array('I', self.postings.get(word, b"")))
+
+    # -------------------------------------------------------------------------
+    def prefixed(self, prefix):
+        """
+        Return the set of the numbers of the tasks holding a word that
+        starts with *prefix*
+        """
+        import bisect
+        if self.words is None:
+            self.words = sorted(self.postings)
+        rval = set()
+        for idx in range(bisect.bisect_left(self.words, prefix),
+                         len(self.words)):
+            if not self.words[idx].startswith(prefix):
+                break
+            rval |= self.ids(self.words[idx])
+        return rval
+
+    # -------------------------------------------------------------------------
+    def locate(self, task_id):
+        """
+        Return the (project path, task index) pair for task number *task_id*
+        """
+        import bisect
+        if self.starts is None:
+            # A project with no tasks takes no numbers, and would share its
+            # start with the project numbered after it
+            self.starts = sorted((entry[1], path)
+                                 for (path, entry) in self.entries.items()
+                                 if entry[2])
+        (start, path) = self.starts[bisect.bisect(self.starts,
+                                                  (task_id, "\uffff")) - 1]
+        return (path, task_id - start)
+
+    # -------------------------------------------------------------------------
+    def save(self):
+        """
+        Write the index out if anything changed
+        """
+        if not self.changed:
+            return
+        if self.words is None:
+            self.words = sorted(self.postings)
+        cache_save(self.name, {'version': GREP_INDEX_VERSION,
+                               'root': self.root,
+                               'entries': self.entries,
+                               'postings': self.postings,
+                               'next_id': self.next_id,
+                               'words': self.words})
+        self.changed = False
 
 
 # -----------------------------------------------------------------------------
-def get_tasks(path):
+def task_words(text):
     """
-    Get a list of the tasks in dodo file *path*
+    Return the list of the words (runs of letters, digits and underscores)
+    in *text*, in lower case
     """
-    task = ""
-    task_l = []
-    throw_away = True
-    dofile = dodo_filename(path)
-    if dofile is None:
-        return []
-    with open(dofile) as rbl:
-        for line in rbl:
-            pfl = []
-            if research(r"^\s[-.>^+<x]\s", line, pfl):
-                pfx = pfl[0]
-                if pfx in [" - ", " . ", " > ", " ^ "]:
-                    task_l.append(task)
-                    throw_away = False
-                    task = line
-                elif pfx in [" + ", " < ", " x "]:
-                    throw_away = True
-            elif not is_throw_away(line) and not throw_away:
-                task += line
-        task_l.append(task)
-
-    task_l = [_ for _ in task_l if _]
-    return task_l
+    import re
+    return re.findall(r"\w+", text.lower())
 
 
 # -----------------------------------------------------------------------------
@@ -155,6 +2793,7 @@ def research(needle, haystack, result):
     match was found, return True, else return False. Note that result must be a
     list.
     """
+    import re
     found = re.findall(needle, haystack)
     if found:
         result.append(found[0])
@@ -169,13 +2808,21 @@ def show_tasks(path):
     """
     Show the tasks in dodo file *path*
     """
-    rval = ""
-    task_l = get_tasks(path)
+    return "".join(show_tasks_g(path))
+
+
+# -----------------------------------------------------------------------------
+def show_tasks_g(path, task_l=None):
+    """
+    Generate the lines showing the tasks in dodo file *path*. If the caller
+    has already read them, the tasks can be passed in as *task_l*.
+    """
+    if task_l is None:
+        task_l = get_tasks(path)
     if task_l:
-        rval += "----------- {} ------------\n".format(path)
+        yield "----------- {} ------------\n".format(path)
         for task in task_l:
-            rval += task + "\n"
-    return rval
+            yield task + "\n"
 
 
 # -----------------------------------------------------------------------------
@@ -183,7 +2830,12 @@ def dodo_filename(path):
     """
     Find a 'DODO*' file in *path* and return its full pathname
     """
+    import glob
+    if TIMINGS is not None:
+        start = time.perf_counter()
     globble = glob.glob("{}/DODO*".format(path))
+    if TIMINGS is not None:
+        TIMINGS.add('glob DODO', time.perf_counter() - start)
     if globble:
         return globble[0]
     else:
@@ -195,13 +2847,8 @@ def is_throw_away(line):
     """
     Return True if the line is a throw_away, otherwise False
     """
-    rval = any([line.startswith("--------"),
-                line.strip() == "",
-                line.startswith("#"),
-                re.search(r"^ *-+\s+DONE", line),
-                re.search(r"^-\s+=+\s+DONE", line),
-                re.search(r"^=+\s+DONE", line),
-                ])
+    import re
+    rval = re.match(THROW_AWAY, line) is not None
     return rval
 
 
@@ -215,7 +2862,122 @@ def omit_list():
 
 
 # -----------------------------------------------------------------------------
-def projects(root, sort=None):
+def ignore_for(root):
+    """
+    Return the Ignore for the tree under *root*: directories whose names
+    contain one of OMITS, the projects named by omit_list() and whatever the
+    patterns in *root*/.ghignore leave out
+    """
+    patterns = ["*{}*".format(_) for _ in OMITS] + omit_list()
+    try:
+        with open(osp.join(root, GHIGNORE)) as rbl:
+            patterns.extend(rbl.read().splitlines())
+    except OSError:
+        pass
+    return Ignore(root, patterns)
+
+
+# -----------------------------------------------------------------------------
+class Ignore(object):
+    """
+    Gitignore-style patterns for directories not to search, compiled into a
+    single regex that is matched against each subdirectory's name and path
+    relative to the root, joined by a NUL ("name\\0dir/name"), so patterns
+    that only look at the name never scan the path.
+
+    Blank lines and lines starting with '#' are skipped. A pattern with no
+    '/' but at the end matches a directory name at any depth; one with a
+    '/' at the start or in the middle matches the path from the root. '*'
+    and '?' match within a name, '[...]' matches one of a set of characters
+    and '**' matches any number of directories. As in .gitignore, the last
+    pattern that matches decides: one starting with '!' brings back a
+    directory that an earlier pattern left out.
+    """
+    # -------------------------------------------------------------------------
+    def __init__(self, root, patterns):
+        """
+        Compile *patterns* for the tree under *root*
+        """
+        import re
+        self.root = osp.normpath(os.fspath(root))
+        self.patterns = tuple(_.rstrip() for _ in patterns
+                              if _.strip() and not _.startswith("#"))
+        # Alternatives are tried in order, so putting the last pattern first
+        # makes the group that matches the one that decides. Groups named
+        # 'o...' leave directories out; groups named 'k...' keep them.
+        alts = []
+        for (idx, pat) in reversed(list(enumerate(self.patterns))):
+            kind = 'k' if pat.startswith("!") else 'o'
+            alts.append("(?P<{}{}>{})".format(kind, idx,
+                                              ignore_regex(pat.lstrip("!"))))
+        self.match = None
+        if alts:
+            self.match = re.compile("|".join(alts), re.DOTALL).fullmatch
+
+    # -------------------------------------------------------------------------
+    def prune(self, path, subdirs):
+        """
+        Remove the names the patterns leave out from the list *subdirs* of
+        the subdirectories of *path*, rebuilding it in place
+        """
+        if self.match is None:
+            return
+        rel = path[len(self.root) + 1:] if path != self.root else ""
+        prefix = rel.replace(os.sep, "/") + "/" if rel else ""
+        match = self.match
+        keep = []
+        for name in subdirs:
+            found = match(name + "\0" + prefix + name)
+            if found is None or found.lastgroup[0] == 'k':
+                keep.append(name)
+        subdirs[:] = keep
+
+
+# -----------------------------------------------------------------------------
+def ignore_regex(pattern):
+    """
+    Return the regex for gitignore-style *pattern* (see Ignore), to be
+    matched against "name\\0path", where path is relative to the root
+    """
+    import re
+    anchored = "/" in pattern.rstrip("/")
+    pattern = pattern.strip("/")
+    out = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if pattern.startswith("**/", idx):
+            out.append("(?:.*/)?")
+            idx += 3
+            continue
+        elif pattern.startswith("/**", idx) and idx + 3 == len(pattern):
+            out.append("/.*")
+            idx += 3
+            continue
+        elif char == "*":
+            out.append("[^/\\0]*")
+        elif char == "?":
+            out.append("[^/\\0]")
+        elif char == "[" and "]" in pattern[idx + 2:]:
+            end = pattern.index("]", idx + 2)
+            chars = pattern[idx + 1:end].replace("\\", "\\\\")
+            if chars[0] == "!":
+                chars = "^" + chars[1:]
+            out.append("[{}]".format(chars))
+            idx = end
+        elif char == "\\" and idx + 1 < len(pattern):
+            idx += 1
+            out.append(re.escape(pattern[idx]))
+        else:
+            out.append(re.escape(char))
+        idx += 1
+    rval = "".join(out)
+    return "[^\\0]*\\0" + rval if anchored else rval + "\\0.*"
+
+
+# -----------------------------------------------------------------------------
+def projects(root, sort=None, index=False, rescan=False, jobs=1,
+             aliases=None):
     """
     Return a list of tuples representing project directories. The first element
     of each tuple is the path of the directory. The second element is a string
@@ -224,79 +2986,610 @@ def projects(root, sort=None):
 
     To represent a project, the directory must contain a marker file named
     '.project'.
+
+    See discover() for *index*, *rescan*, *jobs* and *aliases*.
+    """
+    rval = []
+    for prj in sort_projects(discover(root, index=index, rescan=rescan,
+                                      jobs=jobs, aliases=aliases), sort):
+        rval.append((prj.path, '' if prj.dodo else '(no DODO)'))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+async def async_projects(root, sort=None, index=False, rescan=False,
+                         jobs=ASYNC_JOBS, aliases=None):
+    """
+    Generate the tuples projects() would return, without blocking the event
+    loop: the tree is walked (reading directories in *jobs* threads) in the
+    async worker pool.
+    """
+    projs = await offload(discover, root, index=index, rescan=rescan,
+                          jobs=jobs, aliases=aliases)
+    for prj in sort_projects(projs, sort):
+        yield (prj.path, '' if prj.dodo else '(no DODO)')
+
+
+# -----------------------------------------------------------------------------
+async def async_get_tasks(path):
+    """
+    Generate the tasks get_tasks() would return for project *path*, reading
+    the DODO file in the async worker pool
+    """
+    for task in await offload(get_tasks, path):
+        yield task
+
+
+# -----------------------------------------------------------------------------
+async def async_tasks(root, sort=None, index=False):
+    """
+    Generate a (project path, task list) tuple for each project under *root*
+    in the order given by *sort*, as gh tasks reports them. The DODO files
+    are read in the async worker pool, as many at a time as it has threads,
+    and each project is yielded as soon as it and those before it are done.
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    pool = async_pool()
+    projs = sort_projects(await offload(discover, root, index=index,
+                                        jobs=ASYNC_JOBS), sort)
+
+    def task_list(prj):
+        return list(project_tasks(prj))
+
+    pending = collections.deque()
+    for prj in projs:
+        pending.append((prj, loop.run_in_executor(pool, task_list, prj)))
+        if len(pending) < ASYNC_JOBS:
+            continue
+        (done, fut) = pending.popleft()
+        yield (done.path, await fut)
+    while pending:
+        (done, fut) = pending.popleft()
+        yield (done.path, await fut)
+
+
+# -----------------------------------------------------------------------------
+async def offload(func, *args, **kw):
+    """
+    Run func(*args, **kw) in the async worker pool and return its result
+    """
+    import asyncio
+    import functools
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(async_pool(),
+                                      functools.partial(func, *args, **kw))
+
+
+# -----------------------------------------------------------------------------
+def async_pool():
+    """
+    Return the pool of ASYNC_JOBS threads the async API runs blocking calls
+    in, starting it if need be
+    """
+    global ASYNC_POOL
+    if ASYNC_POOL is None:
+        import concurrent.futures as cf
+        ASYNC_POOL = cf.ThreadPoolExecutor(max_workers=ASYNC_JOBS,
+                                           thread_name_prefix="gh-async")
+    return ASYNC_POOL
+
+
+# -----------------------------------------------------------------------------
+def discover(root, index=False, rescan=False, jobs=1, aliases=None):
+    """
+    Return a list of Project records for the project directories under
+    *root*, in walk order. Each record carries the path of the project's DODO
+    file and its stat result (both None if it has none), so nothing needs to
+    look for the DODO file again.
+
+    If *index* is True, the on-disk project index is used to avoid reading
+    directories that have not changed since the last walk. If *rescan* is also
+    True, every directory is read again and the index is rebuilt.
+
+    *jobs* is the number of threads used to read directories.
+
+    Each directory is visited once, however many paths lead to it. If
+    *aliases* is a list, an (alias, path) tuple is appended to it for each
+    path that led to a directory already visited as *path*.
     """
-    plist = []
-    dolist = []
-    omits = ['venv',
-             '__pycache__',
-             'test',
-             'attic',
-             'egg-info',
-             '.git',
-             '.cache',
-             ]
-    for (path, dirs, files) in os.walk(root, followlinks=True):
-        rmables = [d for d in dirs if any(o in d for o in omits)]
-        [dirs.remove(item) for item in rmables]
-        if '.project' in files:
-            plist.append(path)
-            if any('DODO' in _ for _ in files):
-                dolist.append(path)
+    root = os.fspath(root)
+    ignore = ignore_for(root)
+    dirmap = {}
+    if index:
+        dirmap = load_index(root, ignore) if not rescan else {}
+    visited = {}
+    found = []
+    for (path, info) in walk(root, ignore, dirmap, visited, jobs=jobs,
+                             aliases=aliases):
+        if info.project:
+            found.append((path, info.dodo))
+    if index and visited != dirmap:
+        save_index(root, ignore, visited)
+    return make_projects(found, jobs=jobs)
 
+
+# -----------------------------------------------------------------------------
+def make_projects(found, jobs=1):
+    """
+    Turn the (path, DODO file name) tuples in *found* into Project records,
+    stat'ing the DODO files in *jobs* threads
+    """
+    if TIMINGS is not None:
+        start = time.perf_counter()
+    dofiles = [name and osp.join(path, name) for path, name in found]
+    rval = []
+    for (path, _), dofile, st in zip(found, dofiles,
+                                     pmap(dodo_stat, dofiles, jobs=jobs)):
+        rval.append(Project(path, dofile if st else None, st))
+    if TIMINGS is not None:
+        TIMINGS.add('stat DODO', time.perf_counter() - start,
+                    files_stated=sum(1 for _ in dofiles if _))
+    return rval
+
+
+# -----------------------------------------------------------------------------
+def find_projects(root, name, exact=False, index=True, jobs=1):
+    """
+    Return Project records for the projects under *root* that match *name*:
+    those whose path contains *name* or, if *exact* is True, whose directory
+    name (or full path) is *name*. Projects nested in a matching project are
+    matched like any other.
+
+    If *index* is True, the project index for *root* is used for the walk,
+    so only the directories whose mtime changed since it was written are
+    read again, and the index is updated afterwards. With *exact* and a full
+    path for *name*, the walk only descends into the directories leading to
+    that path (and the index is left alone, since the walk is incomplete).
+    """
+    root = os.fspath(root)
+    target = osp.normpath(name) if exact and osp.isabs(name) else None
+
+    def prune(path, info):
+        return not target.startswith(osp.join(osp.normpath(path), ""))
+
+    ignore = ignore_for(root)
+    dirmap = load_index(root, ignore) if index else {}
+    visited = {}
+    found = [(path, info.dodo)
+             for (path, info) in walk(root, ignore, dirmap, visited,
+                                      jobs=jobs, prune=target and prune)
+             if info.project and project_matches(path, name, exact)]
+    if index and target is None and visited != dirmap:
+        save_index(root, ignore, visited)
+    return make_projects(found, jobs=jobs)
+
+
+# -----------------------------------------------------------------------------
+def project_matches(path, name, exact=False):
+    """
+    Return True if the project at *path* matches *name*: its path contains
+    *name* or, if *exact* is True, its directory name (or full path) is *name*
+    """
+    if exact:
+        return name in (path, osp.basename(path))
+    return name in path
+
+
+# -----------------------------------------------------------------------------
+def match_projects(projs, name, exact=False):
+    """
+    Return the Project records in *projs* (in walk order) that match *name*,
+    as find_projects() would
+    """
+    return [_ for _ in projs if project_matches(_.path, name, exact)]
+
+
+# -----------------------------------------------------------------------------
+def dodo_stat(dofile):
+    """
+    Return the stat result for *dofile*, or None if there is no such file
+    """
+    if dofile is None:
+        return None
+    try:
+        return os.stat(dofile)
+    except OSError:
+        return None
+
+
+# -----------------------------------------------------------------------------
+def sort_projects(projs, sort=None, limit=None):
+    """
+    Return the list of Project records *projs* in the order given by *sort*
+    ('alpha', 'old', 'new', or None to leave them in walk order). If *limit*
+    is not None, only the first *limit* of them are returned.
+    """
+    if TIMINGS is not None:
+        start = time.perf_counter()
     if sort == 'alpha':
-        plist = alpha_sort(plist)
+        rval = alpha_sort(projs, key=project_path, limit=limit)
     elif sort == 'old':
-        plist = old_sort(plist)
+        rval = old_sort(projs, key=project_mtime, limit=limit)
     elif sort == 'new':
-        plist = new_sort(plist)
+        rval = new_sort(projs, key=project_mtime, limit=limit)
+    elif limit is not None:
+        import itertools
+        rval = list(itertools.islice(projs, max(limit, 0)))
     else:
-        plist = plist
+        rval = list(projs)
+    if TIMINGS is not None:
+        TIMINGS.add('sort', time.perf_counter() - start,
+                    projects_sorted=len(rval))
+    return rval
 
-    rval = []
-    for path in plist:
-        if path in dolist:
-            rval.append((path, ''))
-        else:
-            rval.append((path, '(no DODO)'))
 
+# -----------------------------------------------------------------------------
+def project_path(prj):
+    """
+    Sort key: the path of Project *prj*
+    """
+    return prj.path
+
+
+# -----------------------------------------------------------------------------
+def dodo_time(prj):
+    """
+    Return the mtime of the DODO file of Project *prj*, or None if it has none
+    """
+    return prj.stat.st_mtime if prj.stat else None
+
+
+# -----------------------------------------------------------------------------
+def project_mtime(prj):
+    """
+    Sort key: the mtime of the DODO file of Project *prj*, or 0 if it has none
+    """
+    return prj.stat.st_mtime if prj.stat else 0
+
+
+# -----------------------------------------------------------------------------
+def walk(root, ignore, dirmap=None, visited=None, jobs=1, aliases=None,
+         prune=None):
+    """
+    Walk the tree under *root* top down (like os.walk(root, followlinks=True)),
+    yielding (path, DirInfo) for each directory. Subdirectories left out by
+    the Ignore *ignore* are not visited.
+
+    Directories are identified by (st_dev, st_ino), so each one is read and
+    reported only once: under its own path if that is in the tree, otherwise
+    under the first symlink the serial walk would reach it by. Other paths to
+    it (symlink loops, several links to one checkout) are not descended into;
+    if *aliases* is a list, (alias, path) pairs are appended to it for them.
+
+    *dirmap* maps directory paths to the DirInfo recorded on an earlier walk.
+    A directory whose mtime still matches its entry is not read again. Every
+    directory read is recorded in *visited*.
+
+    If *jobs* is more than 1, that many threads read directories concurrently,
+    each descending into subdirectories as soon as their parent has been read.
+    The results are still yielded in the order of the serial walk.
+
+    If *prune* is given, the walk does not descend into a directory for which
+    prune(path, info) returns True.
+    """
+    import threading
+    dirmap = dirmap or {}
+    prune = prune or (lambda path, info: False)
+    claimed = set()
+    lock = threading.Lock()
+
+    def lookup(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return (None, None)
+        ino = (st.st_dev, st.st_ino)
+        with lock:
+            if ino in claimed:
+                return (ino, None)
+            claimed.add(ino)
+        return (ino, dir_info(path, ignore, dirmap.get(path), st))
+
+    if TIMINGS is not None:
+        start = (time.perf_counter(), time.time_ns())
+    (top, nodes, links) = scan_tree(root, lookup, jobs, prune)
+
+    # A directory's own path (not through a symlink) wins over the links to
+    # it, so find those first
+    real = {}
+    stack = [(root, top)]
+    while stack:
+        (path, ino) = stack.pop()
+        if ino not in nodes or ino in real:
+            continue
+        real[ino] = path
+        info = nodes[ino][1]
+        if not prune(path, info):
+            stack.extend((osp.join(path, _), links.get((ino, _)))
+                         for _ in reversed(info.subdirs)
+                         if _ not in info.links)
+    if TIMINGS is not None:
+        # Every lookup stat'ed a path; a DirInfo scanned since the start was
+        # read rather than taken from the index
+        TIMINGS.add('walk', time.perf_counter() - start[0],
+                    dirs_visited=len(nodes),
+                    dirs_read=sum(1 for (_, info) in nodes.values()
+                                  if start[1] <= info.scanned),
+                    files_stated=len(links) + 1)
+
+    first = {}
+    stack = [(root, top)]
+    while stack:
+        (path, ino) = stack.pop()
+        if ino not in nodes:
+            continue
+        if ino in first or real.get(ino, path) != path:
+            if aliases is not None:
+                aliases.append((path, first.get(ino, real.get(ino))))
+            continue
+        first[ino] = path
+        (scanned, info) = nodes[ino]
+        if visited is not None:
+            visited[scanned] = info
+        yield (path, info)
+        if not prune(path, info):
+            stack.extend((osp.join(path, _), links.get((ino, _)))
+                         for _ in reversed(info.subdirs))
+
+
+# -----------------------------------------------------------------------------
+def scan_tree(root, lookup, jobs, prune=None):
+    """
+    Call *lookup* on *root* and on every subdirectory of each directory it
+    reads, using a pool of *jobs* threads if *jobs* is more than 1. *lookup*
+    returns the (st_dev, st_ino) of a path and, if it read the directory, a
+    DirInfo for it.
+
+    Subdirectories that are symlinks are only looked up once there is nothing
+    else left to do, so directories in the tree are read under their own
+    (short) paths rather than through chains of links. Directories for which
+    prune(path, info) returns True are not descended into.
+
+    Return a tuple: the id of *root*, a dict mapping directory ids to the
+    (path, DirInfo) they were read as, and a dict mapping (parent id, name)
+    to the id of each subdirectory.
+    """
+    nodes = {}
+    links = {}
+    later = []
+
+    def record(parent, name, path, result):
+        (ino, info) = result
+        if parent is not None:
+            links[(parent, name)] = ino
+        if info is None:
+            return []
+        nodes[ino] = (path, info)
+        if prune and prune(path, info):
+            return []
+        subs = [(ino, _, osp.join(path, _)) for _ in info.subdirs]
+        later.extend(_ for _ in subs if _[1] in info.links)
+        return [_ for _ in subs if _[1] not in info.links]
+
+    top = lookup(root)
+    todo = record(None, None, root, top)
+    if jobs <= 1:
+        while todo or later:
+            if not todo:
+                todo, later[:] = later[::-1], []
+            (parent, name, path) = todo.pop()
+            todo.extend(record(parent, name, path, lookup(path)))
+    else:
+        import concurrent.futures as cf
+        with cf.ThreadPoolExecutor(max_workers=jobs) as pool:
+            pending = {}
+            while todo or later:
+                if todo:
+                    (batch, todo) = (todo, [])
+                else:
+                    (batch, later[:]) = (later[::-1], [])
+                pending.update((pool.submit(lookup, _[2]), _) for _ in batch)
+                while pending:
+                    done, _ = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+                    for fut in done:
+                        (parent, name, path) = pending.pop(fut)
+                        for sub in record(parent, name, path, fut.result()):
+                            pending[pool.submit(lookup, sub[2])] = sub
+    return (top[0], nodes, links)
+
+
+# -----------------------------------------------------------------------------
+def dir_info(path, ignore, known=None, st=None):
+    """
+    Return a DirInfo describing directory *path*, or None if it cannot be read.
+    The subdirectories left out by the Ignore *ignore* are not listed. If
+    *known* is a DirInfo for the same mtime, it is returned as is. *st* is
+    the result of os.stat(path) if the caller already has it.
+    """
+    try:
+        mtime = (st or os.stat(path)).st_mtime_ns
+        if known is not None and known.mtime == mtime:
+            # Changes within the same clock tick as the last read would not
+            # show up in mtime, so only trust entries read after that tick
+            if mtime + RACY_NS < known.scanned:
+                return known
+        scanned = time.time_ns()
+        subdirs = []
+        links = set()
+        files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    subdirs.append(entry.name)
+                    if entry.is_symlink():
+                        links.add(entry.name)
+                else:
+                    files.append(entry.name)
+    except OSError:
+        return None
+
+    ignore.prune(path, subdirs)
+    dodo = next((_ for _ in files if _.startswith("DODO")), None)
+    return DirInfo(mtime, scanned, '.project' in files, dodo, subdirs,
+                   frozenset(links.intersection(subdirs)))
+
+
+# -----------------------------------------------------------------------------
+def cache_dir():
+    """
+    Return the path of the directory where gh keeps its caches: $GH_CACHE if
+    set, otherwise gh under $XDG_CACHE_HOME or ~/.cache
+    """
+    rval = os.getenv("GH_CACHE")
+    if not rval:
+        base = os.getenv("XDG_CACHE_HOME") or osp.expanduser("~/.cache")
+        rval = osp.join(base, "gh")
     return rval
 
 
 # -----------------------------------------------------------------------------
-def alpha_sort(projs):
+def cache_load(name):
+    """
+    Load and return the cached object *name*, or None if it is missing or
+    unreadable
+    """
+    import pickle
+    if TIMINGS is not None:
+        start = time.perf_counter()
+    try:
+        with open(osp.join(cache_dir(), name), 'rb') as rbl:
+            return pickle.load(rbl)
+    except Exception:
+        return None
+    finally:
+        if TIMINGS is not None:
+            TIMINGS.add('load ' + name.split("-")[0],
+                        time.perf_counter() - start)
+
+
+# -----------------------------------------------------------------------------
+def cache_save(name, data):
+    """
+    Write *data* to the cache as *name*. The file is replaced atomically so
+    concurrent readers see either the old or the new version. Failures are
+    ignored since the cache only saves time.
+    """
+    import pickle
+    cdir = cache_dir()
+    tmpname = osp.join(cdir, "{}.{}.tmp".format(name, os.getpid()))
+    try:
+        os.makedirs(cdir, exist_ok=True)
+        with open(tmpname, 'wb') as wbl:
+            pickle.dump(data, wbl, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, osp.join(cdir, name))
+    except OSError:
+        if osp.exists(tmpname):
+            os.unlink(tmpname)
+
+
+# -----------------------------------------------------------------------------
+def index_name(root):
+    """
+    Return the cache file name for the project index of *root*
+    """
+    return "index-{}".format(root_id(root))
+
+
+# -----------------------------------------------------------------------------
+def root_id(root):
+    """
+    Return a short digest of the path *root* for naming files that belong to
+    it
+    """
+    import hashlib
+    return hashlib.sha1(root.encode()).hexdigest()[:16]
+
+
+# -----------------------------------------------------------------------------
+def load_index(root, ignore):
+    """
+    Return the directory map recorded by the last walk of *root*, or an empty
+    dict if there is none or it was built with different ignore patterns
+    """
+    data = cache_load(index_name(root))
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+        return {}
+    if data.get('root') != root or data.get('ignore') != ignore.patterns:
+        return {}
+    return data['dirs']
+
+
+# -----------------------------------------------------------------------------
+def save_index(root, ignore, dirmap):
+    """
+    Record the directory map for *root* in the cache
+    """
+    cache_save(index_name(root), {'version': INDEX_VERSION,
+                                  'root': root,
+                                  'ignore': ignore.patterns,
+                                  'dirs': dirmap})
+
+
+# -----------------------------------------------------------------------------
+def alpha_sort(projs, key=None, limit=None):
     """
-    Sort project paths alphabetically
+    Sort project paths alphabetically. If *projs* holds something other than
+    paths, *key* returns the path of each. If *limit* is not None, only the
+    first *limit* are returned, picked with a heap rather than a full sort.
     """
-    return sorted(projs)
+    if limit is not None:
+        import heapq
+        return heapq.nsmallest(limit, projs, key=key)
+    return sorted(projs, key=key)
 
 
 # -----------------------------------------------------------------------------
-def old_sort(projs):
+def old_sort(projs, key=None, limit=None):
     """
     Sort project paths from oldest to newest by mtime of DODO file. Projects
-    with no DODO file are considered oldest.
+    with no DODO file are considered oldest. *key* returns the DODO mtime of
+    a project (by default, its DODO file is looked up and stat'd). *limit*
+    is as for alpha_sort().
     """
-    pdict = {}
-    for prj in projs:
-        dofile = dodo_filename(prj)
-        if dofile:
-            pdict[prj] = osp.getmtime(dofile)
-        else:
-            pdict[prj] = 0
-    rval = [_[0] for _ in sorted(pdict.items(), key=lambda k: k[1])]
-    return rval
+    if limit is not None:
+        import heapq
+        return heapq.nsmallest(limit, projs, key=key or dodo_mtime)
+    return sorted(projs, key=key or dodo_mtime)
 
 
 # -----------------------------------------------------------------------------
-def new_sort(projs):
+def new_sort(projs, key=None, limit=None):
     """
     Sort projects from most to least recently updated by mtime of DODO file.
-    Projects with no DODO file are considered oldest.
+    Projects with no DODO file are considered oldest. *limit* is as for
+    alpha_sort().
     """
-    rval = old_sort(projs)
+    if limit is not None:
+        # Projects with the same mtime come out in the reverse of their
+        # order in *projs*, just as they do from the reversed sort below
+        import heapq
+        key = key or dodo_mtime
+        top = heapq.nlargest(limit, enumerate(projs),
+                             key=lambda item: (key(item[1]), item[0]))
+        return [_[1] for _ in top]
+    rval = old_sort(projs, key=key)
     return list(reversed(rval))
 
 
+# -----------------------------------------------------------------------------
+def dodo_mtime(path):
+    """
+    Return the mtime of the DODO file in project directory *path*, or 0 if
+    there is none
+    """
+    dofile = dodo_filename(path)
+    if dofile:
+        if TIMINGS is not None:
+            TIMINGS.count(files_stated=1)
+        return osp.getmtime(dofile)
+    return 0
+
+
 # -----------------------------------------------------------------------------
 if __name__ == "__main__":
-    dispatch(__doc__)                                        # pragma: no cover
+    main()                                                   # pragma: no cover
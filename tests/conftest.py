@@ -4,8 +4,12 @@ Customizations for pytest
 This is free and unencumbered software released into the public domain. For
 more details, please visit <http://unlicense.org/>.
 """
+import gh.__main__ as ghm
+import os
 import pdb
 import pytest
+import random
+import types
 
 
 # -----------------------------------------------------------------------------
@@ -44,6 +48,17 @@ def pytest_addoption(parser):
                      help="start debugger on named test or all")
     parser.addoption("--skip", action='append', default=[],
                      help="skip named test(s)")
+    parser.addoption("--bench", action='store_true', default=False,
+                     help="run the benchmarks (tests marked 'bench')")
+
+
+# -----------------------------------------------------------------------------
+def pytest_configure(config):
+    """
+    Register our markers
+    """
+    config.addinivalue_line("markers",
+                            "bench: benchmark, only run with --bench")
 
 
 # -----------------------------------------------------------------------------
@@ -72,6 +87,9 @@ def pytest_runtest_setup(item):
             any([x in item.name for x in skip_l])]):
         pytest.skip('Skipping at user request')
 
+    if 'bench' in item.keywords and not item.config.getvalue('bench'):
+        pytest.skip('Benchmarks only run with --bench')
+
     if dbg_n in dbg_l or '..all' in dbg_l:
         pdb.set_trace()
 
@@ -79,3 +97,191 @@ def pytest_runtest_setup(item):
     if any([item.name in dbg_l,
             'all' in dbg_l] + [x in item.name for x in dbg_l]):
         pytest.dbgfunc = pdb.set_trace
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def gh_cache(tmp_path_factory, monkeypatch):
+    """
+    Keep the caches (and history) written by the code under test out of the
+    user's home directory (and out of the trees the tests walk)
+    """
+    cdir = tmp_path_factory.mktemp("gh_cache")
+    monkeypatch.setenv("GH_CACHE", str(cdir))
+    monkeypatch.setenv("GH_DATA", str(tmp_path_factory.mktemp("gh_data")))
+    return cdir
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def crosslinked(tmpdir):
+    """
+    Build a tree of projects with heavy cross-linking: every project has
+    symlinks to several other projects, to its own group, and back up to the
+    root (a loop). Each real directory should be visited once.
+    """
+    rng = random.Random(17)
+    root = tmpdir.join("xlinked")
+    groups = 10
+    per_group = 20
+    links = 6
+    real = []
+    for gdx in range(groups):
+        for pdx in range(per_group):
+            prj = root.join("group{:02d}".format(gdx),
+                            "proj{:02d}".format(pdx))
+            prj.join(".project").ensure()
+            prj.join("DODO").write(" - task in {}\n".format(prj.basename))
+            prj.join("src", "lib").ensure(dir=True)
+            real.append(prj)
+    nlinks = 0
+    for prj in real:
+        for target in rng.sample(real, links):
+            name = "ln_{}_{}".format(target.dirpath().basename,
+                                     target.basename)
+            os.symlink(target.strpath, prj.join(name).strpath)
+            nlinks += 1
+        os.symlink(prj.dirname, prj.join("ln_group").strpath)
+        os.symlink(root.strpath, prj.join("src", "ln_root").strpath)
+        nlinks += 2
+    return {'root': root, 'projects': real, 'links': nlinks}
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture(params=["sync", "async"])
+def engine(request):
+    """
+    The project and task functions under test: projects() and get_tasks(),
+    or async_projects() and async_get_tasks() run to completion on an event
+    loop. Tests using this fixture check that both give the same answers.
+    """
+    if request.param == "sync":
+        return types.SimpleNamespace(projects=ghm.projects,
+                                     get_tasks=ghm.get_tasks)
+    import asyncio
+
+    def collect(agen):
+        async def run():
+            return [_ async for _ in agen]
+        return asyncio.run(run())
+
+    return types.SimpleNamespace(
+        projects=lambda *a, **kw: collect(ghm.async_projects(*a, **kw)),
+        get_tasks=lambda path: collect(ghm.async_get_tasks(path)))
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def tasks(tmpdir):
+    """
+    Set up a project with some tasks that we can test displaying
+    """
+    task_l = [
+        "",
+        " ^ this is the first task (released)",
+        "   and it has a second line",
+        " > this is the second task (committed)",
+        " . this is the third task (changed, not yet committed)",
+        " - this is the fourth task (not yet made)",
+        "   and this one has a second line also",
+        " + fifth task -- completed",
+        " < sixth task -- moved elsewhere",
+        " x seventh task -- abandoned",
+        "",
+    ]
+    # project dir
+    prjdir = tmpdir.join("myproj")
+
+    # .project file
+    prjdir.join(".project").ensure()
+
+    # DODO file with content
+    dodo = prjdir.join("DODO")
+    dodo.write("\n".join(task_l) + "\n")
+
+    data = {
+        'tmpdir': tmpdir,
+        'prj': prjdir,
+        'dodo': dodo,
+    }
+    return data
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def tasks_empty(tmpdir):
+    """
+    Set up a project with some tasks that we can test displaying
+    """
+    # project dir
+    prjdir = tmpdir.join("myproj")
+
+    # .project file
+    prjdir.join(".project").ensure()
+
+    # this project doesn't have a DODO file
+    data = {
+        'tmpdir': tmpdir,
+        'prj': prjdir,
+        'dodo': None,
+    }
+    return data
+
+
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def prjdirs(tmpdir):
+    """
+    Set up some project directories for testing
+    """
+    pdata = {
+        'apple': {'dtime': 1500},
+        'zagnut': {'dtime': 1400},
+        'frump': {'dtime': 1300},
+        'nododo': {'dtime': -1},
+        'gh': {'dtime': 1200},
+        'tbx': {'dtime': 1000},
+    }
+    for prj in pdata:
+        pd = tmpdir.join(prj)
+        pd.ensure(dir=True)
+        dot = pd.join('.project')
+        dot.ensure()
+        if prj != 'nododo':
+            dodo = pd.join('DODO')
+            dodo.ensure()
+            os.utime(dodo.strpath, (dodo.atime(),
+                                    dodo.mtime() - pdata[prj]['dtime']))
+        pdata[prj]['dir'] = pd
+        pdata[prj]['dot'] = dot
+        pdata[prj]['dodo'] = dodo
+
+    pfruit = {}
+    pfruit['raw'] = pdata
+    pfruit['root'] = tmpdir
+    pfruit['input'] = [pdata[_]['dir'] for _ in pdata]
+    pfruit['asort'] = [pdata[_]['dir']
+                       for _ in ['apple',
+                                 'frump',
+                                 'gh',
+                                 'nododo',
+                                 'tbx',
+                                 'zagnut',
+                                 ]]
+    pfruit['nsort'] = [pdata[_]['dir']
+                       for _ in ['tbx',
+                                 'gh',
+                                 'frump',
+                                 'zagnut',
+                                 'apple',
+                                 'nododo',
+                                 ]]
+    pfruit['osort'] = [pdata[_]['dir']
+                       for _ in ['nododo',
+                                 'apple',
+                                 'zagnut',
+                                 'frump',
+                                 'gh',
+                                 'tbx',
+                                 ]]
+    return pfruit
@@ -5,10 +5,16 @@ For more details, please visit <http://unlicense.org/>.
 from gh import __main__ as ghm
 from gh import version
 import glob
+import json
 import os
+import os.path as osp
 import pytest
+import random
 import re
+import subprocess
+import sys
 import tbx
+import time
 
 
 # -----------------------------------------------------------------------------
@@ -19,6 +25,7 @@ def test_code_quality():
     pytest.dbgfunc()
     globble = sorted(glob.glob("gh/*.py"))
     globble.extend(sorted(glob.glob("tests/*.py")))
+    globble.extend(sorted(glob.glob("benchmarks/*.py")))
     cmd = "flake8 --ignore \"$FLAKE_IGNORE\" {}".format(" ".join(globble))
     result = tbx.run(tbx.expand(cmd))
     assert result == ""
@@ -78,27 +85,714 @@ def test_task_proj(tasks):
 
 
 # -----------------------------------------------------------------------------
-def test_task_markers(tasks, capsys):
+def test_tasks_streaming(tasks, monkeypatch):
+    """
+    gh_tasks_g() yields a project's tasks before reading the next project's
+    DODO file
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    tmpdir.join("other", ".project").ensure()
+    tmpdir.join("other", "DODO").write(" - another task\n")
+    read = []
+    parse_dodo = ghm.parse_dodo
+    monkeypatch.setattr(ghm, 'parse_dodo', lambda path, **kw:
+                        read.append(path) or parse_dodo(path, **kw))
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        lines = ghm.gh_tasks_g(**kw)                                  # payload
+        first = next(lines)
+        assert tasks['prj'].strpath in first
+        assert read == [tasks['dodo'].strpath]
+        rest = "".join(lines)
+        assert len(read) == 2
+        kw['no_cache'] = True
+        assert first + rest == ghm.gh_tasks_t(**kw)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("fmt", ['json', 'ndjson'])
+@pytest.mark.parametrize("count", [True, False])
+def test_tasks_format(tasks, fmt, count):
+    """
+    gh tasks --format json/ndjson gives a record per task (or per project,
+    with --count) holding what the text output shows
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    tmpdir.join("other", ".project").ensure()
+    kw = {'PROJECT': None, 'count': count, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        text = ghm.gh_tasks_t(**kw)
+        kw['format'] = fmt
+        result = ghm.gh_tasks_t(**kw)                                 # payload
+    if fmt == 'json':
+        records = json.loads(result)
+    else:
+        records = [json.loads(_) for _ in result.splitlines()]
+    dodo = tasks['dodo']
+    prj = {'path': tasks['prj'].strpath, 'dodo': dodo.strpath,
+           'mtime': dodo.mtime()}
+    if count:
+        assert records == [dict(prj, count=4, markers={'-': 1, '.': 1,
+                                                       '>': 1, '^': 1}),
+                           {'path': tmpdir.join("other").strpath,
+                            'dodo': None, 'mtime': None, 'count': 0,
+                            'markers': {}}]
+    else:
+        assert [_['marker'] for _ in records] == ['^', '>', '.', '-']
+        for rec in records:
+            assert {_: rec[_] for _ in prj} == prj
+            assert " {} {}\n".format(rec['marker'], rec['text']) in text
+        assert records[0]['text'] == ("this is the first task (released)\n"
+                                      "   and it has a second line")
+
+
+# -----------------------------------------------------------------------------
+def test_tasks_ndjson_streaming(tasks, monkeypatch):
+    """
+    With --format ndjson, a project's task records come out before the next
+    project's DODO file is read
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    tmpdir.join("other", ".project").ensure()
+    tmpdir.join("other", "DODO").write(" - another task\n")
+    read = []
+    parse_dodo = ghm.parse_dodo
+    monkeypatch.setattr(ghm, 'parse_dodo', lambda path, **kw:
+                        read.append(path) or parse_dodo(path, **kw))
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False,
+          'format': 'ndjson'}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        lines = ghm.gh_tasks_g(**kw)                                  # payload
+        first = json.loads(next(lines))
+        assert first['path'] == tasks['prj'].strpath
+        assert read == [tasks['dodo'].strpath]
+        rest = list(lines)
+        assert len(read) == 2
+        assert len(rest) == 4
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("fmt", ['json', 'ndjson'])
+def test_projects_format(prjdirs, fmt):
+    """
+    gh projects --format json/ndjson gives a record per project, and a
+    single count record with --count
+    """
+    pytest.dbgfunc()
+    tmpdir = prjdirs['root']
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': True, 'tasks': False, 'version': False,
+          'format': fmt}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        result = ghm.gh_projects_t(**kw)                              # payload
+        kw['count'] = True
+        count = ghm.gh_projects_t(**kw)
+    if fmt == 'json':
+        records = json.loads(result)
+        count = json.loads(count)
+    else:
+        records = [json.loads(_) for _ in result.splitlines()]
+        count = [json.loads(_) for _ in count.splitlines()]
+    assert [_['path'] for _ in records] == [_.strpath
+                                            for _ in prjdirs['asort']]
+    for rec in records:
+        dodo = prjdirs['raw'][osp.basename(rec['path'])]['dodo']
+        if rec['path'].endswith('nododo'):
+            assert rec['dodo'] is None and rec['mtime'] is None
+        else:
+            assert rec['dodo'] == dodo.strpath
+            assert rec['mtime'] == dodo.mtime()
+    assert count == [{'count': len(records)}]
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("poll", [False, True])
+def test_tasks_watch(tmpdir, monkeypatch, poll):
+    """
+    gh tasks --watch shows the counts, then shows them again when they
+    change, reading only the DODO files that changed
+    """
+    pytest.dbgfunc()
+    if not poll and ghm.Inotify.open() is None:
+        pytest.skip("inotify is not available")
+    project_tree(tmpdir, 6, 50)
+    read = []
+    project_tasks = ghm.project_tasks
+
+    def reading(prj):
+        read.append(prj.path)
+        return project_tasks(prj)
+
+    monkeypatch.setattr(ghm, 'project_tasks', reading)
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False,
+          'watch': True, 'poll': poll, 'interval': '0.05'}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        exp = ghm.gh_tasks_t(**kw)
+        screens = ghm.gh_tasks_watch_g(**kw)
+        assert next(screens) == exp
+
+        read[:] = []
+        prj = tmpdir.join("group2", "proj0002")
+        prj.join("DODO").write(" - one more\n - and another\n", mode='a')
+        result = next(screens)                                        # payload
+        assert read == [prj.strpath]
+        assert result != exp
+        assert result == ghm.gh_tasks_t(**kw)
+
+        read[:] = []
+        new = tmpdir.join("group3", "newproj")
+        new.join(".project").ensure()
+        new.join("DODO").write(" - the first task\n")
+        result = next(screens)
+        assert read == [new.strpath]
+        assert "newproj" in result
+        assert result == ghm.gh_tasks_t(**kw)
+
+        tmpdir.join("group4", "proj0004").remove()
+        result = next(screens)
+        assert "proj0004" not in result
+        assert result == ghm.gh_tasks_t(**kw)
+        screens.close()
+
+
+# -----------------------------------------------------------------------------
+def test_serve(tmpdir, monkeypatch):
+    """
+    While gh serve runs, gh projects and gh tasks get their answers from it,
+    and those answers are the same as they would work out themselves, even
+    right after a DODO file changes
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 12, 50)
+    kws = [{'PROJECT': prj, 'count': count, 'd': False, 's': sort,
+            'projects': False, 'tasks': True, 'version': False,
+            'format': fmt, 'limit': limit}
+           for prj in [None, 'proj0003', 'group1']
+           for count in [True, False]
+           for sort in [None, 'alpha', 'new']
+           for fmt in ['text', 'ndjson']
+           for limit in [None, '2']]
+    pkw = {'count': False, 'd': False, 's': 'alpha', 'projects': True,
+           'tasks': False, 'version': False, 'format': 'json'}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        exp = [ghm.gh_tasks_t(**kw) for kw in kws]
+        pexp = ghm.gh_projects_t(**pkw)
+        server = serving(tmpdir.strpath, poll=True, interval=60)
+        try:
+            for name in ['discover', 'find_projects']:
+                monkeypatch.setattr(ghm, name, None)
+            result = [ghm.gh_tasks_t(**kw) for kw in kws]             # payload
+            assert result == exp
+            assert ghm.gh_projects_t(**pkw) == pexp
+
+            dodo = tmpdir.join("group5", "proj0005", "DODO")
+            dodo.write(" - one more\n", mode='a')
+            result = ghm.gh_tasks_t(**kws[0])
+            monkeypatch.undo()
+        finally:
+            server.close()
+        assert result == ghm.gh_tasks_t(**kws[0])
+        assert result != exp[0]
+
+
+# -----------------------------------------------------------------------------
+def test_serve_stale(tmpdir):
+    """
+    A socket left behind by a gh serve that is no longer running is ignored
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 3, 20)
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': None,
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        exp = ghm.gh_tasks_t(**kw)
+        server = serving(tmpdir.strpath)
+        server.closing = True
+        server.sock.close()
+        assert os.path.exists(server.path)
+        assert ghm.gh_tasks_t(**kw) == exp                            # payload
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.bench
+def test_bench_serve(tmpdir):
+    """
+    gh serve answers a count query on 1000 projects in under 10ms
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 1000, 20)
+    server = serving(tmpdir.strpath)
+    try:
+        elapsed = []
+        for _ in range(20):
+            start = time.perf_counter()
+            reply = ghm.daemon_query(tmpdir.strpath,
+                                     {'query': 'count'})              # payload
+            elapsed.append(time.perf_counter() - start)
+    finally:
+        server.close()
+    assert len(reply['counts']) == 1000
+    print("\n1000 projects: count query {:.2f}ms (median)"
+          "".format(1000 * sorted(elapsed)[10]))
+    assert sorted(elapsed)[10] < 0.010
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("jobs, procs", [
+    pytest.param('4', False, id="threads"),
+    pytest.param('3', True, id="processes"),
+])
+@pytest.mark.parametrize("count", [True, False])
+def test_tasks_jobs(tmpdir, jobs, procs, count):
+    """
+    Reading DODO files in a pool gives the same output as reading them one
+    after another
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 30, 40)
+    kw = {'PROJECT': None, 'count': count, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        exp = ghm.gh_tasks_t(**kw)
+        kw.update(jobs=jobs, procs=procs)
+        result = ghm.gh_tasks_t(**kw)                                 # payload
+        assert result == exp
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.bench
+def test_bench_tasks_jobs(tmpdir):
+    """
+    Time gh tasks --count over 1000 projects, serially and with pools
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 1000, 300)
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': None,
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        ghm.gh_projects_t(**kw)
+        report = "\n"
+        for (jobs, procs) in [(1, False), (8, False), (4, True)]:
+            kw.update(jobs=jobs, procs=procs)
+            start = time.perf_counter()
+            result = ghm.gh_tasks_t(**kw)                             # payload
+            elapsed = time.perf_counter() - start
+            report += "jobs={} procs={}: {:.3f}s\n".format(jobs, procs,
+                                                           elapsed)
+            if jobs == 1:
+                exp = result
+            assert result == exp
+        print(report)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("count", [True, False])
+def test_tasks_cache(tasks, monkeypatch, count):
+    """
+    Once a DODO file has been parsed, later runs take its tasks from the cache
+    until its mtime or size changes. --no-cache reads it every time.
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    dodo = tasks['dodo']
+    read = []
+    parse_dodo = ghm.parse_dodo
+    monkeypatch.setattr(ghm, 'parse_dodo', lambda path, **kw:
+                        read.append(path) or parse_dodo(path, **kw))
+    kw = {'PROJECT': None, 'count': count, 'd': False, 's': None,
+          'projects': False, 'tasks': True, 'version': False}
+    os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        exp = ghm.gh_tasks_t(**kw)
+        assert ghm.gh_tasks_t(**kw) == exp                            # payload
+        assert read == [dodo.strpath]
+
+        kw['no_cache'] = True
+        assert ghm.gh_tasks_t(**kw) == exp
+        assert len(read) == 2
+
+        del kw['no_cache']
+        dodo.write(" - one more task\n", mode='a')
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+        result = ghm.gh_tasks_t(**kw)
+        assert len(read) == 3
+        assert result != exp
+
+
+# -----------------------------------------------------------------------------
+def test_tasks_cache_evict(tmpdir):
+    """
+    When the cached task text exceeds the limit, the least recently used
+    entries are dropped
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 6, 50)
+    for dodo in tmpdir.visit("DODO"):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    projs = ghm.sort_projects(ghm.discover(tmpdir), 'alpha')
+    cache = ghm.TaskCache()
+    sizes = [sum(len(_) for _ in task_l) for task_l in cache.read(projs)]
+    for path, (key, used, task_l) in cache.entries.items():
+        cache.entries[path] = (key, 0, task_l)
+    cache.save()
+
+    cache = ghm.TaskCache(limit=sum(sizes[-2:]))
+    list(cache.read(projs[-2:]))                                      # payload
+    cache.save()
+    assert sorted(ghm.TaskCache().entries) == [_.path for _ in projs[-2:]]
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sort", ['old', 'new'])
+def test_tasks_no_glob(tasks, monkeypatch, sort):
+    """
+    The DODO file found while walking the tree is carried through sorting and
+    parsing, so nothing looks for it again
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    tmpdir.join("other", ".project").ensure()
+    tmpdir.join("other", "DODO.d", "notes").ensure()
+    tmpdir.join("other", "DODO").write(" - another task\n")
+
+    def no_glob(pattern):
+        raise AssertionError("glob({}) called".format(pattern))
+    monkeypatch.setattr(glob, 'glob', no_glob)
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': sort,
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        result = ghm.gh_tasks_t(**kw)                                 # payload
+        assert re.search(r"other\s+1\n", result)
+        assert re.search(r"Total\s+5\n", result)
+
+
+# -----------------------------------------------------------------------------
+def test_tasks_project_index(tasks, monkeypatch):
+    """
+    With an index in place, gh tasks PROJECT only reads the directories that
+    changed since, and still finds a matching project created since
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    tmpdir.join("other", ".project").ensure()
+    for path in [tmpdir] + list(tmpdir.visit(lambda _: _.check(dir=1))):
+        os.utime(path.strpath, (path.atime(), path.mtime() - 10))
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': None,
+          'projects': False, 'tasks': True, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        ghm.gh_tasks_t(**kw)
+        tmpdir.join("myproj_new", ".project").ensure()
+        scandir = os.scandir
+        read = []
+        monkeypatch.setattr(ghm.os, 'scandir',
+                            lambda path: read.append(path) or scandir(path))
+        kw['PROJECT'] = 'myproj'
+        result = ghm.gh_tasks_t(**kw)                                 # payload
+        assert re.search(r"myproj\s+4\n", result)
+        assert re.search(r"myproj_new\s+0\n", result)
+        assert "other" not in result
+        assert tmpdir.join("other").strpath not in read
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("name, exact, exp", [
+    pytest.param('myproj', False,
+                 ['myproj', 'myproj/nested', 'myproj2', 'x/myproj'],
+                 id="substring"),
+    pytest.param('myproj', True, ['myproj', 'x/myproj'], id="exact"),
+    pytest.param('x/myproj', True, ['x/myproj'], id="exact_path"),
+])
+def test_find_projects(tasks, monkeypatch, name, exact, exp):
+    """
+    find_projects() finds the projects gh tasks PROJECT reports on, nested
+    ones included, the same as match_projects() does from a full discover().
+    Given the full path of a project with *exact*, it does not descend into
+    directories that do not lead to it.
+    """
+    pytest.dbgfunc()
+    tmpdir = tasks['tmpdir']
+    for path in ['myproj2', 'x/myproj', 'myproj/nested', 'other']:
+        tmpdir.join(path, ".project").ensure()
+    if "/" in name:
+        name = tmpdir.join(name).strpath
+    scandir = os.scandir
+    read = []
+    monkeypatch.setattr(ghm.os, 'scandir',
+                        lambda path: read.append(path) or scandir(path))
+    result = ghm.find_projects(tmpdir, name, exact=exact,
+                               index=False)                           # payload
+    assert sorted(_.path for _ in result) == [tmpdir.join(_).strpath
+                                              for _ in exp]
+    if "/" in name:
+        assert tmpdir.join("myproj", "nested").strpath not in read
+    assert [_.path for _ in result] == \
+        [_.path for _ in ghm.match_projects(ghm.discover(tmpdir), name,
+                                            exact)]
+
+
+# -----------------------------------------------------------------------------
+def test_task_markers(tasks, engine):
     """
     Use all potential task markers to identify tasks
     """
     pytest.dbgfunc()
     path = tasks['prj'].strpath
-    task_l = ghm.get_tasks(path)
+    task_l = engine.get_tasks(path)
     assert len(task_l) == 4
 
 
 # -----------------------------------------------------------------------------
-def test_get_tasks_empty(tasks_empty):
+def test_get_tasks_empty(tasks_empty, engine):
     """
     Make get_tasks() return an empty list because no tasks are present
     """
     pytest.dbgfunc()
     path = tasks_empty['prj'].strpath
-    task_l = ghm.get_tasks(path)
+    task_l = engine.get_tasks(path)
     assert task_l == []
 
 
+# -----------------------------------------------------------------------------
+def test_get_tasks_legacy(tmpdir, engine):
+    """
+    get_tasks() finds exactly the tasks the original regex-per-line parser
+    found in a DODO file full of odd lines
+    """
+    pytest.dbgfunc()
+    prjdir = tmpdir.join("mixed")
+    dodo = synthetic_dodo(prjdir.join("DODO"), 5000, seed=3)
+    result = engine.get_tasks(prjdir.strpath)                         # payload
+    assert result == legacy_get_tasks(dodo.strpath)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.bench
+def test_bench_get_tasks(tmpdir):
+    """
+    Time get_tasks() against the original parser on a 100k line DODO file
+    """
+    pytest.dbgfunc()
+    prjdir = tmpdir.join("big")
+    dodo = synthetic_dodo(prjdir.join("DODO"), 100000, seed=5)
+    start = time.perf_counter()
+    exp = legacy_get_tasks(dodo.strpath)
+    legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    result = ghm.get_tasks(prjdir.strpath)                            # payload
+    elapsed = time.perf_counter() - start
+    print("\n100k lines, {} tasks: legacy {:.3f}s, get_tasks {:.3f}s"
+          "".format(len(result), legacy, elapsed))
+    assert result == exp
+    assert elapsed < legacy
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+@pytest.mark.parametrize("seed, window", [(0, None), (1, 100), (2, 7)])
+def test_task_spans(tmpdir, monkeypatch, newline, seed, window):
+    """
+    TaskSpans.scan() finds the same tasks as parse_dodo() whatever the line
+    endings and however the file is split into windows, and len() does not
+    read the task text
+    """
+    pytest.dbgfunc()
+    if window:
+        monkeypatch.setattr(ghm, "MMAP_WINDOW", window)
+    dodo = synthetic_dodo(tmpdir.join("DODO"), 2000, seed=seed)
+    dodo.write_binary(dodo.read().replace("\n", newline).encode())
+    exp = ghm.parse_dodo(dodo.strpath)
+    spans = ghm.TaskSpans.scan(dodo.strpath)                          # payload
+    dodo.rename(tmpdir.join("moved"))
+    assert len(spans) == len(exp)
+    tmpdir.join("moved").rename(dodo)
+    assert list(spans) == exp
+    assert spans[len(exp) // 2] == exp[len(exp) // 2]
+
+
+# -----------------------------------------------------------------------------
+def test_task_spans_empty(tmpdir):
+    """
+    An empty DODO file cannot be memory-mapped but has no tasks
+    """
+    pytest.dbgfunc()
+    dodo = tmpdir.join("DODO")
+    dodo.ensure()
+    assert list(ghm.TaskSpans.scan(dodo.strpath)) == []               # payload
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("marks, exp", [
+    pytest.param(">", [(4, " > two\n   cont\n"), (9, " > four\n")],
+                 id="one"),
+    pytest.param("^-", [(1, " - one\n   more\n"), (6, " ^ three\n")],
+                 id="two"),
+    pytest.param("", [], id="none"),
+])
+def test_parse_dodo_marks(tmpdir, marks, exp):
+    """
+    parse_dodo() and TaskSpans.scan() given *marks* keep only the tasks those
+    markers open, and skip the lines of the others
+    """
+    pytest.dbgfunc()
+    dodo = tmpdir.join("DODO")
+    dodo.write(" - one\n   more\n\n > two\n   cont\n ^ three\n + done\n"
+               "   gone\n > four\n . five\n   also\n")
+    assert ghm.parse_dodo(dodo.strpath, numbered=True,
+                          marks=list(marks)) == exp               # payload
+    spans = ghm.TaskSpans.scan(dodo.strpath, list(marks))
+    assert list(spans) == [_[1] for _ in exp]
+    assert list(ghm.TaskSpans.scan(dodo.strpath).select(marks)) == \
+        [_[1] for _ in exp]
+
+
+# -----------------------------------------------------------------------------
+def test_marker_counts(tmpdir):
+    """
+    task_marker() and task_body() take a task apart, and marker_counts()
+    counts the tasks of each marker the same for a task list and a TaskSpans
+    """
+    pytest.dbgfunc()
+    dodo = tmpdir.join("DODO")
+    dodo.write(" - one\n   more\n > two\n ^ three\n + done\n > four\n")
+    task_l = ghm.parse_dodo(dodo.strpath)
+    assert [ghm.task_marker(_) for _ in task_l] == ['-', '>', '^', '>']
+    assert ghm.task_body(task_l[0]) == "one\n   more"
+    exp = {'-': 1, '>': 2, '^': 1}
+    assert ghm.marker_counts(task_l) == exp                       # payload
+    assert ghm.marker_counts(ghm.TaskSpans.scan(dodo.strpath)) == exp
+    assert ghm.marker_counts([]) == {}
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("how", ["cache", "no_cache", "serve"])
+@pytest.mark.parametrize("count", [True, False])
+def test_tasks_marker(tmpdir, how, count):
+    """
+    gh tasks --marker shows (or counts) only the tasks those markers open,
+    from the cache, reading the DODO files, or asking gh serve
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 6, 40)
+    for dodo in tmpdir.visit("DODO"):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    kw = {'PROJECT': None, 'count': count, 'd': False, 's': 'alpha',
+          'root': [tmpdir.strpath], 'no_cache': how == "no_cache"}
+    rows = []
+    for prj in ghm.sort_projects(ghm.discover(tmpdir.strpath), 'alpha'):
+        tasks = [_ for _ in ghm.get_tasks(prj.path)
+                 if ghm.task_marker(_) in ">^"]
+        rows.append((prj.path, prj.dodo, None,
+                     ghm.marker_counts(tasks) if count else tasks))
+    exp = "".join(ghm.tasks_report_g(rows, count))
+    ghm.gh_tasks_t(**kw)
+    server = None
+    if how == "serve":
+        server = serving(tmpdir.strpath, poll=True, interval=60)
+    try:
+        assert ghm.gh_tasks_t(**dict(kw, marker=">^")) == exp     # payload
+    finally:
+        if server is not None:
+            server.close()
+
+
+# -----------------------------------------------------------------------------
+def test_tasks_marker_cache(tmpdir, monkeypatch):
+    """
+    With the cache, gh tasks --marker parses the DODO files it has to read
+    with the filter, filters the cached ones, and caches no partial list
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 4, 40)
+    for dodo in tmpdir.visit("DODO"):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'root': [tmpdir.strpath]}
+    ghm.gh_tasks_t(**kw)
+    dodo = tmpdir.join("group1", "proj0001", "DODO")
+    dodo.write(dodo.read() + " - one more\n > and another\n")
+    os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    exp = ghm.gh_tasks_t(**dict(kw, marker=">^", no_cache=True))
+    read = []
+    project_tasks = ghm.project_tasks
+
+    def reading(prj, marks=None):
+        read.append((prj.path, marks))
+        return project_tasks(prj, marks=marks)
+
+    monkeypatch.setattr(ghm, 'project_tasks', reading)
+    result = ghm.gh_tasks_t(**dict(kw, marker=">^"))                  # payload
+    assert read == [(dodo.dirname, [">", "^"])]
+    assert result == exp
+    assert "and another" in result and "one more" not in result
+    del read[:]
+    assert "one more" in ghm.gh_tasks_t(**kw)
+    assert read == [(dodo.dirname, None)]
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("count", [True, False])
+def test_tasks_spans(tmpdir, monkeypatch, count):
+    """
+    With DODO files over MMAP_MIN, gh tasks reports the same thing, both
+    from a fresh parse and from the cache
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 12, 300)
+    for dodo in tmpdir.visit("DODO"):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    kw = {'PROJECT': None, 'count': count, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False,
+          'no_cache': True}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        exp = ghm.gh_tasks_t(**kw)
+        monkeypatch.setattr(ghm, "MMAP_MIN", 1)
+        assert ghm.gh_tasks_t(**kw) == exp                            # payload
+        kw['no_cache'] = False
+        assert ghm.gh_tasks_t(**kw) == exp
+        assert ghm.gh_tasks_t(**kw) == exp
+    path = tmpdir.join("group0", "proj0000").strpath
+    assert isinstance(ghm.TaskCache().entries[path][2], ghm.TaskSpans)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.bench
+def test_bench_task_spans(tmpdir):
+    """
+    Compare peak memory and wall time of counting the tasks in a 256 MiB
+    DODO file with parse_dodo() and with TaskSpans
+    """
+    pytest.dbgfunc()
+    chunk = synthetic_dodo(tmpdir.join("chunk"), 20000, seed=11).read()
+    reps = 256 * 2**20 // len(chunk)
+    dodo = tmpdir.join("DODO")
+    with open(dodo.strpath, "w") as wbl:
+        for _ in range(reps):
+            wbl.write(chunk)
+    code = ("import resource, sys, time; import gh.__main__ as ghm; "
+            "start = time.perf_counter(); "
+            "count = len(ghm.{}(sys.argv[1])); "
+            "print(count, time.perf_counter() - start, "
+            "resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)")
+    result = {}
+    for func in ["parse_dodo", "TaskSpans.scan"]:
+        out = subprocess.check_output([sys.executable, "-c",
+                                       code.format(func), dodo.strpath])
+        count, wall, rss = out.split()
+        result[func] = (int(count), float(wall), int(rss))
+        print("\n{:15s} {} tasks  {:7.2f}s  {:8d} KiB peak RSS"
+              "".format(func, *result[func]))
+    assert result["TaskSpans.scan"][0] == result["parse_dodo"][0]
+    assert result["TaskSpans.scan"][1] < result["parse_dodo"][1]
+    assert result["TaskSpans.scan"][2] < result["parse_dodo"][2] / 2
+
+
 # -----------------------------------------------------------------------------
 @pytest.mark.parametrize("inp, exp", [
     pytest.param("----------", True, id="throw away: hyphen lines"),
@@ -150,6 +844,197 @@ def test_projects_count(prjdirs):
         assert result == exp
 
 
+# -----------------------------------------------------------------------------
+def test_projects_index(prjdirs, gh_cache, monkeypatch):
+    """
+    A second run of gh_projects_t() reuses the project index written by the
+    first instead of reading the directories again
+    """
+    pytest.dbgfunc()
+    tmpdir = prjdirs['root']
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': True, 'tasks': False, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        first = ghm.gh_projects_t(**kw)
+        assert len(os.listdir(str(gh_cache))) == 1
+
+        # backdate the directories so their index entries can be trusted
+        for path in [tmpdir] + prjdirs['input']:
+            os.utime(path.strpath, (path.atime(), path.mtime() - 10))
+        ghm.gh_projects_t(**kw)
+
+        def no_scandir(path):
+            raise AssertionError("{} was read again".format(path))
+        monkeypatch.setattr(ghm.os, 'scandir', no_scandir)
+        assert ghm.gh_projects_t(**kw) == first
+
+
+# -----------------------------------------------------------------------------
+def test_projects_index_update(prjdirs):
+    """
+    A project added after the index was written is found on the next run, and
+    --rescan gives the same answer as the index
+    """
+    pytest.dbgfunc()
+    tmpdir = prjdirs['root']
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': True, 'tasks': False, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        ghm.gh_projects_t(**kw)
+        tmpdir.join("newproj", ".project").ensure()
+        result = ghm.gh_projects_t(**kw)
+        assert "newproj (no DODO)" in result
+        kw['rescan'] = True
+        assert ghm.gh_projects_t(**kw) == result
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("jobs", [2, 8])
+def test_projects_jobs(prjdirs, jobs):
+    """
+    Reading directories in parallel gives the same projects in the same order
+    as the serial walk, including those behind a symlink at the top of the
+    tree
+    """
+    pytest.dbgfunc()
+    root = prjdirs['root']
+    for prj in ['apple', 'gh']:
+        for sub in ['src', 'docs', 'lib']:
+            root.join(prj, sub, 'deeper', '.project').ensure()
+    outside = root.dirpath().join("outside")
+    outside.join("ext", ".project").ensure()
+    os.symlink(outside.strpath, root.join("link").strpath)
+    assert root.join("link", "ext").strpath in \
+        [_[0] for _ in ghm.projects(root, jobs=jobs)]
+    for stype in [None, 'alpha', 'old', 'new']:
+        exp = ghm.projects(root, sort=stype)
+        result = ghm.projects(root, sort=stype, jobs=jobs)            # payload
+        assert result == exp
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_projects_crosslinked(crosslinked, jobs):
+    """
+    Symlink loops and several links to one project neither hang the walk nor
+    report a project twice. Every extra path is reported as an alias.
+    """
+    pytest.dbgfunc()
+    aliases = []
+    result = ghm.projects(crosslinked['root'], sort='alpha', jobs=jobs,
+                          aliases=aliases)                            # payload
+    assert [_[0] for _ in result] == sorted(_.strpath
+                                            for _ in crosslinked['projects'])
+    assert len(aliases) == crosslinked['links']
+    serial = []
+    ghm.projects(crosslinked['root'], aliases=serial)
+    assert sorted(aliases) == sorted(serial)
+
+
+# -----------------------------------------------------------------------------
+def test_projects_aliases(prjdirs):
+    """
+    gh projects --aliases lists the second path to a project
+    """
+    pytest.dbgfunc()
+    tmpdir = prjdirs['root']
+    os.symlink(tmpdir.join("apple").strpath, tmpdir.join("zz_link").strpath)
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': True, 'tasks': False, 'version': False,
+          'aliases': True}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        result = ghm.gh_projects_t(**kw)
+        assert "zz_link (no DODO)" not in result
+        exp = "{} -> {} (alias)".format(tmpdir.join("zz_link"),
+                                        tmpdir.join("apple"))
+        assert exp in result
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.bench
+@pytest.mark.parametrize("jobs", [1, 8])
+def test_bench_crosslinked(crosslinked, jobs):
+    """
+    Time the walk of a heavily cross-linked tree
+    """
+    pytest.dbgfunc()
+    start = time.perf_counter()
+    result = ghm.projects(crosslinked['root'], jobs=jobs)             # payload
+    elapsed = time.perf_counter() - start
+    print("\n{} projects, {} links, jobs={}: {:.3f}s"
+          "".format(len(result), crosslinked['links'], jobs, elapsed))
+    assert len(result) == len(crosslinked['projects'])
+
+
+# -----------------------------------------------------------------------------
+def test_async_projects_nonblocking(prjdirs, monkeypatch):
+    """
+    While async_projects() waits for the walk, the event loop keeps running
+    """
+    pytest.dbgfunc()
+    asyncio = pytest.importorskip("asyncio")
+    discover = ghm.discover
+
+    def slow_discover(*args, **kw):
+        time.sleep(0.3)
+        return discover(*args, **kw)
+
+    monkeypatch.setattr(ghm, 'discover', slow_discover)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        tick = asyncio.ensure_future(ticker())
+        result = [_ async for _ in ghm.async_projects(prjdirs['root'])]
+        tick.cancel()
+        return result
+
+    result = asyncio.run(run())                                       # payload
+    assert result == ghm.projects(prjdirs['root'])
+    assert len(ticks) > 10
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sort", [None, 'alpha', 'new'])
+def test_async_tasks(tmpdir, monkeypatch, sort):
+    """
+    async_tasks() yields each project's tasks in project order, reading no
+    more than ASYNC_JOBS DODO files at a time
+    """
+    pytest.dbgfunc()
+    asyncio = pytest.importorskip("asyncio")
+    project_tree(tmpdir, 20, 200)
+    exp = [(path, ghm.get_tasks(path))
+           for (path, _) in ghm.projects(tmpdir, sort=sort)]
+    monkeypatch.setattr(ghm, 'ASYNC_POOL', None)
+    monkeypatch.setattr(ghm, 'ASYNC_JOBS', 3)
+    project_tasks = ghm.project_tasks
+    busy = [0, 0]
+
+    def reading(prj):
+        busy[0] += 1
+        busy[1] = max(busy)
+        time.sleep(0.01)
+        busy[0] -= 1
+        return project_tasks(prj)
+
+    monkeypatch.setattr(ghm, 'project_tasks', reading)
+
+    async def run():
+        return [_ async for _ in ghm.async_tasks(tmpdir, sort=sort)]
+
+    try:
+        result = asyncio.run(run())                                   # payload
+    finally:
+        ghm.async_pool().shutdown()
+    assert result == exp
+    assert 1 < busy[1] <= 3
+
+
 # -----------------------------------------------------------------------------
 def test_omit_list():
     """
@@ -189,12 +1074,12 @@ def test_dodo_filename_n(dodo_nosuch):
     pytest.param('new', 'nsort'),
     pytest.param('old', 'osort'),
 ])
-def test_projects_sorts(prjdirs, stype, sname):
+def test_projects_sorts(prjdirs, engine, stype, sname):
     """
     Test an alpha sort through ghm.projects()
     """
     pytest.dbgfunc()
-    result = ghm.projects(prjdirs['root'], sort=stype)                # payload
+    result = engine.projects(prjdirs['root'], sort=stype)             # payload
     for path in prjdirs[sname]:
         dirstat = '(no DODO)' if 'nododo' in path.strpath else ''
         try:
@@ -220,16 +1105,717 @@ def test_sorts(prjdirs, func, sname):
 
 
 # -----------------------------------------------------------------------------
-def test_no_sort(prjdirs):
+@pytest.mark.parametrize("sort", [None, 'alpha', 'old', 'new'])
+@pytest.mark.parametrize("limit", [0, 1, 4, 20])
+def test_sort_limit(sort, limit):
+    """
+    Sorting with a limit gives the first *limit* projects of the full sort,
+    ties and all
+    """
+    pytest.dbgfunc()
+    rng = random.Random(limit)
+    projs = [ghm.Project("/p/{:02d}".format(rng.randrange(8)), None,
+                         os.stat_result([0] * 8 + [rng.randrange(4), 0]))
+             for _ in range(12)]
+    exp = ghm.sort_projects(projs, sort)[:limit]
+    assert ghm.sort_projects(projs, sort, limit) == exp               # payload
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sort", ['alpha', 'new', 'old'])
+def test_tasks_limit(tmpdir, monkeypatch, sort):
+    """
+    gh tasks --limit N reports the first N projects of the full report and
+    reads only their DODO files
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 12, 30)
+    for idx, dodo in enumerate(sorted(tmpdir.visit("DODO"))):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 100 * idx))
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': sort,
+          'projects': False, 'tasks': True, 'version': False,
+          'no_cache': True}
+    read = []
+    parse_dodo = ghm.parse_dodo
+    monkeypatch.setattr(ghm, 'parse_dodo', lambda path, **kw:
+                        read.append(path) or parse_dodo(path, **kw))
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        full = ghm.gh_tasks_t(**kw).splitlines()
+        del read[:]
+        kw['limit'] = '3'
+        result = ghm.gh_tasks_t(**kw).splitlines()                    # payload
+        assert result[:3] == full[:3]
+        assert sum(int(_.split()[-1]) for _ in result[:3]) == \
+            int(result[3].split()[-1])
+        assert len(read) == 3
+
+        kw.update(projects=True, tasks=False, count=False)
+        projects = ghm.gh_projects_t(**kw).splitlines()
+        assert [_.split()[0] for _ in projects] == \
+            [_.split()[0] for _ in full[:3]]
+
+
+# -----------------------------------------------------------------------------
+def test_timings(tmpdir, capsys):
+    """
+    gh tasks --timings reports each phase and the counts on stderr without
+    changing the report on stdout
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 4, 5)
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': False, 'tasks': True, 'version': False,
+          'no_cache': True, 'rescan': True}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        plain = ghm.gh_tasks_t(**kw) + "\n"
+        kw['timings'] = True
+        ghm.COMMANDS['tasks'](**kw)                                   # payload
+    (out, err) = capsys.readouterr()
+    assert out == plain
+    assert ghm.TIMINGS is None
+    lines = err.splitlines()
+    assert lines[0] == "gh timings:"
+    report = {_[:27].strip(): _[27:].split() for _ in lines[1:]}
+    for phase in ['walk', 'stat DODO', 'sort', 'parse DODO']:
+        assert phase in report
+    assert report['parse DODO'][0] == '4'
+    assert report['dirs visited'] == ['9']
+    tasks = sum(len(ghm.parse_dodo(_.strpath)) for _ in tmpdir.visit("DODO"))
+    assert report['tasks emitted'] == [str(tasks)]
+    lines = sum(len(_.readlines()) for _ in tmpdir.visit("DODO"))
+    assert report['lines classified'] == [str(lines)]
+    size = sum(_.size() for _ in tmpdir.visit("DODO"))
+    assert report['dodo bytes read'] == [str(size)]
+
+
+# -----------------------------------------------------------------------------
+def test_profile(tmpdir, capsys):
+    """
+    gh projects --profile FILE writes statistics pstats can read, and
+    nothing is timed when --timings is not given
+    """
+    import pstats
+    pytest.dbgfunc()
+    project_tree(tmpdir, 3, 2)
+    prof = tmpdir.join("gh.prof")
+    kw = {'d': False, 's': 'new', 'projects': True, 'tasks': False,
+          'version': False, 'count': False, 'rescan': False,
+          'profile': prof.strpath}
+    with tbx.envset(GH_ROOT=tmpdir.strpath):
+        ghm.COMMANDS['projects'](**kw)                                # payload
+    (_, err) = capsys.readouterr()
+    assert err == ""
+    assert ghm.TIMINGS is None
+    stats = pstats.Stats(prof.strpath)
+    assert any(func == 'sort_projects' for (_, _, func) in stats.stats)
+
+
+# -----------------------------------------------------------------------------
+def test_make_tree(tmpdir, monkeypatch):
+    """
+    The benchmark tree generator builds the projects asked for, and gh finds
+    them, not the decoys in omitted directories or the symlinked aliases
+    """
+    from benchmarks import treegen
+    pytest.dbgfunc()
+    root = tmpdir.join("tree").strpath
+    tree = treegen.make_tree(root, projects=12, depth=2, fanout=3, lines=20,
+                             symlinks=3, omitted=6, nododo=2)     # payload
+    monkeypatch.setattr(ghm, 'TIMINGS', ghm.Timings())
+    result = ghm.projects(root, sort='alpha')
+    counts = ghm.TIMINGS.counts
+    monkeypatch.undo()
+    assert len(result) == 12
+    assert [_[1] for _ in result].count('(no DODO)') == 2
+    assert all("decoy" not in _[0] and "links" not in _[0] for _ in result)
+    # gh reads neither the omitted directories nor the decoys in them
+    assert counts['dirs_visited'] == tree['dirs'] - 2 * 6
+    size = sum(osp.getsize(osp.join(_[0], "DODO")) for _ in result
+               if not _[1])
+    assert tree['dodo_bytes'] == size
+    assert all(len(_.readlines()) == 20 for _ in tmpdir.visit("DODO"))
+
+    closed = tmpdir.join("closed").strpath
+    treegen.make_tree(closed, projects=4, markers="+:1,x:1")
+    assert not any(ghm.get_tasks(_[0]) for _ in ghm.projects(closed))
+    with pytest.raises(ValueError):
+        treegen.make_tree(closed, markers="?:1")
+
+
+# -----------------------------------------------------------------------------
+def test_bench_compare(tmpdir):
+    """
+    A benchmark run reports a time for each benchmark, and comparing two
+    runs flags only the benchmarks slower than the threshold allows
+    """
+    import benchmarks.__main__ as bench
+    from benchmarks import treegen
+    pytest.dbgfunc()
+    root = tmpdir.join("tree").strpath
+    tree = treegen.make_tree(root, projects=5, fanout=2, symlinks=1)
+    with tbx.envset(GH_ROOT=None):
+        base = bench.run_benchmarks(root, tree, 2, 1,
+                                    tmpdir.join("cache").strpath)
+        assert os.getenv('GH_ROOT') is None
+    names = list(base['results'])
+    assert names[:2] == ['projects (walk)', 'projects (index)']
+    assert {'sort alpha', 'sort new', 'sort old', 'get_tasks',
+            'gh_projects_t', 'gh_tasks_t'} <= set(names)
+    assert all(len(_['runs']) == 2 for _ in base['results'].values())
+    assert base['tree'] == tree
+    json.loads(json.dumps(base))
+
+    new = json.loads(json.dumps(base))
+    new['results']['get_tasks']['min'] *= 1.2
+    new['results']['sort new']['min'] *= 1.05
+    rows = bench.compare(base, new, 10)                               # payload
+    assert [_[0] for _ in rows if _[-1]] == ['get_tasks']
+    assert [_[0] for _ in bench.compare(base, new, 25) if _[-1]] == []
+
+
+# -----------------------------------------------------------------------------
+def test_multi_root(tmpdir):
+    """
+    With several roots in $GH_ROOT (or given with --root), gh projects and gh
+    tasks report the projects under all of them, sorted together
+    """
+    pytest.dbgfunc()
+    roots = [tmpdir.join(_) for _ in ("ssd", "nfs", "scratch")]
+    for (idx, root) in enumerate(roots):
+        project_tree(root, 3 + idx, 10)
+    for (idx, dodo) in enumerate(sorted(tmpdir.visit("DODO"))):
+        age = 100 * ((idx * 7) % 12)
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10 - age))
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': None,
+          'projects': True, 'tasks': False, 'version': False}
+    with tbx.envset(GH_ROOT=None):
+        single = {}
+        for root in roots:
+            single[root] = ghm.projects(root.strpath, sort='new')
+    merged = [_ for root in roots for _ in single[root]]
+    path = os.pathsep.join(_.strpath for _ in roots)
+    for sort in ['alpha', 'new', 'old']:
+        kw['s'] = sort
+        with tbx.envset(GH_ROOT=path):
+            result = ghm.gh_projects_t(**kw)                          # payload
+        exp = ghm.projects(tmpdir.strpath, sort=sort)
+        assert [_.split()[0] for _ in result.splitlines()] == \
+            [_[0] for _ in exp]
+        assert sorted(_[0] for _ in exp) == sorted(_[0] for _ in merged)
+
+    kw.update(s=None, root=[_.strpath for _ in roots[1:]])
+    with tbx.envset(GH_ROOT=roots[0].strpath):
+        result = ghm.gh_projects_t(**kw)
+    assert sorted(_.split()[0] for _ in result.splitlines()) == \
+        sorted(_[0] for root in roots[1:] for _ in single[root])
+
+    kw.update(s='old', projects=False, tasks=True, count=True,
+              no_cache=True, root=None, limit='4')
+    with tbx.envset(GH_ROOT=path):
+        result = ghm.gh_tasks_t(**kw).splitlines()
+    oldest = ghm.projects(tmpdir.strpath, sort='old')[:4]
+    assert [_.split()[0] for _ in result[:-1]] == [_[0] for _ in oldest]
+
+
+# -----------------------------------------------------------------------------
+def test_multi_root_streaming(tmpdir, monkeypatch):
+    """
+    Without a sort, the projects under a fast root are reported while a slow
+    root is still being walked
+    """
+    import threading
+    pytest.dbgfunc()
+    (fast, slow) = (tmpdir.join("fast"), tmpdir.join("slow"))
+    project_tree(fast, 2, 5)
+    project_tree(slow, 2, 5)
+    release = threading.Event()
+    discover = ghm.discover
+
+    def slow_discover(root, **kw):
+        if root == slow.strpath:
+            assert release.wait(10)
+        return discover(root, **kw)
+
+    monkeypatch.setattr(ghm, 'discover', slow_discover)
+    kw = {'PROJECT': None, 'count': True, 'd': False, 's': None,
+          'projects': False, 'tasks': True, 'version': False,
+          'root': [slow.strpath, fast.strpath]}
+    lines = ghm.gh_tasks_g(**kw)
+    first = next(lines)                                               # payload
+    assert fast.strpath in first
+    release.set()
+    rest = "".join(lines)
+    assert rest.count(slow.strpath) == 2
+    assert rest.count(fast.strpath) == 1
+    assert rest.splitlines()[-1].split()[0] == "Total"
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("path, name, exp", [
+    pytest.param("", "build", True, id="name at top"),
+    pytest.param("x/y", "build", True, id="name below"),
+    pytest.param("", "top", True, id="anchored at top"),
+    pytest.param("q", "top", False, id="anchored below"),
+    pytest.param("a", "deep", True, id="** none"),
+    pytest.param("a/b/c", "deep", True, id="** several"),
+    pytest.param("b", "deep", False, id="** elsewhere"),
+    pytest.param("z", "f.tmp", True, id="glob"),
+    pytest.param("z", "keep.tmp", False, id="negated"),
+    pytest.param("docs/x", "gen", True, id="anchored glob"),
+    pytest.param("docs", "gen", False, id="anchored glob too short"),
+    pytest.param("", "ayz", True, id="set and ?"),
+    pytest.param("", "xyz", False, id="negated set"),
+    pytest.param("", "#hash", True, id="escaped #"),
+    pytest.param("", "my_venv", True, id="OMITS"),
+    pytest.param("p", "_site", True, id="omit_list"),
+    pytest.param("p", "other", False, id="other"),
+])
+def test_ignore(tmpdir, path, name, exp):
+    """
+    The patterns in .ghignore, OMITS and omit_list() decide which directories
+    are not searched
+    """
+    pytest.dbgfunc()
+    tmpdir.join(".ghignore").write("\n".join([
+        "# a comment", "", "build/", "/top", "a/**/deep", "*.tmp",
+        "!keep.tmp", "docs/*/gen", "[!x]y?", "\\#hash"]))
+    ignore = ghm.ignore_for(tmpdir.strpath)
+    subdirs = [name, "kept"]
+    ignore.prune(osp.join(tmpdir.strpath, path) if path else tmpdir.strpath,
+                 subdirs)                                         # payload
+    assert subdirs == (["kept"] if exp else [name, "kept"])
+
+
+# -----------------------------------------------------------------------------
+def test_ghignore_projects(tmpdir):
+    """
+    gh projects leaves out the directories .ghignore names, and walks the
+    whole tree again once .ghignore changes
+    """
+    pytest.dbgfunc()
+    for name in ["keep/one", "scratch/two", "old/three", "_site"]:
+        tmpdir.join(name, ".project").ensure()
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': True, 'tasks': False, 'version': False}
+
+    def listed():
+        with tbx.envset(GH_ROOT=tmpdir.strpath):
+            return [osp.relpath(_.split()[0], tmpdir.strpath)
+                    for _ in ghm.gh_projects_t(**kw).splitlines()]
+
+    assert listed() == ["keep/one", "old/three", "scratch/two"]
+    tmpdir.join(".ghignore").write("scratch\n/old\n")
+    assert listed() == ["keep/one"]                                   # payload
+    tmpdir.join(".ghignore").write("scratch\n")
+    assert listed() == ["keep/one", "old/three"]
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("sep", ["", "/"])
+def test_ghignore_root_slash(tmpdir, sep):
+    """
+    Anchored .ghignore patterns match the same directories whether or not
+    the root is given with a trailing slash
+    """
+    pytest.dbgfunc()
+    for name in ["work", "work/sub", "work/other"]:
+        tmpdir.join(name, ".project").ensure()
+    tmpdir.join(".ghignore").write("/work/sub\n")
+    kw = {'PROJECT': None, 'count': False, 'd': False, 's': 'alpha',
+          'projects': True, 'tasks': False, 'version': False}
+    with tbx.envset(GH_ROOT=tmpdir.strpath + sep):
+        result = ghm.gh_projects_t(**kw)                              # payload
+    assert [_.split()[0] for _ in result.splitlines()] == \
+        [tmpdir.join(_).strpath for _ in ["work", "work/other"]]
+    ignore = ghm.ignore_for(tmpdir.strpath + sep)
+    subdirs = ["sub", "other"]
+    ignore.prune(tmpdir.join("work").strpath, subdirs)
+    assert subdirs == ["other"]
+
+
+# -----------------------------------------------------------------------------
+def test_grep(tmpdir, monkeypatch):
+    """
+    gh grep shows the tasks holding every term (whole words, or prefixes
+    with '*'), and reindexes only the DODO files that changed
+    """
+    pytest.dbgfunc()
+    dodos = {"alpha": " - fix the cache invalidation\n"
+                      "   when the index moves\n"
+                      " . write the README\n"
+                      " + closed cache task\n",
+             "beta": " > Cache warming for serve\n"
+                     " ^ invalid input crashes the parser\n",
+             "gamma": " - nothing to see here\n",
+             "adone": " + all done\n",
+             "zdone": " + all done\n"}
+    for (name, text) in dodos.items():
+        tmpdir.join(name, ".project").ensure()
+        dodo = tmpdir.join(name, "DODO")
+        dodo.write(text)
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    kw = {'d': False, 'rescan': False, 'root': [tmpdir.strpath]}
+    read = []
+    parse_dodo = ghm.parse_dodo
+    monkeypatch.setattr(ghm, 'parse_dodo', lambda path, **kw:
+                        read.append(path) or parse_dodo(path, **kw))
+
+    def grep(*terms, **opts):
+        rows = ghm.grep_rows_g(dict(kw, TERM=list(terms), **opts))
+        return [(osp.basename(path), [_.split()[-1] for _ in tasks])
+                for (path, _, _, tasks) in rows]
+
+    assert grep("cache") == [("alpha", ["moves"]),
+                             ("beta", ["serve"])]                     # payload
+    assert len(read) == 5
+    assert grep("nothing") == [("gamma", ["here"])]
+    assert grep("done") == []
+    assert grep("cache", "index") == [("alpha", ["moves"])]
+    assert grep("inval*") == [("alpha", ["moves"]), ("beta", ["parser"])]
+    assert grep("closed") == []
+    assert grep("cache", "readme") == []
+    assert grep("input-crashes") == [("beta", ["parser"])]
+    assert len(read) == 5
+
+    dodo = tmpdir.join("gamma", "DODO")
+    dodo.write(" - cache the rest\n")
+    os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    tmpdir.join("beta", "DODO").remove()
+    assert grep("cache") == [("alpha", ["moves"]), ("gamma", ["rest"])]
+    assert read[5:] == [tmpdir.join("gamma", "DODO").strpath]
+    assert grep("crashes") == []
+    assert grep("cache", rescan=True) == \
+        [("alpha", ["moves"]), ("gamma", ["rest"])]
+
+    result = ghm.gh_grep_t(**dict(kw, TERM=["serve*"], format='ndjson'))
+    assert result == ""
+    result = ghm.gh_grep_t(**dict(kw, TERM=["README"]))
+    assert result == "----------- {} ------------\n" \
+        " . write the README\n\n".format(tmpdir.join("alpha").strpath)
+
+
+# -----------------------------------------------------------------------------
+@pytest.mark.bench
+def test_bench_grep(tmpdir):
+    """
+    Once the index is built, loading it and searching some 17000 tasks for
+    two words takes a few milliseconds
+    """
+    from benchmarks import treegen
+    pytest.dbgfunc()
+    root = tmpdir.join("tree").strpath
+    treegen.make_tree(root, projects=2000, lines=30)
+    index = ghm.GrepIndex(root)
+    index.update(ghm.discover(root), ghm.TaskCache())
+    index.save()
+    elapsed = []
+    for _ in range(20):
+        start = time.perf_counter()
+        index = ghm.GrepIndex(root)
+        hits = index.search(["task", "29"])                           # payload
+        elapsed.append(time.perf_counter() - start)
+    assert hits
+    print("\n{} tasks: search {:.2f}ms (median)"
+          "".format(index.next_id, 1000 * sorted(elapsed)[10]))
+    assert sorted(elapsed)[10] < 0.050
+
+
+# -----------------------------------------------------------------------------
+def test_status(tmpdir, monkeypatch):
+    """
+    gh status reports each repository's changes, ahead/behind and stashes,
+    and does not run git again in a clean repository that has not changed,
+    but does once a file appears in a directory with no tracked files or
+    info/exclude changes
+    """
+    import shutil
+    import subprocess
+    pytest.dbgfunc()
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+
+    def git(path, *args):
+        subprocess.run(["git", "-c", "user.name=gh", "-c", "user.email=gh@x",
+                        "-c", "init.defaultBranch=main"] + list(args),
+                       cwd=path.strpath, check=True, capture_output=True)
+
+    for name in ["clean", "dirty", "untracked", "data", "excluded"]:
+        repo = tmpdir.join(name)
+        repo.join("src", "mod.py").ensure()
+        repo.join(".project").ensure()
+        git(repo, "init", "-q")
+        git(repo, "add", "-A")
+        git(repo, "commit", "-qm", "start")
+    tmpdir.join("data", ".git", "info", "exclude").write("data/*.csv\n")
+    tmpdir.join("data", "data", "table.csv").ensure()
+    tmpdir.join("data", "empty").ensure(dir=True)
+    tmpdir.join("excluded", ".git", "info", "exclude").write("scratch\n")
+    tmpdir.join("excluded", "scratch").ensure()
+    git(tmpdir, "clone", "-q", "clean", "ahead")
+    tmpdir.join("ahead", ".project").ensure()
+    tmpdir.join("ahead", "new").write("new\n")
+    git(tmpdir.join("ahead"), "add", "new")
+    git(tmpdir.join("ahead"), "commit", "-qm", "more")
+    tmpdir.join("ahead", "new").write("stash me\n")
+    git(tmpdir.join("ahead"), "stash", "-q")
+    tmpdir.join("dirty", "src", "mod.py").write("changed\n")
+    tmpdir.join("untracked", "src", "other.py").ensure()
+    tmpdir.join("plain", ".project").ensure()
+    # Backdate the work trees so the fast path can trust them, and let git
+    # refresh the indexes to match
+    for path in tmpdir.visit(lambda _: ".git" not in _.strpath):
+        os.utime(path.strpath, (path.atime(), path.mtime() - 10))
+    for name in ["clean", "dirty", "untracked", "ahead", "data", "excluded"]:
+        git(tmpdir.join(name), "status")
+
+    kw = {'d': False, 'root': [tmpdir.strpath]}
+    calls = []
+    git_status = ghm.git_status
+
+    def counted(path, gitdir):
+        calls.append(path)
+        return git_status(path, gitdir)
+
+    monkeypatch.setattr(ghm, 'git_status', counted)
+
+    def status():
+        return {osp.basename(_['path']): (_['branch'], _['changed'],
+                                          _['ahead'], _['behind'],
+                                          _['stash'])
+                for _ in ghm.status_rows_g(kw)}
+
+    exp = {'clean': ('main', 0, 0, 0, 0), 'dirty': ('main', 1, 0, 0, 0),
+           'untracked': ('main', 1, 0, 0, 0), 'ahead': ('main', 0, 1, 0, 1),
+           'data': ('main', 0, 0, 0, 0), 'excluded': ('main', 0, 0, 0, 0)}
+    assert status() == exp                                            # payload
+    assert len(calls) == 6
+    del calls[:]
+    assert status() == exp
+    assert sorted(osp.basename(_) for _ in calls) == ['dirty', 'untracked']
+
+    del calls[:]
+    tmpdir.join("clean", "src", "mod.py").write("edited\n")
+    tmpdir.join("data", "data", "notes.txt").write("note\n")
+    tmpdir.join("data", "empty", "new.txt").write("new\n")
+    tmpdir.join("excluded", ".git", "info", "exclude").write("")
+    exp['clean'] = ('main', 1, 0, 0, 0)
+    exp['data'] = ('main', 2, 0, 0, 0)
+    exp['excluded'] = ('main', 1, 0, 0, 0)
+    assert status() == exp
+    assert len(calls) == 5
+
+    result = ghm.gh_status_t(**kw).splitlines()
+    assert "   {:45s}   [main] ahead 1, 1 stashed".format(
+        tmpdir.join("ahead").strpath) in result
+
+
+# -----------------------------------------------------------------------------
+def test_status_untracked_dirs(tmpdir, monkeypatch):
+    """
+    index_unchanged() trusts a clean repository with a few directories of
+    untracked (here, ignored) files, but leaves one with more than
+    STATUS_UNTRACKED_DIRS of them to git
+    """
+    import shutil
+    import subprocess
+    pytest.dbgfunc()
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+    repo = tmpdir.join("repo")
+    repo.join("src", "mod.py").ensure()
+    repo.join(".gitignore").write("node_modules/\n")
+    for name in "abcde":
+        repo.join("node_modules", name, "index.js").ensure()
+    for args in [["init", "-q"], ["add", "-A"], ["commit", "-qm", "start"]]:
+        subprocess.run(["git", "-c", "user.name=gh", "-c", "user.email=gh@x"]
+                       + args, cwd=repo.strpath, check=True,
+                       capture_output=True)
+
+    def outside(path):
+        return path.basename != ".git"
+
+    for path in [repo] + list(repo.visit(outside, outside)):
+        os.utime(path.strpath, (path.atime(), path.mtime() - 10))
+    subprocess.run(["git", "status"], cwd=repo.strpath, check=True,
+                   capture_output=True)
+    gitdir = repo.join(".git").strpath
+    checked = time.time_ns()
+    assert ghm.index_unchanged(repo.strpath, gitdir, checked)     # payload
+    monkeypatch.setattr(ghm, "STATUS_UNTRACKED_DIRS", 3)
+    assert not ghm.index_unchanged(repo.strpath, gitdir, checked)
+
+
+# -----------------------------------------------------------------------------
+def test_snapshot(tmpdir, monkeypatch):
+    """
+    gh snapshot records only the counts that changed, reading only the DODO
+    files that changed, and gh history shows the trend
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 3, 20)
+    for dodo in tmpdir.visit("DODO"):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    tmpdir.join("group9", "empty", ".project").ensure()
+    kw = {'d': False, 'root': [tmpdir.strpath], 'PROJECT': None}
+    read = []
+    parse_dodo = ghm.parse_dodo
+    monkeypatch.setattr(ghm, 'parse_dodo', lambda path, **kw:
+                        read.append(path) or parse_dodo(path, **kw))
+    counts = {prj.path: len(ghm.get_tasks(prj.path))
+              for prj in ghm.discover(tmpdir.strpath)}
+    del read[:]
+    total = sum(counts.values())
+    assert ghm.gh_snapshot_t(**kw) == \
+        "snapshot 1: 4 projects, {} tasks, 4 counts changed".format(total)
+    assert len(read) == 3
+    assert ghm.gh_snapshot_t(**kw) == \
+        "snapshot 2: 4 projects, {} tasks, 0 counts changed".format(total)
+    assert len(read) == 3                                             # payload
+
+    proj1 = tmpdir.join("group1", "proj0001")
+    dodo = proj1.join("DODO")
+    dodo.write(dodo.read() + " - one more\n")
+    os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    tmpdir.join("group2").remove()
+    later = total + 1 - counts[tmpdir.join("group2", "proj0002").strpath]
+    assert ghm.gh_snapshot_t(**kw) == \
+        "snapshot 3: 3 projects, {} tasks, 2 counts changed".format(later)
+    assert read[3:] == [dodo.strpath]
+
+    result = ghm.gh_history_t(**dict(kw, format='ndjson'))
+    assert [json.loads(_)['total'] for _ in result.splitlines()] == \
+        [total, later]
+    result = ghm.gh_history_t(**dict(kw, PROJECT="proj0001"))
+    lines = result.splitlines()
+    assert lines[0] == "----------- {} ------------".format(proj1.strpath)
+    assert [int(_.split()[-1]) for _ in lines[1:]] == \
+        [counts[proj1.strpath], counts[proj1.strpath] + 1]
+    result = ghm.gh_history_t(**dict(kw, PROJECT="proj0002"))
+    assert result.splitlines()[-1].split()[-1] == "-"
+
+
+# -----------------------------------------------------------------------------
+def test_query(tmpdir, monkeypatch):
+    """
+    gh query answers from the catalog as gh projects and gh tasks would,
+    reading only the DODO files that changed since the last query
+    """
+    pytest.dbgfunc()
+    project_tree(tmpdir, 12, 30)
+    for idx, dodo in enumerate(sorted(tmpdir.visit("DODO"))):
+        os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10 - 60 * idx))
+    bare = tmpdir.join("group3", "bare")
+    bare.join(".project").ensure()
+    kw = {'d': False, 'root': [tmpdir.strpath], 'PROJECT': None,
+          'count': False, 's': None}
+    read = []
+    parse_dodo = ghm.parse_dodo
+
+    def reading(path, **opts):
+        read.append(path)
+        return parse_dodo(path, **opts)
+
+    monkeypatch.setattr(ghm, 'parse_dodo', reading)
+    for sort in ['old', 'new', 'alpha']:
+        assert ghm.gh_query_t(**dict(kw, s=sort)) == \
+            ghm.gh_projects_t(**dict(kw, s=sort))
+    assert len(read) == 12
+    assert ghm.gh_query_t(**dict(kw, no_dodo=True)) == \
+        "    {} (no DODO)\n".format(bare.strpath)
+    assert ghm.gh_query_t(**dict(kw, s='old', limit='2', count=True)) == \
+        "2 projects found\n"
+
+    proj3 = tmpdir.join("group3", "proj0003")
+    tasks = [_ for _ in ghm.get_tasks(proj3.strpath)
+             if ghm.task_marker(_) in ">^"]
+    del read[:]
+    mkw = dict(kw, marker="^>", PROJECT="proj0003")
+    assert ghm.gh_query_t(**mkw) == \
+        "".join(ghm.show_tasks_g(proj3.strpath, tasks))           # payload
+    assert ghm.gh_query_t(**dict(mkw, PROJECT="proj0003", exact=True,
+                                 count=True)).splitlines()[-1].split() == \
+        ["Total", str(len(tasks))]
+    assert json.loads(ghm.gh_query_t(**dict(
+        mkw, exact=True, count=True, format='json')))[0]['markers'] == \
+        ghm.marker_counts(tasks)
+    assert read == []
+
+    dodo = proj3.join("DODO")
+    dodo.write(dodo.read() + " > one more\n")
+    os.utime(dodo.strpath, (dodo.atime(), dodo.mtime() - 10))
+    tmpdir.join("group2").remove()
+    records = [json.loads(_) for _ in ghm.gh_query_t(
+        **dict(kw, marker=">", format='ndjson')).splitlines()]
+    assert read == [dodo.strpath]
+    assert [_ for _ in records if _['path'] == proj3.strpath][-1] == \
+        {'path': proj3.strpath, 'dodo': dodo.strpath,
+         'mtime': dodo.mtime(), 'marker': ">", 'text': "one more"}
+    assert not any("group2" in _['path'] for _ in records)
+
+    with pytest.raises(SystemExit):
+        ghm.gh_query_t(**dict(kw, marker="+"))
+
+
+# -----------------------------------------------------------------------------
+def test_parse_dodo_numbered(tmpdir):
+    """
+    parse_dodo(numbered=True) gives the line where each task starts
+    """
+    pytest.dbgfunc()
+    dodo = tmpdir.join("DODO")
+    dodo.write(" - one\n   more\n\n > two\n + done\n   gone\n ^ three\n")
+    assert ghm.parse_dodo(dodo.strpath, numbered=True) == \
+        [(1, " - one\n   more\n"), (4, " > two\n"), (7, " ^ three\n")]
+
+
+# -----------------------------------------------------------------------------
+def test_no_sort(prjdirs, engine):
     """
     What we get if we don't sort a list of projects
     """
     pytest.dbgfunc()
-    tup_l = ghm.projects(prjdirs['root'].strpath, False)              # payload
+    tup_l = engine.projects(prjdirs['root'].strpath, False)           # payload
     result = [_[0] for _ in tup_l]
     assert set(result) == set([_.strpath for _ in prjdirs['input']])
 
 
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("argv, exp", [
+    pytest.param("projects", {'--jobs': '1'}, id="projects: defaults"),
+    pytest.param("tasks --jobs 4 --rescan gh",
+                 {'--jobs': '4', '--rescan': True, 'PROJECT': 'gh'},
+                 id="tasks: options"),
+    pytest.param("tasks --watch --count --poll --interval 5",
+                 {'--watch': True, '--poll': True, '--interval': '5',
+                  'PROJECT': None},
+                 id="tasks: watch"),
+    pytest.param("grep --root /a cache inval*",
+                 {'--root': ['/a'], 'TERM': ['cache', 'inval*']},
+                 id="grep"),
+    pytest.param("status --git-jobs 4", {'--git-jobs': '4', '--jobs': '1'},
+                 id="status"),
+    pytest.param("history --exact gh",
+                 {'PROJECT': 'gh', '--exact': True, 'history': True},
+                 id="history"),
+    pytest.param("query --no-dodo --marker >^ -s old gh",
+                 {'--no-dodo': True, '--marker': '>^', '-s': 'old',
+                  'PROJECT': 'gh'},
+                 id="query"),
+    pytest.param("projects -s new --root /a --root /b",
+                 {'--root': ['/a', '/b'], '-s': 'new'},
+                 id="projects: roots"),
+])
+def test_usage(argv, exp):
+    """
+    The usage message parses and produces the options the handlers expect
+    """
+    pytest.dbgfunc()
+    docopt = pytest.importorskip("docopt")
+    result = docopt.docopt(ghm.__doc__, argv.split())                 # payload
+    for key in exp:
+        assert result[key] == exp[key]
+
+
 # -----------------------------------------------------------------------------
 def test_version():
     """
@@ -239,6 +1825,34 @@ def test_version():
     assert result == "gh {}".format(version._v)
 
 
+# -----------------------------------------------------------------------------
+def test_startup_imports(tmpdir):
+    """
+    'gh version' does not import the command line parser, the debugger or
+    any of the modules only the other subcommands need
+    """
+    pytest.dbgfunc()
+    (out, baseline) = importtime(tmpdir, "pass")
+    (out, result) = importtime(tmpdir, VERSION_CMD)                  # payload
+    assert out == "gh {}\n".format(version._v)
+    lazy = {'pdb', 'docopt', 'docopt_dispatch', 'glob', 're', 'pickle',
+            'hashlib', 'threading', 'concurrent.futures'}
+    assert lazy.intersection(set(result) - set(baseline)) == set()
+
+
+# -----------------------------------------------------------------------------
+def test_startup_time(tmpdir):
+    """
+    Importing gh for 'gh version' stays under STARTUP_LIMIT microseconds
+    (measured with -X importtime, once the bytecode is cached)
+    """
+    pytest.dbgfunc()
+    importtime(tmpdir, VERSION_CMD)
+    best = min(importtime(tmpdir, VERSION_CMD)[1]['gh.__main__']
+               for _ in range(3))                                     # payload
+    assert best < STARTUP_LIMIT
+
+
 # -----------------------------------------------------------------------------
 def test_deploy():
     """
@@ -264,120 +1878,108 @@ def test_deploy():
 
 
 # -----------------------------------------------------------------------------
-@pytest.fixture
-def tasks(tmpdir):
-    """
-    Set up a project with some tasks that we can test displaying
-    """
-    task_l = [
-        "",
-        " ^ this is the first task (released)",
-        "   and it has a second line",
-        " > this is the second task (committed)",
-        " . this is the third task (changed, not yet committed)",
-        " - this is the fourth task (not yet made)",
-        "   and this one has a second line also",
-        " + fifth task -- completed",
-        " < sixth task -- moved elsewhere",
-        " x seventh task -- abandoned",
-        "",
-    ]
-    # project dir
-    prjdir = tmpdir.join("myproj")
-
-    # .project file
-    prjdir.join(".project").ensure()
-
-    # DODO file with content
-    dodo = prjdir.join("DODO")
-    dodo.write("\n".join(task_l) + "\n")
-
-    data = {
-        'tmpdir': tmpdir,
-        'prj': prjdir,
-        'dodo': dodo,
-    }
-    return data
+STARTUP_LIMIT = 15000
+VERSION_CMD = ("import sys; sys.argv[1:] = ['version']; "
+               "from gh.__main__ import main; main()")
 
 
 # -----------------------------------------------------------------------------
-@pytest.fixture
-def tasks_empty(tmpdir):
+def importtime(tmpdir, code):
+    """
+    Run python *code* with -X importtime (caching bytecode under *tmpdir*) and
+    return its stdout and a dict mapping the modules it imported to their
+    cumulative import times in microseconds
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    cmd = [sys.executable, "-X", "importtime",
+           "-X", "pycache_prefix={}".format(tmpdir.join("pycache")),
+           "-c", code]
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.dirname(__file__)))
+    rval = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            (_, cumulative, name) = line.split("|")
+            rval[name.strip()] = int(cumulative)
+    return (result.stdout, rval)
+
+
+# -----------------------------------------------------------------------------
+def synthetic_dodo(dodo, nlines, seed=0):
     """
-    Set up a project with some tasks that we can test displaying
+    Write *nlines* lines to py.path *dodo*, drawn from a mix of task markers,
+    continuation lines and lines to be thrown away, and return *dodo*
     """
-    # project dir
-    prjdir = tmpdir.join("myproj")
+    rng = random.Random(seed)
+    lines = [" - task not yet started\n", " . task changed\n",
+             " > task committed\n", " ^ task released\n",
+             " + task done\n", " < task moved\n", " x task abandoned\n",
+             "   continuation of the task above\n", "\n", "   \n",
+             "# a comment\n", "-------- separator\n", "-- DONE ------\n",
+             "- == DONE ==\n", "=== DONE ===\n", "\t- tab marker\n",
+             " -\n", "unmarked text\n", " \u00a0\n", "---- not DONE\n"]
+    weights = [6, 3, 3, 2, 3, 1, 1, 30, 8, 2, 2, 1, 1, 1, 1, 1, 1, 4, 1, 1]
+    dodo.ensure()
+    dodo.write("".join(rng.choices(lines, weights, k=nlines)))
+    return dodo
 
-    # .project file
-    prjdir.join(".project").ensure()
 
-    # this project doesn't have a DODO file
-    data = {
-        'tmpdir': tmpdir,
-        'prj': prjdir,
-        'dodo': None,
-    }
-    return data
+# -----------------------------------------------------------------------------
+def serving(root, **kw):
+    """
+    Start a TaskServer for *root* (with options *kw*) answering queries in a
+    thread, and return it
+    """
+    import threading
+    server = ghm.TaskServer(root, **kw)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
 
 # -----------------------------------------------------------------------------
-@pytest.fixture
-def prjdirs(tmpdir):
-    """
-    Set up some project directories for testing
-    """
-    pdata = {
-        'apple': {'dtime': 1500},
-        'zagnut': {'dtime': 1400},
-        'frump': {'dtime': 1300},
-        'nododo': {'dtime': -1},
-        'gh': {'dtime': 1200},
-        'tbx': {'dtime': 1000},
-    }
-    for prj in pdata:
-        pd = tmpdir.join(prj)
-        pd.ensure(dir=True)
-        dot = pd.join('.project')
-        dot.ensure()
-        if prj != 'nododo':
-            dodo = pd.join('DODO')
-            dodo.ensure()
-            os.utime(dodo.strpath, (dodo.atime(),
-                                    dodo.mtime() - pdata[prj]['dtime']))
-        pdata[prj]['dir'] = pd
-        pdata[prj]['dot'] = dot
-        pdata[prj]['dodo'] = dodo
-
-    pfruit = {}
-    pfruit['raw'] = pdata
-    pfruit['root'] = tmpdir
-    pfruit['input'] = [pdata[_]['dir'] for _ in pdata]
-    pfruit['asort'] = [pdata[_]['dir']
-                       for _ in ['apple',
-                                 'frump',
-                                 'gh',
-                                 'nododo',
-                                 'tbx',
-                                 'zagnut',
-                                 ]]
-    pfruit['nsort'] = [pdata[_]['dir']
-                       for _ in ['tbx',
-                                 'gh',
-                                 'frump',
-                                 'zagnut',
-                                 'apple',
-                                 'nododo',
-                                 ]]
-    pfruit['osort'] = [pdata[_]['dir']
-                       for _ in ['nododo',
-                                 'apple',
-                                 'zagnut',
-                                 'frump',
-                                 'gh',
-                                 'tbx',
-                                 ]]
-    return pfruit
+def project_tree(root, nproj, nlines):
+    """
+    Create *nproj* projects under py.path *root*, spread over a few group
+    directories, each with a synthetic DODO file of *nlines* lines
+    """
+    for idx in range(nproj):
+        prj = root.join("group{}".format(idx % 10), "proj{:04d}".format(idx))
+        prj.join(".project").ensure()
+        synthetic_dodo(prj.join("DODO"), nlines, seed=idx)
+
+
+# -----------------------------------------------------------------------------
+def legacy_get_tasks(dofile):
+    """
+    The original get_tasks() parser (research() + is_throw_away() on every
+    line), kept as a reference for its replacement
+    """
+    def throw_away(line):
+        return any([line.startswith("--------"),
+                    line.strip() == "",
+                    line.startswith("#"),
+                    re.search(r"^ *-+\s+DONE", line),
+                    re.search(r"^-\s+=+\s+DONE", line),
+                    re.search(r"^=+\s+DONE", line),
+                    ])
+    task = ""
+    task_l = []
+    skip = True
+    with open(dofile) as rbl:
+        for line in rbl:
+            pfl = []
+            if ghm.research(r"^\s[-.>^+<x]\s", line, pfl):
+                if pfl[0] in [" - ", " . ", " > ", " ^ "]:
+                    task_l.append(task)
+                    skip = False
+                    task = line
+                elif pfl[0] in [" + ", " < ", " x "]:
+                    skip = True
+            elif not throw_away(line) and not skip:
+                task += line
+        task_l.append(task)
+    return [_ for _ in task_l if _]
 
 
 # -----------------------------------------------------------------------------